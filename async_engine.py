@@ -0,0 +1,258 @@
+import asyncio
+import functools
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Set, Tuple
+from database_handler import DatabaseHandler
+from human_response_generator import HumanResponseGenerator
+from inbox_sync import InboxSync
+from inbox_reader import InboxReader
+from poll_scheduler import AdaptivePollScheduler
+from rate_limiter import EndpointRateLimiter
+from instagram_client import ClientFactory
+from metrics import MetricsRegistry
+from background_learner import BackgroundLearner
+from message_pipeline import ReplyPlanner
+from session_store import SessionStore, live_client_checks, open_client
+
+class AsyncInstagramEngine:
+    """asyncio counterpart of InstagramMessageAPI.
+
+    Every conversation is a task rather than a thread: thinking and typing
+    pauses are asyncio.sleep, rate limiting awaits its token, and only the
+    blocking Client and SQLite calls go through a small bounded executor.
+    Messages of one thread are handled in order; different threads overlap
+    freely up to max_in_flight. After reconnect_after failed polls in a row,
+    or as many failed sends, run() connects again.
+    """
+
+    def __init__(self, client_factory: Optional[ClientFactory] = None, db_path: str = "instagram_bot.db",
+                 rate_limits: Optional[Dict[str, Tuple[float, int]]] = None, username: Optional[str] = None,
+                 password: Optional[str] = None, blocking_workers: int = 8, max_in_flight: int = 10000,
+                 reconnect_after: int = 3, session_path: Optional[str] = None):
+        if username is None or password is None:
+            from dotenv import load_dotenv
+            load_dotenv()
+        self.username = username or os.getenv('INSTAGRAM_USERNAME')
+        self.password = password or os.getenv('INSTAGRAM_PASSWORD')
+        self.client_factory = client_factory
+        self.api = None
+        if session_path is None and client_factory is None and db_path != ":memory:":
+            session_path = f"{os.path.splitext(db_path)[0]}.session.json"
+        self.session_store = SessionStore(session_path) if session_path else None
+        self.human_generator = HumanResponseGenerator()
+        self.db = DatabaseHandler(db_path=db_path, human_generator=self.human_generator)
+        self.inbox_sync = InboxSync(self.db)
+        self.rate_limiter = EndpointRateLimiter(rate_limits)
+        self.metrics = MetricsRegistry()
+        self.planner = ReplyPlanner(self.db, self.human_generator, self.metrics)
+        self.learner = BackgroundLearner(self.db, interval=3600.0, metrics=self.metrics)
+        self.inbox_reader = InboxReader(self.inbox_sync, limiter=self.rate_limiter['inbox'], metrics=self.metrics)
+        self.poll_scheduler = AdaptivePollScheduler(self.rate_limiter['inbox'], min_interval=5.0, max_interval=60.0)
+        self.executor = ThreadPoolExecutor(max_workers=blocking_workers, thread_name_prefix="async-blocking")
+        self.max_in_flight = max_in_flight
+        self._in_flight: Optional[asyncio.Semaphore] = None  # Bound to the running loop in run()
+        self._thread_tails: Dict[str, asyncio.Future] = {}  # Last queued handler per thread
+        self._tasks: Set[asyncio.Task] = set()
+        self._stop_requested: Optional[asyncio.Event] = None
+        self.reconnect_after = reconnect_after
+        self.failed_polls = 0  # In a row, since the last successful poll
+        self.failed_sends = 0  # In a row, since the last successful send
+
+    async def blocking(self, fn, *args, **kwargs):
+        """Run a blocking call on the bounded executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def connect(self):
+        """Establish connection to Instagram"""
+        try:
+            if self.client_factory is None:
+                from instagram_private_api import Client
+                factory, checks = Client, live_client_checks()
+            else:
+                factory, checks = self.client_factory, {}
+            self.api, reused, seconds = await self.blocking(
+                open_client, factory, self.username, self.password, self.session_store, **checks
+            )
+            self.inbox_sync.own_user_id = getattr(self.api, 'authenticated_user_id', None)
+            self.metrics.observe('connect', seconds)
+            self.metrics.inc('session_reuses' if reused else 'logins')
+            print(f"Successfully connected to Instagram in {seconds:.2f}s "
+                  f"({'cached session' if reused else 'full login'})")
+        except Exception as e:
+            print(f"Failed to connect to Instagram: {str(e)}")
+            raise
+
+    async def reconnect(self):
+        """Replace a client that keeps failing; a failed attempt is retried after the next poll"""
+        print("Multiple errors detected. Attempting to reconnect...")
+        self.metrics.inc('reconnects')
+        try:
+            await self.connect()
+            self.failed_polls = self.failed_sends = 0
+        except Exception as e:
+            print(f"Reconnection failed: {str(e)}")
+
+    async def poll(self) -> int:
+        """Read the inbox once and start a handler task per new message; returns how many"""
+        found = 0
+        try:
+            async for message in self.inbox_reader.iter_messages_async(self.api, self.blocking):
+                self.metrics.inc('messages_fetched')
+                self.poll_scheduler.message_seen(message['thread_id'], message['timestamp'])
+                await self._in_flight.acquire()
+                self._spawn(self._handle_in_order(message))
+                found += 1
+        except Exception as e:
+            self.metrics.inc('fetch_errors')
+            self.failed_polls += 1
+            print(f"Error fetching messages: {str(e)}")
+        else:
+            self.failed_polls = 0
+        return found
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _handle_in_order(self, message):
+        """Chain after the previous message of the same thread so replies keep their order"""
+        thread_id = message['thread_id']
+        previous = self._thread_tails.get(thread_id)
+        done = asyncio.get_running_loop().create_future()
+        self._thread_tails[thread_id] = done
+        try:
+            if previous is not None:
+                await previous
+            await self.handle(message)
+        except Exception as e:
+            print(f"Error handling message: {str(e)}")
+        finally:
+            done.set_result(None)
+            if self._thread_tails.get(thread_id) is done:
+                del self._thread_tails[thread_id]
+            self._in_flight.release()
+
+    async def handle(self, message_data: Dict[str, Any]) -> bool:
+        """Plan the reply on the executor, then send it without holding a thread"""
+        started = time.perf_counter()
+        try:
+            reply = await self.blocking(self.planner.plan, message_data)
+            self.metrics.observe('handle_message', time.perf_counter() - started)
+            self.metrics.inc('messages_handled')
+            success = await self.send(reply.thread_id, reply.text, delay=reply.think_delay)
+        except BaseException:
+            self.inbox_sync.release(message_data)
+            self.poll_scheduler.reply_abandoned(message_data['thread_id'])
+            raise
+
+        # The watermark only moves past a message once its reply is sent
+        if success:
+            self.inbox_sync.mark_handled(message_data)
+        else:
+            self.inbox_sync.release(message_data)
+        await self.blocking(self.db.update_response_stats, reply.response_id, success)
+        if success:
+            self.poll_scheduler.reply_sent(reply.thread_id)
+        else:
+            self.poll_scheduler.reply_abandoned(reply.thread_id)
+        return success
+
+    async def send(self, thread_id: str, message: str, delay: float = 0.0) -> bool:
+        """Think, type, send and stop typing, awaiting every pause and rate limit"""
+        queued_at = time.monotonic()
+        typing_duration = len(message) / random.uniform(30, 80)
+        self.metrics.observe('typing', delay + typing_duration)
+        typing = False
+        try:
+            await asyncio.sleep(delay)
+            # The typing indicator is cosmetic; failing to show it does not stop the send
+            try:
+                await self.rate_limiter.acquire_async('activity')
+                await self.blocking(self.api.direct_v2_indicate_activity, thread_id=thread_id, activity_indicator_id=1)
+                typing = True
+            except Exception as e:
+                print(f"Error starting typing indicator: {str(e)}")
+                self.metrics.inc('typing_failed')
+            await asyncio.sleep(typing_duration)
+
+            waited = time.monotonic()
+            await self.rate_limiter.acquire_async('send')
+            self.metrics.observe('send_rate_limit_wait', time.monotonic() - waited)
+            with self.metrics.time('send'):
+                await self.blocking(self.api.direct_v2_send, text=message, thread_ids=[thread_id])
+        except Exception as e:
+            print(f"Error sending message: {str(e)}")
+            self.metrics.inc('sends_failed')
+            self.failed_sends += 1
+            return False
+        finally:
+            # Typing off does not hold up the caller, but runs whether or not the send worked
+            if typing:
+                self._spawn(self._stop_typing(thread_id))
+        print(f"Message sent: {message[:30]}...")
+        self.metrics.inc('sends')
+        self.metrics.observe('reply', time.monotonic() - queued_at)
+        self.failed_sends = 0
+        return True
+
+    async def _stop_typing(self, thread_id: str):
+        await asyncio.sleep(random.uniform(0.5, 1.5))
+        try:
+            await self.rate_limiter.acquire_async('activity')
+            await self.blocking(self.api.direct_v2_indicate_activity, thread_id=thread_id, activity_indicator_id=0)
+        except Exception as e:
+            print(f"Error stopping typing indicator: {str(e)}")
+
+    def stop(self):
+        """Ask run() to return after the current poll; safe to call from the loop thread"""
+        if self._stop_requested is not None:
+            self._stop_requested.set()
+
+    async def run(self, check_interval: Optional[float] = None):
+        """Poll, hand messages to tasks and wait adaptively, until stop() is called"""
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        self._stop_requested = asyncio.Event()
+        if self.api is None:
+            await self.connect()
+        if check_interval is not None:
+            self.poll_scheduler.max_interval = max(check_interval, self.poll_scheduler.min_interval)
+        print("Starting message monitoring (asyncio)...")
+
+        while not self._stop_requested.is_set():
+            found = await self.poll()
+            delay = self.poll_scheduler.record_poll(found)
+            if max(self.failed_polls, self.failed_sends) >= self.reconnect_after:
+                await self.reconnect()
+            try:
+                await asyncio.wait_for(self._stop_requested.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def shutdown(self):
+        """Let in-flight conversations finish, then release threads and the database"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        self.learner.close()
+        self.executor.shutdown(wait=True)
+        self.db.close()
+        if self.session_store is not None and self.api is not None:
+            self.session_store.save_client(self.api)
+
+async def main():
+    engine = AsyncInstagramEngine()
+    try:
+        await engine.run()
+    finally:
+        await engine.shutdown()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nBot stopped by user")
@@ -0,0 +1,79 @@
+import time
+from threading import Event, Thread
+from typing import Optional
+
+class BackgroundLearner:
+    """Runs DatabaseHandler.learn_from_conversations on its own thread every interval seconds.
+
+    Each run only reads conversations newer than the learner's watermark, so
+    the cost follows the traffic since the last run rather than the size of
+    the table, and nothing runs on the message handling path. After learning,
+    conversations past the retention age are archived; archiving only takes
+    rows the learner has already counted.
+    """
+
+    def __init__(self, db, interval: float = 3600.0, metrics=None, start: bool = True, archive: bool = True):
+        self.db = db
+        self.interval = interval
+        self.archive = archive
+        self.metrics = metrics  # Optional MetricsRegistry
+        self._stopped = Event()
+        self._wakeup = Event()
+        self.runs = 0
+        self.failed_runs = 0
+        self.patterns_learned = 0
+        self.rows_archived = 0
+        self.last_run_seconds = 0.0
+        self._thread: Optional[Thread] = None
+        if start:
+            self._thread = Thread(target=self._run, name="background-learner", daemon=True)
+            self._thread.start()
+
+    def run_once(self) -> int:
+        """Learn from everything logged since the last run"""
+        started = time.perf_counter()
+        try:
+            learned = self.db.learn_from_conversations()
+            if self.archive:
+                self.rows_archived += self.db.archive_conversations()
+        except Exception:
+            self.failed_runs += 1
+            raise
+        self.last_run_seconds = time.perf_counter() - started
+        if self.metrics is not None:
+            self.metrics.observe('learn', self.last_run_seconds)
+            self.metrics.inc('patterns_learned', learned)
+        self.runs += 1
+        self.patterns_learned += learned
+        return learned
+
+    def trigger(self):
+        """Run as soon as possible instead of waiting for the interval"""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error in background learning: {str(e)}")
+
+    def close(self):
+        """Stop the schedule; a run in progress finishes first"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self) -> dict:
+        return {
+            'runs': self.runs,
+            'failed_runs': self.failed_runs,
+            'patterns_learned': self.patterns_learned,
+            'rows_archived': self.rows_archived,
+            'last_run_seconds': self.last_run_seconds
+        }
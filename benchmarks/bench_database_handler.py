@@ -0,0 +1,219 @@
+"""Time DatabaseHandler hot paths on synthetic databases and compare runs.
+
+Usage:
+    python benchmarks/bench_database_handler.py [--conversations 1000,100000,10000000]
+                                                [--patterns 10,1000,100000] [--output results.json]
+    python benchmarks/bench_database_handler.py --compare before.json after.json [--threshold 0.15]
+
+Each case is written to the output JSON as mean/p50/p95 microseconds per call.
+--compare exits with status 1 when a case got slower than the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from conversation_journal import message_hash
+from database_handler import DatabaseHandler
+from response_matcher import ResponseMatcher
+
+UNHANDLED_RESPONSE = "I'm still learning about that, could you rephrase?"
+SEED_BATCH = 50000
+
+def random_words(rng: random.Random, count: int) -> str:
+    return ' '.join(
+        ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 8)))
+        for _ in range(count)
+    )
+
+def summarize(samples: list) -> dict:
+    ordered = sorted(samples)
+    return {
+        'calls': len(ordered),
+        'mean_us': sum(ordered) / len(ordered) * 1e6,
+        'p50_us': ordered[len(ordered) // 2] * 1e6,
+        'p95_us': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1e6
+    }
+
+def time_each(fn, args_list) -> dict:
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+def seed_conversations(db: DatabaseHandler, rng: random.Random, count: int, users: int):
+    """Bulk insert conversations; about 1% are unhandled so learning has work to do"""
+    unhandled = [random_words(rng, 3) for _ in range(20)]
+
+    def rows():
+        for i in range(count):
+            if i % 100 == 0:
+                message = rng.choice(unhandled)
+                yield (f"user-{i % users}", message, UNHANDLED_RESPONSE, '{}', True, message_hash(message))
+            else:
+                message = f"message {i}"
+                yield (f"user-{i % users}", message, f"response {i}", '{}', False, message_hash(message))
+
+    generator = rows()
+    while True:
+        batch = [row for _, row in zip(range(SEED_BATCH), generator)]
+        if not batch:
+            break
+        with db.connections.transaction() as conn:
+            conn.executemany(
+                """INSERT INTO conversations (user_id, message, response, context, unhandled, message_hash)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                batch
+            )
+
+def seed_patterns(db: DatabaseHandler, rng: random.Random, count: int) -> list:
+    """Replace the response table with count distinct random patterns and rebuild the matcher"""
+    patterns = {}
+    while len(patterns) < count:  # responses.pattern is unique
+        patterns[random_words(rng, rng.randint(1, 2))] = None
+    patterns = list(patterns)
+    with db.connections.transaction() as conn:
+        conn.execute("DELETE FROM responses")
+        conn.executemany(
+            "INSERT INTO responses (pattern, response, usage_count, success_rate) VALUES (?, ?, ?, ?)",
+            [(pattern, f"response {i}", rng.randint(0, 50), rng.random()) for i, pattern in enumerate(patterns)]
+        )
+    db.matcher = ResponseMatcher(db._load_responses())
+    return patterns
+
+def bench_conversations(db: DatabaseHandler, rng: random.Random, size: int, iterations: int) -> dict:
+    users = [f"user-{i}" for i in range(min(size, 10000))]
+    results = {}
+
+    contexts = [(rng.choice(users),) for _ in range(iterations)]
+    db.context_cache.invalidate()
+    results['get_user_context.cold'] = time_each(lambda u: (db.context_cache.invalidate(u), db.get_user_context(u)), contexts)
+    results['get_user_context.warm'] = time_each(db.get_user_context, contexts)
+    results['update_user_context'] = time_each(
+        db.update_user_context,
+        [(rng.choice(users), {'topic': 'pricing'}, 'awaiting_details', random_words(rng, 5)) for _ in range(iterations)]
+    )
+
+    # Appends go to the write-behind journal; the final flush is part of the cost
+    logs = [(rng.choice(users), random_words(rng, 5), random_words(rng, 6)) for _ in range(iterations)]
+    started = time.perf_counter()
+    log_samples = []
+    for args in logs:
+        call_started = time.perf_counter()
+        db.log_conversation(*args)
+        log_samples.append(time.perf_counter() - call_started)
+    flush_started = time.perf_counter()
+    db.flush()
+    results['log_conversation'] = summarize(log_samples)
+    results['log_conversation']['flush_us'] = (time.perf_counter() - flush_started) * 1e6
+    results['log_conversation']['amortized_us'] = (time.perf_counter() - started) / iterations * 1e6
+
+    ids = [row[0] for row in db._load_responses()]
+    results['update_response_stats'] = time_each(
+        db.update_response_stats, [(rng.choice(ids), rng.random() < 0.7) for _ in range(iterations)]
+    )
+
+    # The heaviest call here, so only a few rounds
+    results['learn_from_conversations'] = time_each(db.learn_from_conversations, [()] * max(1, iterations // 50))
+    return {f"{name}@conversations={size}": stats for name, stats in results.items()}
+
+def bench_patterns(db: DatabaseHandler, rng: random.Random, size: int, iterations: int) -> dict:
+    patterns = seed_patterns(db, rng, size)
+    messages = [random_words(rng, rng.randint(3, 15)) for _ in range(iterations)]
+    for i in range(0, len(messages), 3):
+        messages[i] += ' ' + rng.choice(patterns)  # A share of messages hits a pattern
+    calls = [(message, f"user-{i % 100}", None, False) for i, message in enumerate(messages)]
+    return {f"find_best_response@patterns={size}": time_each(db.find_best_response, calls)}
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def run(args) -> dict:
+    rng = random.Random(42)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(s) for s in args.conversations.split(',')):
+            db = DatabaseHandler(db_path=os.path.join(tmp, f"conversations-{size}.db"))
+            started = time.perf_counter()
+            seed_conversations(db, rng, size, users=min(size, 10000))
+            print(f"seeded {size} conversations in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+            results.update(bench_conversations(db, rng, size, args.iterations))
+            db.close()
+
+        db = DatabaseHandler(db_path=os.path.join(tmp, "patterns.db"))
+        for size in (int(s) for s in args.patterns.split(',')):
+            results.update(bench_patterns(db, rng, size, args.iterations))
+        db.close()
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'iterations': args.iterations
+        },
+        'results': results
+    }
+
+def compare(before_path: str, after_path: str, threshold: float) -> int:
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    print(f"{before['meta']['commit']} -> {after['meta']['commit']}")
+    print(f"{'case':<55} {'before us':>11} {'after us':>11} {'change':>8}")
+    regressions = 0
+    for name in sorted(set(before['results']) | set(after['results'])):
+        old = before['results'].get(name, {}).get('mean_us')
+        new = after['results'].get(name, {}).get('mean_us')
+        if old is None or new is None:
+            print(f"{name:<55} {'-' if old is None else f'{old:.1f}':>11} {'-' if new is None else f'{new:.1f}':>11}")
+            continue
+        change = (new - old) / old if old else 0.0
+        flag = ''
+        if change > threshold:
+            regressions += 1
+            flag = '  REGRESSION'
+        print(f"{name:<55} {old:>11.1f} {new:>11.1f} {change:>+8.0%}{flag}")
+    return 1 if regressions else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--conversations', default='1000,100000,10000000')
+    parser.add_argument('--patterns', default='10,1000,100000')
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--output', default='bench_database_handler.json')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'))
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help="Relative slowdown of the mean that counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare(args.compare[0], args.compare[1], args.threshold))
+
+    report = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    for name, stats in sorted(report['results'].items()):
+        print(f"{name:<55} {stats['mean_us']:>11.1f} us  p95 {stats['p95_us']:>11.1f} us")
+    print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
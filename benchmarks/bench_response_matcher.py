@@ -0,0 +1,81 @@
+"""Compare response matching latency of the SQL LIKE scan and ResponseMatcher.
+
+Usage:
+    python benchmarks/bench_response_matcher.py [--sizes 10,100,1000,10000,100000] [--queries 500]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from response_matcher import ResponseMatcher
+
+LIKE_QUERY = """
+    SELECT response, id FROM responses
+    WHERE ? LIKE '%' || pattern || '%'
+    AND (context IS NULL OR context = ?)
+    ORDER BY usage_count DESC, success_rate DESC
+    LIMIT 1
+"""
+
+def random_words(rng: random.Random, count: int) -> str:
+    return ' '.join(
+        ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 8)))
+        for _ in range(count)
+    )
+
+def build_rows(rng: random.Random, size: int) -> list:
+    return [
+        (i, random_words(rng, rng.randint(1, 3)), f"response {i}", None, rng.randint(0, 50), rng.random())
+        for i in range(1, size + 1)
+    ]
+
+def time_calls(fn, messages) -> float:
+    """Mean seconds per call"""
+    started = time.perf_counter()
+    for message in messages:
+        fn(message)
+    return (time.perf_counter() - started) / len(messages)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000,10000,100000')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--sql-limit', type=int, default=10000,
+                        help="Skip the SQL scan above this many patterns (it gets slow)")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'patterns':>10} {'build ms':>10} {'matcher us':>12} {'sql like us':>12}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        rows = build_rows(rng, size)
+        messages = [random_words(rng, rng.randint(3, 15)) for _ in range(args.queries)]
+        # Make a share of the messages actually hit a pattern
+        for i in range(0, len(messages), 3):
+            messages[i] += ' ' + rng.choice(rows)[1]
+
+        started = time.perf_counter()
+        matcher = ResponseMatcher(rows)
+        build_ms = (time.perf_counter() - started) * 1000
+        matcher_us = time_calls(lambda m: matcher.match(m, '{}'), messages) * 1e6
+
+        sql_us = float('nan')
+        if size <= args.sql_limit:
+            conn = sqlite3.connect(":memory:")
+            conn.execute("""
+                CREATE TABLE responses (id INTEGER PRIMARY KEY, pattern TEXT, response TEXT,
+                                        context TEXT, usage_count INTEGER, success_rate FLOAT)
+            """)
+            conn.executemany("INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?)", rows)
+            sql_us = time_calls(lambda m: conn.execute(LIKE_QUERY, (m, '{}')).fetchone(), messages) * 1e6
+            conn.close()
+
+        print(f"{size:>10} {build_ms:>10.1f} {matcher_us:>12.1f} {sql_us:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Drive InstagramMessageAPI end to end against the local fake Instagram client.
+
+Usage:
+    python benchmarks/load_test.py [--threads 200] [--rate 50] [--messages 1000] [--workers 4]
+                                   [--latency 0.02] [--error-rate 0.0] [--engine threads|async]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from functools import wraps
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fake_instagram import FakeInstagramClient
+from instagram_api import InstagramMessageAPI
+from async_engine import AsyncInstagramEngine
+
+# DatabaseHandler calls made while handling a message
+DB_METHODS = ('get_user_context', 'update_user_context', 'find_best_response', 'find_best_responses',
+              'log_conversation', 'update_response_stats', 'queue_response_stats', 'set_thread_watermark')
+
+class DBTimer:
+    """Wraps DatabaseHandler methods on one instance and adds up the time spent in them"""
+
+    def __init__(self, db):
+        self.total = 0.0
+        self._lock = threading.Lock()
+        for name in DB_METHODS:
+            setattr(db, name, self._timed(getattr(db, name)))
+
+    def _timed(self, method):
+        @wraps(method)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.total += time.perf_counter() - started
+        return timed
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=200, help="Conversations in the synthetic inbox")
+    parser.add_argument('--rate', type=float, default=50.0, help="Inbound messages per second")
+    parser.add_argument('--messages', type=int, default=1000, help="Inbound messages to generate in total")
+    parser.add_argument('--inbox-page-size', type=int, default=20)
+    parser.add_argument('--thread-page-size', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds added to every API call")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of API calls that fail")
+    parser.add_argument('--workers', type=int, default=4, help="Message workers (threads engine) or executor threads (async engine)")
+    parser.add_argument('--poll-interval', type=float, default=0.2, help="Shortest time between polls")
+    parser.add_argument('--api-rate', type=float, default=1000.0,
+                        help="Calls per second allowed for each endpoint (the live budgets are far lower)")
+    parser.add_argument('--engine', choices=('threads', 'async'), default='threads',
+                        help="InstagramMessageAPI with its worker pool, or AsyncInstagramEngine")
+    parser.add_argument('--burst-window', type=float, default=5.0,
+                        help="Seconds between a thread's messages that still count as one burst (threads engine)")
+    parser.add_argument('--timeout', type=float, default=300.0)
+    args = parser.parse_args()
+
+    client = FakeInstagramClient(
+        threads=args.threads,
+        message_rate=args.rate,
+        total_messages=args.messages,
+        inbox_page_size=args.inbox_page_size,
+        thread_page_size=args.thread_page_size,
+        latency=args.latency,
+        error_rate=args.error_rate
+    )
+    budget = (args.api_rate, max(1, int(args.api_rate)))
+    limits = {'inbox': budget, 'activity': budget, 'send': budget}
+    factory = lambda username, password: client
+    if args.engine == 'async':
+        bot = AsyncInstagramEngine(client_factory=factory, db_path=":memory:", rate_limits=limits,
+                                   blocking_workers=args.workers)
+    else:
+        bot = InstagramMessageAPI(worker_count=args.workers, client_factory=factory, db_path=":memory:",
+                                  rate_limits=limits, burst_window=args.burst_window)
+    bot.poll_scheduler.min_interval = args.poll_interval
+    bot.poll_scheduler.max_interval = max(args.poll_interval, 1.0)
+    bot.poll_scheduler.interval = args.poll_interval
+    db_timer = DBTimer(bot.db)
+
+    if args.engine == 'async':
+        event_loop = asyncio.new_event_loop()
+
+        def run_async():
+            event_loop.run_until_complete(bot.run())
+            event_loop.run_until_complete(bot.shutdown())
+
+        loop = threading.Thread(target=run_async, name="load-test-loop", daemon=True)
+        stop = lambda: event_loop.call_soon_threadsafe(bot.stop)
+    else:
+        loop = threading.Thread(target=bot.start_message_loop, name="load-test-loop", daemon=True)
+        stop = bot.stop
+    started = time.monotonic()
+    client.start()
+    loop.start()
+    deadline = started + args.timeout
+    while client.answered() < args.messages and time.monotonic() < deadline:
+        time.sleep(0.1)
+    elapsed = time.monotonic() - started
+    stop()
+    loop.join(timeout=10)
+    if args.engine == 'threads':
+        bot.shutdown()
+
+    answered = client.answered()
+    latencies = client.reply_latencies
+    handled = bot.metrics.counter('messages_handled')
+    print(f"messages generated   {client.generated}")
+    print(f"messages answered    {answered} in {elapsed:.1f}s")
+    print(f"throughput           {answered / elapsed:.1f} msg/s")
+    for pct in (50, 95, 99):
+        print(f"time to reply p{pct:<3}   {percentile(latencies, pct) * 1000:.0f} ms")
+    print(f"db time per message  {db_timer.total / handled * 1000 if handled else float('nan'):.2f} ms")
+    print(f"injected errors      {client.errors}")
+    print(f"api calls            {client.stats()['calls']}")
+    if args.engine == 'threads':
+        outbox = bot.outbox.stats()
+        queue_delay = bot.metrics.stage('send_queue_delay')
+        print(f"send queue delay p95 {queue_delay.quantile(0.95) * 1000:g} ms")
+        print(f"sla misses           {outbox['sla_missed']} ({outbox['sla_miss_rate'] * 100:.1f}%), "
+              f"{outbox['downgraded']} downgraded, {outbox['dropped']} dropped")
+    if answered < args.messages:
+        print(f"Timed out with {args.messages - answered} messages unanswered")
+
+if __name__ == "__main__":
+    main()
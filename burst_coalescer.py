@@ -0,0 +1,78 @@
+import time
+from typing import Dict, List, Optional, Tuple
+from inbox_reader import InboxMessage
+from inbox_sync import item_timestamp
+
+class BurstCoalescer:
+    """Merges back-to-back messages of a thread into one, so a burst gets one reply.
+
+    Messages of the same thread less than quiet_window seconds apart form a
+    burst; the burst is answered as a single message whose text is the
+    parts joined by newlines and whose timestamp and item_id are the last
+    part's; first_timestamp keeps the first part's, so releasing a burst
+    after a failed send hands every part out again. A burst whose newest part is younger than quiet_window is
+    deferred to a later poll, since the person is probably still typing,
+    unless its first part has already waited max_wait seconds.
+    """
+
+    def __init__(self, quiet_window: float = 5.0, max_wait: float = 30.0):
+        self.quiet_window = quiet_window
+        self.max_wait = max_wait
+        self.messages_answered = 0  # Messages in bursts handed out for a reply
+        self.replies = 0  # Bursts handed out; messages_answered - replies sends were saved
+        self.deferred = 0
+
+    def coalesce(self, messages: List[InboxMessage],
+                 now: Optional[float] = None) -> Tuple[List[InboxMessage], List[InboxMessage]]:
+        """Split one poll's messages into (bursts to answer now, messages to leave for later)"""
+        now_us = int((time.time() if now is None else now) * 1e6)
+        window_us = int(self.quiet_window * 1e6)
+        max_wait_us = int(self.max_wait * 1e6)
+
+        threads: Dict[str, List[InboxMessage]] = {}  # Insertion order keeps threads in inbox order
+        for message in messages:
+            threads.setdefault(message['thread_id'], []).append(message)
+
+        ready, deferred = [], []
+        for items in threads.values():
+            items.sort(key=item_timestamp)
+            bursts = [[items[0]]]
+            for message in items[1:]:
+                if item_timestamp(message) - item_timestamp(bursts[-1][-1]) < window_us:
+                    bursts[-1].append(message)
+                else:
+                    bursts.append([message])
+
+            last = bursts[-1]
+            if (now_us - item_timestamp(last[-1]) < window_us
+                    and now_us - item_timestamp(last[0]) < max_wait_us):
+                deferred.extend(bursts.pop())
+            ready.extend(self._merge(burst) for burst in bursts)
+            self.messages_answered += sum(len(burst) for burst in bursts)
+
+        self.replies += len(ready)
+        self.deferred += len(deferred)
+        return ready, deferred
+
+    @staticmethod
+    def _merge(burst: List[InboxMessage]) -> InboxMessage:
+        if len(burst) == 1:
+            return burst[0]
+        last = burst[-1]
+        return InboxMessage(
+            last['thread_id'],
+            last['user_id'],
+            last['username'],
+            '\n'.join(message['message'] for message in burst if message['message']),
+            last['timestamp'],
+            last.get('item_id'),
+            first_timestamp=burst[0]['timestamp']
+        )
+
+    def stats(self) -> dict:
+        return {
+            'messages_answered': self.messages_answered,
+            'replies': self.replies,
+            'sends_saved': self.messages_answered - self.replies,
+            'deferred': self.deferred
+        }
@@ -0,0 +1,126 @@
+import sqlite3
+import itertools
+import weakref
+from contextlib import contextmanager
+from threading import Lock, RLock, local
+from typing import List, Optional
+
+_memory_ids = itertools.count(1)
+
+class _ThreadConnection:
+    """A thread's connection and how deep it is in transaction() blocks"""
+
+    __slots__ = ('conn', 'depth', '__weakref__')
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.depth = 0
+
+class ConnectionManager:
+    """Long-lived per-thread SQLite connections for a single database"""
+
+    PRAGMAS = (
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA cache_size = -8000",
+        "PRAGMA foreign_keys = ON",
+    )
+
+    def __init__(self, db_path: str, timeout: float = 30.0, cached_statements: int = 256):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.in_memory = db_path == ":memory:"
+        if self.in_memory:
+            # A named shared-cache database is visible to every connection opened
+            # by this manager and lives for as long as the anchor connection does.
+            self.database = f"file:instagram_bot_mem_{next(_memory_ids)}?mode=memory&cache=shared"
+        else:
+            self.database = db_path
+        self.write_lock = RLock()  # SQLite allows one writer at a time anyway
+        self._local = local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = Lock()
+        self._closed = False
+        self._anchor = self._open()
+        self._local.state = _ThreadConnection(self._anchor)  # Lives as long as the manager
+
+    def _open(self) -> sqlite3.Connection:
+        """Open and configure a new connection"""
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.timeout,
+            uri=self.in_memory,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        if self.in_memory:
+            # Readers must not trip over table locks held by another thread's writer
+            conn.execute("PRAGMA read_uncommitted = 1")
+        else:
+            conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def _state(self) -> _ThreadConnection:
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection manager is closed")
+        state: Optional[_ThreadConnection] = getattr(self._local, 'state', None)
+        if state is None:
+            state = _ThreadConnection(self._open())
+            self._local.state = state
+            # The thread-local state is dropped when its thread exits; close the connection then
+            finalizer = weakref.finalize(state, self._release, state.conn)
+            finalizer.atexit = False
+        return state
+
+    def _release(self, conn: sqlite3.Connection):
+        with self._connections_lock:
+            if conn not in self._connections:
+                return  # Already closed by close()
+            self._connections.remove(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def connection(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it on first use"""
+        return self._state().conn
+
+    @contextmanager
+    def transaction(self):
+        """Serialize a write transaction; commits on success, rolls back on error.
+
+        Nested blocks join the outermost one, which alone commits or rolls back.
+        """
+        state = self._state()
+        with self.write_lock:
+            if state.depth:
+                state.depth += 1
+                try:
+                    yield state.conn
+                finally:
+                    state.depth -= 1
+                return
+            state.depth = 1
+            try:
+                with state.conn:
+                    yield state.conn
+            finally:
+                state.depth = 0
+
+    def close(self):
+        """Close every connection opened by this manager"""
+        with self._connections_lock:
+            self._closed = True
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
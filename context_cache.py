@@ -0,0 +1,90 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+class UserContextCache:
+    """Bounded LRU cache of user contexts with a time-to-live"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()  # user_id -> (expires_at, context)
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _copy(user_context: dict) -> dict:
+        """Callers mutate the dicts they get back, so never hand out the cached one"""
+        return {
+            'context': dict(user_context['context']),
+            'state': user_context['state'],
+            'previous_messages': list(user_context['previous_messages'])
+        }
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """Return a copy of the cached context, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, user_context = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return self._copy(user_context)
+
+    def put(self, user_id: str, user_context: dict):
+        """Store a context, evicting the least recently used entries when full"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, self._copy(user_context))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def apply_update(self, user_id: str, context: dict, state: str, message: str, window: int):
+        """Apply a context update to a cached entry in place; a missing entry stays missing"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            previous_messages = (entry[1]['previous_messages'] + [message])[-window:]
+            self._entries[user_id] = (time.monotonic() + self.ttl, self._copy({
+                'context': context,
+                'state': state,
+                'previous_messages': previous_messages
+            }))
+            self._entries.move_to_end(user_id)
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """Drop one user's context, or everything when no user is given"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
@@ -0,0 +1,174 @@
+import gzip
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import Dict, Iterator, List, Optional
+from connection_manager import ConnectionManager
+
+COLUMNS = ('id', 'user_id', 'message', 'response', 'context', 'was_helpful', 'timestamp', 'unhandled')
+
+class ConversationArchive:
+    """Moves aged conversations out of the hot table into monthly gzip partitions.
+
+    Rows older than retention_days are appended as JSON lines to
+    <archive_dir>/conversations-YYYY-MM.jsonl.gz, one gzip member per run,
+    and deleted from the database in the same transaction that records the
+    partition and the per-day totals in conversation_summary. Only rows the
+    learner has already counted are archived, so learning never misses one.
+    The database write lock is held only to read a batch and to delete it;
+    compressing and syncing the partition files happens outside it, so
+    other writers are not stalled behind the disk.
+
+    history() reads the partitions that overlap the requested range and then
+    the hot table, so callers see one continuous stream. Without an
+    archive_dir nothing is archived and history() reads the hot table only.
+    """
+
+    def __init__(self, connections: ConnectionManager, archive_dir: Optional[str], retention_days: float = 90.0,
+                 batch_size: int = 5000):
+        self.connections = connections
+        self.archive_dir = archive_dir
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.rows_archived = 0
+        self._archive_lock = Lock()  # One run at a time, so a batch is never written twice
+
+    def partition_path(self, partition: str) -> str:
+        return os.path.join(self.archive_dir, f"conversations-{partition}.jsonl.gz")
+
+    def cutoff(self, now: Optional[datetime] = None) -> str:
+        """Timestamps below this are archived; same format as SQLite's CURRENT_TIMESTAMP (UTC)"""
+        now = now or datetime.now(timezone.utc)
+        return (now - timedelta(days=self.retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+
+    def archive(self, now: Optional[datetime] = None) -> int:
+        """Archive every conversation past the retention age; returns the number of rows moved"""
+        if not self.archive_dir:
+            return 0
+        cutoff = self.cutoff(now)
+        moved = 0
+        with self._archive_lock:
+            while True:
+                batch = self._archive_batch(cutoff)
+                if not batch:
+                    break
+                moved += batch
+        self.rows_archived += moved
+        return moved
+
+    def _archive_batch(self, cutoff: str) -> int:
+        conn = self.connections.connection()
+        with self.connections.write_lock:
+            learned = conn.execute("SELECT value FROM learning_state WHERE key = 'last_conversation_id'").fetchone()
+            rows = conn.execute(f"""
+                SELECT {', '.join(COLUMNS)} FROM conversations
+                WHERE timestamp < ? AND id <= ?
+                ORDER BY id LIMIT ?
+            """, (cutoff, learned[0] if learned else 0, self.batch_size)).fetchall()
+        if not rows:
+            return 0
+
+        partitions: Dict[str, List[dict]] = defaultdict(list)
+        for row in rows:
+            record = dict(zip(COLUMNS, row))
+            partitions[record['timestamp'][:7]].append(record)
+
+        # Files first: if the delete below fails the rows are archived twice,
+        # and history() drops the duplicate ids, but they are never lost
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for partition, records in partitions.items():
+            with open(self.partition_path(partition), 'ab') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb') as out:
+                    for record in records:
+                        out.write(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n')
+                raw.flush()
+                os.fsync(raw.fileno())
+
+        days: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+        for record in (record for records in partitions.values() for record in records):
+            totals = days[record['timestamp'][:10]]
+            totals[0] += 1
+            totals[1] += 1 if record['unhandled'] else 0
+
+        with self.connections.transaction() as conn:
+            conn.executemany("DELETE FROM conversations WHERE id = ?", [(row[0],) for row in rows])
+            for partition, records in partitions.items():
+                conn.execute("""
+                    INSERT INTO archive_partitions (partition, path, row_count, first_timestamp, last_timestamp)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(partition) DO UPDATE SET
+                        row_count = row_count + excluded.row_count,
+                        first_timestamp = MIN(first_timestamp, excluded.first_timestamp),
+                        last_timestamp = MAX(last_timestamp, excluded.last_timestamp),
+                        updated_at = CURRENT_TIMESTAMP
+                """, (
+                    partition,
+                    self.partition_path(partition),
+                    len(records),
+                    min(record['timestamp'] for record in records),
+                    max(record['timestamp'] for record in records)
+                ))
+            conn.executemany("""
+                INSERT INTO conversation_summary (day, conversations, unhandled) VALUES (?, ?, ?)
+                ON CONFLICT(day) DO UPDATE SET
+                    conversations = conversations + excluded.conversations,
+                    unhandled = unhandled + excluded.unhandled
+            """, [(day, totals[0], totals[1]) for day, totals in days.items()])
+        return len(rows)
+
+    def history(self, user_id: Optional[str] = None, since: Optional[str] = None,
+                until: Optional[str] = None) -> Iterator[dict]:
+        """Conversations in [since, until) across archive partitions and the hot table, oldest first.
+
+        A row archived more than once, or archived but not yet deleted, is
+        yielded once, so this keeps every id yielded so far in memory.
+        """
+        conn = self.connections.connection()
+        partitions = conn.execute("""
+            SELECT partition, path FROM archive_partitions
+            WHERE (? IS NULL OR last_timestamp >= ?) AND (? IS NULL OR first_timestamp < ?)
+            ORDER BY partition
+        """, (since, since, until, until)).fetchall()
+
+        seen = set()
+        for _, path in partitions:
+            if not os.path.exists(path):
+                print(f"Archive partition missing: {path}")
+                continue
+            records = []
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    if record['id'] in seen or not self._matches(record, user_id, since, until):
+                        continue
+                    seen.add(record['id'])
+                    records.append(record)
+            records.sort(key=lambda record: (record['timestamp'], record['id']))
+            yield from records
+
+        # Only the given filters go into the query, so the (user_id, timestamp) index applies
+        filters = [(column, value) for column, value in (
+            ('user_id = ?', user_id), ('timestamp >= ?', since), ('timestamp < ?', until)
+        ) if value is not None]
+        where = ' AND '.join(column for column, _ in filters) or '1'
+        cursor = conn.execute(f"""
+            SELECT {', '.join(COLUMNS)} FROM conversations
+            WHERE {where}
+            ORDER BY timestamp, id
+        """, [value for _, value in filters])
+        for row in cursor:
+            if row[0] not in seen:
+                yield dict(zip(COLUMNS, row))
+
+    @staticmethod
+    def _matches(record: dict, user_id: Optional[str], since: Optional[str], until: Optional[str]) -> bool:
+        return ((user_id is None or record['user_id'] == user_id)
+                and (since is None or record['timestamp'] >= since)
+                and (until is None or record['timestamp'] < until))
+
+    def stats(self) -> dict:
+        conn = self.connections.connection()
+        partitions, rows = conn.execute("SELECT COUNT(*), COALESCE(SUM(row_count), 0) FROM archive_partitions").fetchone()
+        return {'partitions': partitions, 'archived_rows': rows, 'rows_archived_this_session': self.rows_archived}
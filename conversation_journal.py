@@ -0,0 +1,126 @@
+import hashlib
+import time
+from threading import Event, Lock, Thread
+from typing import Callable, List, Optional, Tuple
+from connection_manager import ConnectionManager
+
+UNHANDLED_MARKER = 'still learning'
+
+def is_unhandled(response: str) -> bool:
+    """Replies that admit the bot had no answer; learning looks for these"""
+    return UNHANDLED_MARKER in response.lower()
+
+def message_hash(message: str) -> int:
+    """Signed 64-bit hash of the message with case and whitespace normalized"""
+    normalized = ' '.join(message.lower().split())
+    digest = hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+class ConversationJournal:
+    """Write-behind queue that batches conversation rows into one transaction"""
+
+    INSERT_SQL = """
+        INSERT INTO conversations
+        (user_id, message, response, context, unhandled, message_hash)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """
+
+    def __init__(self, connections: ConnectionManager, max_batch: int = 100, flush_interval: float = 1.0,
+                 also_flush: Optional[Callable[[], None]] = None):
+        self.connections = connections
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.also_flush = also_flush  # Other write-behind state flushed on the same timer
+        self._pending: List[Tuple] = []
+        self._lock = Lock()  # Guards the pending queue
+        self._flush_lock = Lock()  # One flush at a time keeps rows in order
+        self._wakeup = Event()
+        self._stopped = Event()
+
+        self.rows_queued = 0
+        self.rows_flushed = 0
+        self.flush_count = 0
+        self.failed_flushes = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+        self._thread = Thread(target=self._run, name="conversation-journal", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def row(user_id: str, message: str, response: str, context: str) -> Tuple:
+        """Parameters of INSERT_SQL for one conversation"""
+        return (user_id, message, response, context, is_unhandled(response), message_hash(message))
+
+    def append(self, user_id: str, message: str, response: str, context: str):
+        """Queue a conversation row for the next flush"""
+        with self._lock:
+            self._pending.append(self.row(user_id, message, response, context))
+            self.rows_queued += 1
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Write every queued row in a single transaction"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                with self.connections.transaction() as conn:
+                    conn.executemany(self.INSERT_SQL, batch)
+            except Exception:
+                # Put the rows back in front of anything queued meanwhile
+                with self._lock:
+                    self._pending[:0] = batch
+                self.failed_flushes += 1
+                raise
+
+            elapsed = time.perf_counter() - started
+            self.flush_count += 1
+            self.rows_flushed += len(batch)
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            self.total_flush_seconds += elapsed
+            return len(batch)
+
+    def _run(self):
+        """Flush by size or by time until closed"""
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self.flush()
+                if self.also_flush is not None:
+                    self.also_flush()
+            except Exception as e:
+                print(f"Error flushing conversation journal: {str(e)}")
+
+    def close(self):
+        """Stop the background flusher and write out anything still queued"""
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+
+    def stats(self) -> dict:
+        """Queue depth and flush latency counters"""
+        with self._lock:
+            queue_depth = len(self._pending)
+        return {
+            'queue_depth': queue_depth,
+            'rows_queued': self.rows_queued,
+            'rows_flushed': self.rows_flushed,
+            'flush_count': self.flush_count,
+            'failed_flushes': self.failed_flushes,
+            'last_flush_seconds': self.last_flush_seconds,
+            'max_flush_seconds': self.max_flush_seconds,
+            'avg_flush_seconds': self.total_flush_seconds / self.flush_count if self.flush_count else 0.0
+        }
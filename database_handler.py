@@ -1,123 +1,303 @@
 import sqlite3
-from typing import List, Tuple, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple, Optional
 from datetime import datetime
 import json
+import os
+import time
 from collections import defaultdict
 from human_response_generator import HumanResponseGenerator
 from threading import Lock
+from connection_manager import ConnectionManager
+from conversation_journal import ConversationJournal, message_hash
+from migrations import HISTORY_WINDOW, SCHEMA_VERSION, migrate, schema_version
+from conversation_archive import ConversationArchive
+from context_cache import UserContextCache
+from response_matcher import ResponseMatcher
+from intent_classifier import IntentClassifier, MessageClassification
+from startup_profile import profile
 
 class DatabaseHandler:
-    def __init__(self, db_path: str = "instagram_bot.db"):
+    BATCH_PARAMETERS = 500  # User ids per IN (...) list, well below SQLite's parameter limit
+
+    GENERIC_RESPONSES = {
+        'schedule': "Let me check that information for you. Could you please be more specific?",
+        'explain': "I'd be happy to explain that. Could you please provide more details about what you'd like to know?",
+        'location': "I can help you with location information. What specific location are you looking for?",
+        'question': "That's a good question. Let me find the most accurate information for you."
+    }
+
+    def __init__(self, db_path: str = "instagram_bot.db", journal_batch_size: int = 100,
+                 journal_flush_interval: float = 1.0, context_cache_size: int = 10000,
+                 context_cache_ttl: float = 300.0, archive_dir: Optional[str] = None,
+                 retention_days: float = 90.0, human_generator: Optional[HumanResponseGenerator] = None):
         self.db_path = db_path
         self.conversation_contexts = defaultdict(dict)  # Store context for each user
-        self.human_generator = HumanResponseGenerator()
+        # Callers that generate replies themselves pass theirs in, so there is one instance
+        self.human_generator = human_generator or HumanResponseGenerator()
+        self.classifier = IntentClassifier()
         self.db_lock = Lock()  # Add database lock
-        self.setup_database()
+        with profile.phase('open connection'):
+            self.connections = ConnectionManager(db_path)
+        self.context_cache = UserContextCache(max_size=context_cache_size, ttl=context_cache_ttl)
+        with profile.phase('schema'):
+            self.setup_database()
+        # The pattern index is built on the first lookup, not at startup
+        self._matcher: Optional[ResponseMatcher] = None
+        self._matcher_lock = Lock()
+        self._pending_stats: Dict[int, List[int]] = {}  # response_id -> [uses, helpful] not yet written
+        self._stats_lock = Lock()
+        self.journal = ConversationJournal(
+            self.connections,
+            max_batch=journal_batch_size,
+            flush_interval=journal_flush_interval,
+            also_flush=self.flush_response_stats
+        )
+        if archive_dir is None and db_path != ":memory:":
+            archive_dir = os.path.splitext(db_path)[0] + "_archive"
+        # In-memory databases keep everything unless an archive directory is given
+        self.archive = ConversationArchive(self.connections, archive_dir, retention_days)
+
+    @property
+    def matcher(self) -> ResponseMatcher:
+        if self._matcher is None:
+            with self._matcher_lock:
+                if self._matcher is None:
+                    with profile.phase('response index'):
+                        self._matcher = ResponseMatcher(self._load_responses())
+        return self._matcher
+
+    @matcher.setter
+    def matcher(self, matcher: ResponseMatcher):
+        self._matcher = matcher
 
     def setup_database(self):
-        """Initialize the database with required tables"""
-        with sqlite3.connect(self.db_path) as conn:
+        """Bring the schema up to date and seed the default responses.
+
+        A database already at SCHEMA_VERSION costs one PRAGMA read and the
+        seed check; no DDL runs and no write lock is taken.
+        """
+        conn = self.connections.connection()
+        if schema_version(conn) != SCHEMA_VERSION:
+            with self.connections.write_lock:
+                existing = conn.execute(
+                    "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'conversations'"
+                ).fetchone()[0]
+                applied = migrate(conn)
+            if existing and applied:
+                print(f"Upgraded database schema to version {applied[-1]}")
+        elif conn.execute("SELECT 1 FROM responses LIMIT 1").fetchone() is not None:
+            return
+        
+        with self.connections.transaction() as conn:
             cursor = conn.cursor()
-            
-            # Modify conversations table to include context
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS conversations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id TEXT NOT NULL,
-                    message TEXT NOT NULL,
-                    response TEXT NOT NULL,
-                    context TEXT,
-                    was_helpful BOOLEAN DEFAULT NULL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Add table for user contexts
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS user_contexts (
-                    user_id TEXT PRIMARY KEY,
-                    context TEXT,
-                    last_interaction TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    conversation_state TEXT,
-                    previous_messages TEXT
-                )
-            """)
-            
-            # Add responses table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS responses (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    pattern TEXT NOT NULL,
-                    response TEXT NOT NULL,
-                    context TEXT,
-                    usage_count INTEGER DEFAULT 0,
-                    success_rate FLOAT DEFAULT 0.0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
             # Check and insert initial responses
             cursor.execute("SELECT COUNT(*) FROM responses")
             if cursor.fetchone()[0] == 0:
                 self.insert_initial_responses()
-            
-            conn.commit()
 
     def get_user_context(self, user_id: str) -> dict:
         """Retrieve context for a specific user"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT context, conversation_state, previous_messages 
-                FROM user_contexts 
-                WHERE user_id = ?
-            """, (user_id,))
-            result = cursor.fetchone()
-            
-            if result:
-                return {
-                    'context': json.loads(result[0]) if result[0] else {},
-                    'state': result[1],
-                    'previous_messages': json.loads(result[2]) if result[2] else []
+        cached = self.context_cache.get(user_id)
+        if cached is not None:
+            return cached
+        
+        cursor = self.connections.connection().cursor()
+        cursor.execute("""
+            SELECT context, conversation_state
+            FROM user_contexts 
+            WHERE user_id = ?
+        """, (user_id,))
+        result = cursor.fetchone()
+        cursor.execute("""
+            SELECT message FROM message_history
+            WHERE user_id = ?
+            ORDER BY id DESC LIMIT ?
+        """, (user_id, HISTORY_WINDOW))
+        previous_messages = [row[0] for row in reversed(cursor.fetchall())]
+        
+        if result:
+            user_context = {
+                'context': json.loads(result[0]) if result[0] else {},
+                'state': result[1],
+                'previous_messages': previous_messages
+            }
+        else:
+            user_context = {'context': {}, 'state': 'initial', 'previous_messages': previous_messages}
+        self.context_cache.put(user_id, user_context)
+        return user_context
+
+    def get_user_contexts(self, user_ids: Iterable[str]) -> Dict[str, dict]:
+        """Contexts of several users: cache hits first, then one query per table for the rest"""
+        contexts = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            cached = self.context_cache.get(user_id)
+            if cached is not None:
+                contexts[user_id] = cached
+            else:
+                missing.append(user_id)
+
+        conn = self.connections.connection()
+        for start in range(0, len(missing), self.BATCH_PARAMETERS):
+            chunk = missing[start:start + self.BATCH_PARAMETERS]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = {row[0]: row for row in conn.execute(f"""
+                SELECT user_id, context, conversation_state
+                FROM user_contexts
+                WHERE user_id IN ({placeholders})
+            """, chunk)}
+            history = defaultdict(list)
+            for user_id, message in conn.execute(f"""
+                SELECT user_id, message FROM (
+                    SELECT user_id, message, id,
+                           ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id DESC) AS recent
+                    FROM message_history
+                    WHERE user_id IN ({placeholders})
+                )
+                WHERE recent <= ?
+                ORDER BY id
+            """, chunk + [HISTORY_WINDOW]):
+                history[user_id].append(message)
+
+            for user_id in chunk:
+                row = rows.get(user_id)
+                user_context = {
+                    'context': json.loads(row[1]) if row and row[1] else {},
+                    'state': row[2] if row else 'initial',
+                    'previous_messages': history[user_id]
                 }
-            return {'context': {}, 'state': 'initial', 'previous_messages': []}
+                self.context_cache.put(user_id, user_context)
+                contexts[user_id] = user_context
+        return contexts
 
     def update_user_context(self, user_id: str, context: dict, state: str, message: str):
-        """Update context for a specific user"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Get previous messages
-            previous_messages = self.get_user_context(user_id)['previous_messages']
-            previous_messages.append(message)
-            if len(previous_messages) > 5:  # Keep only last 5 messages
-                previous_messages = previous_messages[-5:]
+        """Update context for a specific user.
+
+        Context and state are upserted column by column and the message is
+        appended to message_history, whose trigger keeps the last
+        HISTORY_WINDOW rows; nothing is read first.
+        """
+        with self.connections.transaction() as conn:
+            conn.execute("""
+                INSERT INTO user_contexts (user_id, context, conversation_state, last_interaction)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    context = excluded.context,
+                    conversation_state = excluded.conversation_state,
+                    last_interaction = excluded.last_interaction
+            """, (user_id, json.dumps(context), state))
+            conn.execute("INSERT INTO message_history (user_id, message) VALUES (?, ?)", (user_id, message))
             
-            cursor.execute("""
-                INSERT OR REPLACE INTO user_contexts 
-                (user_id, context, conversation_state, previous_messages, last_interaction)
-                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-            """, (
-                user_id,
-                json.dumps(context),
-                state,
-                json.dumps(previous_messages)
+            # Write through so the rest of this message's pipeline reads from memory
+            self.context_cache.apply_update(user_id, context, state, message, HISTORY_WINDOW)
+
+    def find_best_response(self, message: str, user_id: str,
+                           classification: Optional[MessageClassification] = None,
+                           simulate_typing: bool = True) -> Tuple[str, int]:
+        """Find the best matching response based on message and user context.
+
+        Pass simulate_typing=False when the caller schedules the typing delay itself.
+        """
+        if classification is None:
+            classification = self.classifier.classify(message)
+        return self._respond(classification, self.get_user_context(user_id), simulate_typing)
+
+    def find_best_responses(self, messages: Sequence[Tuple[str, str]],
+                            observe: Optional[Callable[[str, float], None]] = None
+                            ) -> List[Tuple[str, int, MessageClassification]]:
+        """Answer a batch of (user_id, message) pairs in a single pass.
+
+        Does for every message what the per-message path does with
+        update_user_context, find_best_response and log_conversation, in
+        order, so each reply is the same; but contexts are loaded together,
+        and the context updates, history rows, conversations and queued
+        response stats are written in one transaction. Returns
+        (response, response_id, classification) per message.
+
+        observe(stage, seconds), e.g. MetricsRegistry.observe, gets the
+        classify, context_lookup, response_match and conversation_log stages
+        once per message. The shared context read and write are split
+        evenly over the batch.
+        """
+        if not messages:
+            return []
+        observe = observe or (lambda stage, seconds: None)
+        classifications = []
+        for _, message in messages:
+            started = time.perf_counter()
+            classifications.append(self.classifier.classify(message))
+            observe('classify', time.perf_counter() - started)
+        return self._respond_batch(messages, classifications, observe)
+
+    def _respond_batch(self, messages: Sequence[Tuple[str, str]], classifications: List[MessageClassification],
+                       observe: Callable[[str, float], None]) -> List[Tuple[str, int, MessageClassification]]:
+        # No lock around the read-modify-write: a user's direct messages come
+        # from one thread and the message loop shards by thread, so batches
+        # planned at the same time do not share a user
+        started = time.perf_counter()
+        contexts = self.get_user_contexts(user_id for user_id, _ in messages)
+        self._observe_split(observe, 'context_lookup', time.perf_counter() - started, len(messages))
+
+        results = []
+        history_rows = []
+        conversation_rows = []
+        for (user_id, _), classification in zip(messages, classifications):
+            user_context = contexts[user_id]
+            if classification.topic:
+                user_context['context']['topic'] = classification.topic
+            user_context['state'] = classification.state
+            user_context['previous_messages'] = (
+                user_context['previous_messages'] + [classification.text]
+            )[-HISTORY_WINDOW:]
+            history_rows.append((user_id, classification.text))
+
+            started = time.perf_counter()
+            response, response_id = self._respond(classification, user_context, simulate_typing=False)
+            observe('response_match', time.perf_counter() - started)
+            conversation_rows.append(ConversationJournal.row(
+                user_id, classification.text, response, json.dumps(user_context['context'])
             ))
-            conn.commit()
+            results.append((response, response_id, classification))
 
-    def find_best_response(self, message: str, user_id: str) -> Tuple[str, int]:
-        """Find the best matching response based on message and user context"""
-        message = message.lower()
-        user_context = self.get_user_context(user_id)
+        started = time.perf_counter()
+        self.journal.flush()  # Rows logged one at a time stay ahead of this batch
+        with self.connections.transaction() as conn:
+            conn.executemany("""
+                INSERT INTO user_contexts (user_id, context, conversation_state, last_interaction)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    context = excluded.context,
+                    conversation_state = excluded.conversation_state,
+                    last_interaction = excluded.last_interaction
+            """, [(user_id, json.dumps(user_context['context']), user_context['state'])
+                  for user_id, user_context in contexts.items()])
+            conn.executemany("INSERT INTO message_history (user_id, message) VALUES (?, ?)", history_rows)
+            conn.executemany(ConversationJournal.INSERT_SQL, conversation_rows)
+            self._write_response_stats(conn)
+            # Still under the write lock, so the cache never goes back to an older context
+            for user_id, user_context in contexts.items():
+                self.context_cache.put(user_id, user_context)
+        self._observe_split(observe, 'conversation_log', time.perf_counter() - started, len(messages))
+        return results
+
+    @staticmethod
+    def _observe_split(observe: Callable[[str, float], None], stage: str, seconds: float, count: int):
+        for _ in range(count):
+            observe(stage, seconds / count)
+
+    def _respond(self, classification: MessageClassification, user_context: dict,
+                 simulate_typing: bool) -> Tuple[str, int]:
+        message = classification.text
         
         # Determine message intent
-        intent = self._determine_intent(message)
+        intent = classification.intent
         
         # Get human-like response
         human_response = self.human_generator.generate_response(intent, user_context)
         if human_response:
             # Simulate typing delay
-            self.human_generator.simulate_typing_delay(human_response)
+            if simulate_typing:
+                self.human_generator.simulate_typing_delay(human_response)
             # Make response more human-like
             human_response = self.human_generator.humanize_message(human_response, user_context)
             return human_response, 1
@@ -128,27 +308,13 @@ class DatabaseHandler:
             if response:
                 return response, -1
 
-        # Check for context-specific patterns
-        context_patterns = self._get_context_patterns(user_context['previous_messages'])
+        # First try to match with context
+        result = self.matcher.match(message, json.dumps(user_context['context']))
+        if result:
+            return result
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # First try to match with context
-            cursor.execute("""
-                SELECT response, id FROM responses 
-                WHERE ? LIKE '%' || pattern || '%'
-                AND (context IS NULL OR context = ?)
-                ORDER BY usage_count DESC, success_rate DESC
-                LIMIT 1
-            """, (message, json.dumps(user_context['context'])))
-            
-            result = cursor.fetchone()
-            if result:
-                return result[0], result[1]
-            
-            # Fallback to generic response
-            return "I understand you're asking about that. Could you provide more details so I can help you better?", -1
+        # Fallback to generic response
+        return "I understand you're asking about that. Could you provide more details so I can help you better?", -1
 
     def _handle_conversation_flow(self, message: str, user_context: dict) -> Optional[Tuple[str, int]]:
         """Handle ongoing conversation flows"""
@@ -164,83 +330,106 @@ class DatabaseHandler:
 
     def _get_context_patterns(self, previous_messages: List[str]) -> List[str]:
         """Extract context patterns from previous messages"""
-        patterns = []
-        if previous_messages:
-            # Extract key terms from previous messages
-            all_text = ' '.join(previous_messages).lower()
-            # Add your context extraction logic here
-            if 'price' in all_text:
-                patterns.append('pricing_context')
-            if 'help' in all_text:
-                patterns.append('help_context')
-        return patterns
+        if not previous_messages:
+            return []
+        return list(self.classifier.classify(' '.join(previous_messages)).context_patterns)
 
     def log_conversation(self, user_id: str, message: str, response: str):
-        """Log a conversation interaction with context"""
-        with self.db_lock:  # Add thread safety
-            user_context = self.get_user_context(user_id)
-            
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO conversations 
-                    (user_id, message, response, context)
-                    VALUES (?, ?, ?, ?)
-                """, (
-                    user_id,
-                    message,
-                    response,
-                    json.dumps(user_context['context'])
-                ))
-                conn.commit()
-
-    def learn_from_conversations(self):
-        """Analyze conversations to generate new response patterns"""
-        with sqlite3.connect(self.db_path) as conn:
+        """Queue a conversation interaction with context for the write-behind journal"""
+        user_context = self.get_user_context(user_id)
+        self.journal.append(user_id, message, response, json.dumps(user_context['context']))
+
+    def flush(self) -> int:
+        """Write queued conversations and response stats to the database now"""
+        flushed = self.journal.flush()
+        with self.connections.transaction() as conn:
+            self._write_response_stats(conn)
+        return flushed
+
+    def learn_from_conversations(self, threshold: int = 3, limit: int = 10) -> int:
+        """Learn responses for messages the bot keeps failing to answer.
+
+        Only conversations newer than the persisted watermark are read; their
+        unhandled messages are added to running counts, and a message that
+        reaches threshold gets a generic response once. Returns the number of
+        patterns added.
+        """
+        self.flush()
+        learned = 0
+        with self.connections.transaction() as conn:
             cursor = conn.cursor()
-            # Get recent conversations that weren't handled well
+            row = cursor.execute("SELECT value FROM learning_state WHERE key = 'last_conversation_id'").fetchone()
+            last_id = row[0] if row else 0
+            newest_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM conversations").fetchone()[0]
+            
+            # Rows inserted without the journal are flagged by a trigger but not hashed
+            cursor.execute("""
+                SELECT id, message FROM conversations
+                WHERE id > ? AND unhandled = 1 AND message_hash IS NULL
+            """, (last_id,))
+            cursor.executemany(
+                "UPDATE conversations SET message_hash = ? WHERE id = ?",
+                [(message_hash(message), row_id) for row_id, message in cursor.fetchall()]
+            )
+            
+            cursor.execute("""
+                INSERT INTO unhandled_counts (message_hash, message, count)
+                SELECT message_hash, MIN(message), COUNT(*) FROM conversations
+                WHERE id > ? AND id <= ? AND unhandled = 1
+                GROUP BY message_hash
+                ON CONFLICT(message_hash) DO UPDATE SET count = count + excluded.count
+            """, (last_id, newest_id))
             cursor.execute("""
-                SELECT message FROM conversations 
-                WHERE response LIKE '%still learning%'
-                GROUP BY message
-                HAVING COUNT(*) >= 3
-                LIMIT 10
-            """)
+                INSERT INTO learning_state (key, value) VALUES ('last_conversation_id', ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+            """, (newest_id,))
             
-            common_unhandled = cursor.fetchall()
-            for message in common_unhandled:
+            cursor.execute("""
+                SELECT message_hash, message FROM unhandled_counts
+                WHERE learned = 0 AND count >= ?
+                LIMIT ?
+            """, (threshold, limit))
+            for hashed, message in cursor.fetchall():
                 # Generate a new generic response for common unhandled messages
-                new_response = self._generate_generic_response(message[0])
+                new_response = self._generate_generic_response(message)
                 if new_response:
+                    pattern = message.lower()
                     cursor.execute("""
                         INSERT INTO responses (pattern, response)
                         VALUES (?, ?)
-                    """, (message[0].lower(), new_response))
-            
-            conn.commit()
+                        ON CONFLICT(pattern) DO NOTHING
+                    """, (pattern, new_response))
+                    if cursor.rowcount:
+                        # An index that is not built yet will load the row itself
+                        if self._matcher is not None:
+                            self._matcher.add(cursor.lastrowid, pattern, new_response)
+                        learned += 1
+                # Marked either way: the same message would get the same answer next time
+                cursor.execute("UPDATE unhandled_counts SET learned = 1 WHERE message_hash = ?", (hashed,))
+        return learned
+
+    def archive_conversations(self) -> int:
+        """Move conversations past the retention age into the archive partitions"""
+        self.flush()
+        return self.archive.archive()
+
+    def conversation_history(self, user_id: Optional[str] = None, since: Optional[str] = None,
+                             until: Optional[str] = None) -> Iterator[dict]:
+        """Conversations oldest first, from the archive and the live table alike"""
+        self.flush()
+        return self.archive.history(user_id, since, until)
 
     def _generate_generic_response(self, message: str) -> Optional[str]:
         """Generate a generic response based on message content"""
-        message = message.lower()
-        
-        # Simple response generation logic
-        if any(word in message for word in ['when', 'what time', 'schedule']):
-            return "Let me check that information for you. Could you please be more specific?"
-        elif any(word in message for word in ['how', 'explain']):
-            return "I'd be happy to explain that. Could you please provide more details about what you'd like to know?"
-        elif any(word in message for word in ['where', 'location']):
-            return "I can help you with location information. What specific location are you looking for?"
-        elif '?' in message:
-            return "That's a good question. Let me find the most accurate information for you."
-        
-        return None
+        question_type = self.classifier.classify(message).question_type
+        return self.GENERIC_RESPONSES.get(question_type)
 
     def update_response_stats(self, response_id: int, was_helpful: bool):
         """Update success rate for a response"""
         if response_id == -1:
             return
             
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connections.transaction() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 UPDATE responses 
@@ -248,25 +437,87 @@ class DatabaseHandler:
                     success_rate = (success_rate * usage_count + ?) / (usage_count + 1)
                 WHERE id = ?
             """, (1 if was_helpful else 0, response_id))
-            conn.commit() 
+        if self._matcher is not None:
+            self._matcher.record_usage(response_id, was_helpful)
+
+    def queue_response_stats(self, response_id: int, was_helpful: bool):
+        """Like update_response_stats, but the row is written with the next batch, flush()
+        or the journal's timed flush, at most journal_flush_interval seconds later.
+
+        The in-memory index is updated right away, so matching never sees stale stats.
+        """
+        if response_id == -1:
+            return
+        with self._stats_lock:
+            totals = self._pending_stats.setdefault(response_id, [0, 0])
+            totals[0] += 1
+            totals[1] += 1 if was_helpful else 0
+        if self._matcher is not None:
+            self._matcher.record_usage(response_id, was_helpful)
+
+    def flush_response_stats(self):
+        """Write queued response stats now; nothing happens if none are queued"""
+        with self._stats_lock:
+            if not self._pending_stats:
+                return
+        with self.connections.transaction() as conn:
+            self._write_response_stats(conn)
+
+    def _write_response_stats(self, conn: sqlite3.Connection):
+        """Apply queued stats; n uses with k helpful equal n single updates"""
+        with self._stats_lock:
+            pending, self._pending_stats = self._pending_stats, {}
+        try:
+            conn.executemany("""
+                UPDATE responses
+                SET usage_count = usage_count + ?,
+                    success_rate = (success_rate * usage_count + ?) / (usage_count + ?)
+                WHERE id = ?
+            """, [(uses, helpful, uses, response_id) for response_id, (uses, helpful) in pending.items()])
+        except Exception:
+            with self._stats_lock:
+                for response_id, (uses, helpful) in pending.items():
+                    totals = self._pending_stats.setdefault(response_id, [0, 0])
+                    totals[0] += uses
+                    totals[1] += helpful
+            raise
 
     def _determine_intent(self, message: str) -> str:
         """Determine the intent of the message"""
-        message = message.lower()
-        
-        # Greeting detection
-        if any(word in message for word in ['hi', 'hello', 'hey', 'good morning', 'good evening']):
-            return 'greeting'
-            
-        # Pricing queries
-        if any(word in message for word in ['price', 'cost', 'how much', 'pricing']):
-            return 'pricing'
-            
-        # Help requests
-        if any(word in message for word in ['help', 'support', 'assist', 'how do i']):
-            return 'help'
-            
-        return 'unknown'
+        return self.classifier.classify(message).intent
+
+    def get_thread_watermarks(self) -> Dict[str, Tuple[Optional[str], int, Optional[int]]]:
+        """Return thread_id -> (last_item_id, last_timestamp, last_activity_at)"""
+        cursor = self.connections.connection().cursor()
+        cursor.execute("""
+            SELECT thread_id, last_item_id, last_timestamp, last_activity_at
+            FROM thread_watermarks
+        """)
+        return {row[0]: (row[1], row[2], row[3]) for row in cursor.fetchall()}
+
+    def set_thread_watermark(self, thread_id: str, item_id: Optional[str], timestamp: int,
+                             last_activity_at: Optional[int] = None):
+        """Advance a thread's watermark; older timestamps never move it back"""
+        with self.connections.transaction() as conn:
+            conn.execute("""
+                INSERT INTO thread_watermarks (thread_id, last_item_id, last_timestamp, last_activity_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(thread_id) DO UPDATE SET
+                    last_item_id = CASE WHEN excluded.last_timestamp >= last_timestamp
+                                        THEN excluded.last_item_id ELSE last_item_id END,
+                    last_timestamp = MAX(last_timestamp, excluded.last_timestamp),
+                    last_activity_at = COALESCE(excluded.last_activity_at, last_activity_at),
+                    updated_at = CURRENT_TIMESTAMP
+            """, (thread_id, item_id, timestamp, last_activity_at))
+
+    def _load_responses(self) -> List[tuple]:
+        """Read every response pattern for the in-memory matcher"""
+        cursor = self.connections.connection().cursor()
+        cursor.execute("""
+            SELECT id, pattern, response, context, usage_count, success_rate
+            FROM responses
+        """)
+        return cursor.fetchall()
 
     def insert_initial_responses(self):
         """Insert initial response patterns"""
@@ -283,10 +534,16 @@ class DatabaseHandler:
             ("when", "Let me check the timing for you. What specifically would you like to know?")
         ]
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connections.transaction() as conn:
             cursor = conn.cursor()
             cursor.executemany(
                 "INSERT INTO responses (pattern, response) VALUES (?, ?)",
                 initial_responses
             )
-            conn.commit()
\ No newline at end of file
+
+    def close(self):
+        """Flush pending writes and close all database connections"""
+        self.journal.close()
+        with self.connections.transaction() as conn:
+            self._write_response_stats(conn)
+        self.connections.close()
@@ -0,0 +1,180 @@
+import random
+import time
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+class FakeInstagramError(Exception):
+    """Injected API failure"""
+
+class _FakeThread:
+    __slots__ = ('thread_id', 'user', 'items', 'last_activity_at', 'unanswered')
+
+    def __init__(self, thread_id: str, user: dict):
+        self.thread_id = thread_id
+        self.user = user
+        self.items: List[dict] = []  # Newest first, like the real API
+        self.last_activity_at = 0
+        self.unanswered: List[float] = []  # Arrival times of inbound messages without a reply yet
+
+class FakeInstagramClient:
+    """Local stand-in for instagram_private_api.Client with a synthetic inbox.
+
+    Inbound messages arrive across `threads` conversations at `message_rate`
+    per second (up to `total_messages`), generated lazily whenever the client
+    is called. Inbox and thread responses are paginated like the real API,
+    every call can be slowed by `latency` seconds, and a share `error_rate`
+    of calls fails with FakeInstagramError. Replies sent through
+    direct_v2_send are matched to the inbound messages they answer, so the
+    time to reply can be measured from the client's side.
+    """
+
+    def __init__(self, threads: int = 100, message_rate: float = 10.0, total_messages: Optional[int] = None,
+                 inbox_page_size: int = 20, thread_page_size: int = 10, latency: float = 0.0,
+                 error_rate: float = 0.0, seed: int = 42, user_id: str = 'bot'):
+        self.authenticated_user_id = user_id
+        self.message_rate = message_rate
+        self.total_messages = total_messages
+        self.inbox_page_size = inbox_page_size
+        self.thread_page_size = thread_page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = Lock()
+        self._threads = [
+            _FakeThread(f"thread-{i}", {'pk': f"user-{i}", 'username': f"user_{i}"})
+            for i in range(threads)
+        ]
+        self._by_id = {thread.thread_id: thread for thread in self._threads}
+        self._started = None
+        self._clock = 0  # Keeps item timestamps strictly increasing
+        self.generated = 0
+        self.replies = 0
+        self.reply_latencies: List[float] = []
+        self.calls: Dict[str, int] = {}
+        self.errors = 0
+
+    def start(self):
+        """Start the message clock; called implicitly by the first API call"""
+        with self._lock:
+            if self._started is None:
+                self._started = time.monotonic()
+
+    def _timestamp(self) -> int:
+        self._clock = max(self._clock + 1, int(time.time() * 1e6))
+        return self._clock
+
+    def _generate(self):
+        """Add every inbound message due since the clock started"""
+        due = int((time.monotonic() - self._started) * self.message_rate)
+        if self.total_messages is not None:
+            due = min(due, self.total_messages)
+        now = time.monotonic()
+        while self.generated < due:
+            thread = self._rng.choice(self._threads)
+            timestamp = self._timestamp()
+            thread.items.insert(0, {
+                'item_id': f"{thread.thread_id}-{self.generated}",
+                'user_id': thread.user['pk'],
+                'timestamp': str(timestamp),
+                'text': self._rng.choice(SAMPLE_MESSAGES)
+            })
+            thread.last_activity_at = timestamp
+            thread.unanswered.append(now)
+            self.generated += 1
+
+    def _call(self, endpoint: str):
+        self.start()
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.errors += 1
+                raise FakeInstagramError(f"Injected failure in {endpoint}")
+            self._generate()
+
+    def _thread_page(self, thread: _FakeThread, offset: int) -> dict:
+        items = thread.items[offset:offset + self.thread_page_size]
+        more = offset + self.thread_page_size < len(thread.items)
+        return {
+            'thread_id': thread.thread_id,
+            'pending': True,
+            'users': [thread.user],
+            'last_activity_at': thread.last_activity_at,
+            'items': [dict(item) for item in items],
+            'has_older': more,
+            'oldest_cursor': str(offset + self.thread_page_size) if more else None
+        }
+
+    def direct_v2_inbox(self, cursor: Optional[str] = None) -> dict:
+        self._call('direct_v2_inbox')
+        with self._lock:
+            active = sorted(
+                (thread for thread in self._threads if thread.items),
+                key=lambda thread: thread.last_activity_at,
+                reverse=True
+            )
+            offset = int(cursor or 0)
+            more = offset + self.inbox_page_size < len(active)
+            return {'inbox': {
+                'threads': [self._thread_page(thread, 0) for thread in active[offset:offset + self.inbox_page_size]],
+                'has_older': more,
+                'oldest_cursor': str(offset + self.inbox_page_size) if more else None
+            }}
+
+    def direct_v2_thread(self, thread_id: str, cursor: Optional[str] = None) -> dict:
+        self._call('direct_v2_thread')
+        with self._lock:
+            return {'thread': self._thread_page(self._by_id[thread_id], int(cursor or 0))}
+
+    def direct_v2_send(self, text: str, thread_ids: list) -> dict:
+        self._call('direct_v2_send')
+        now = time.monotonic()
+        with self._lock:
+            for thread_id in thread_ids:
+                thread = self._by_id[thread_id]
+                timestamp = self._timestamp()
+                thread.items.insert(0, {
+                    'item_id': f"{thread_id}-reply-{self.replies}",
+                    'user_id': self.authenticated_user_id,
+                    'timestamp': str(timestamp),
+                    'text': text
+                })
+                thread.last_activity_at = timestamp
+                # One reply answers everything that was waiting in the thread
+                self.reply_latencies.extend(now - arrived for arrived in thread.unanswered)
+                thread.unanswered.clear()
+                self.replies += 1
+        return {'status': 'ok'}
+
+    def direct_v2_indicate_activity(self, thread_id: str, activity_indicator_id: int) -> dict:
+        self._call('direct_v2_indicate_activity')
+        return {'status': 'ok'}
+
+    def answered(self) -> int:
+        """Inbound messages that have received a reply"""
+        with self._lock:
+            return len(self.reply_latencies)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'generated': self.generated,
+                'answered': len(self.reply_latencies),
+                'replies': self.replies,
+                'errors': self.errors,
+                'calls': dict(self.calls)
+            }
+
+SAMPLE_MESSAGES: Tuple[str, ...] = (
+    "hi there",
+    "what are your prices?",
+    "how much does it cost",
+    "when are you open?",
+    "where are you located",
+    "can you explain how this works",
+    "thanks!",
+    "is this still available?",
+    "do you ship internationally",
+    "hello, I have a question"
+)
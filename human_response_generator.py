@@ -39,7 +39,8 @@ class HumanResponseGenerator:
             'please': 'plz'
         }
 
-    def simulate_typing_delay(self, message: str):
+    def typing_delay(self, message: str) -> float:
+        """Seconds a person would take to type the message"""
         char_count = len(message)
         words = message.split()
         
@@ -49,7 +50,10 @@ class HumanResponseGenerator:
         if len(words) > 5:
             base_delay += random.uniform(0.5, 1.5)
             
-        time.sleep(base_delay)
+        return base_delay
+
+    def simulate_typing_delay(self, message: str):
+        time.sleep(self.typing_delay(message))
 
     def humanize_message(self, message: str, context: dict) -> str:
         words = message.split()
@@ -0,0 +1,180 @@
+from contextlib import nullcontext
+from typing import Any, AsyncIterator, Awaitable, Callable, Generator, Iterator, List, Optional, Tuple
+from inbox_sync import InboxSync, item_timestamp
+
+class InboxMessage:
+    """Compact pending-message record; supports the dict-style access handle_message uses.
+
+    first_timestamp is set on a merged burst to its first part's timestamp.
+    """
+
+    __slots__ = ('thread_id', 'user_id', 'username', 'message', 'timestamp', 'item_id', 'first_timestamp')
+
+    def __init__(self, thread_id: str, user_id: Any, username: str, message: str, timestamp: Any,
+                 item_id: Optional[str] = None, first_timestamp: Any = None):
+        self.thread_id = thread_id
+        self.user_id = user_id
+        self.username = username
+        self.message = message
+        self.timestamp = timestamp
+        self.item_id = item_id
+        self.first_timestamp = first_timestamp
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+    def __repr__(self) -> str:
+        return f"InboxMessage(thread_id={self.thread_id!r}, item_id={self.item_id!r}, timestamp={self.timestamp!r})"
+
+class InboxReader:
+    """Lazily walks inbox pages and thread pages, yielding unanswered messages.
+
+    Messages from the first inbox page are yielded before the next page is
+    requested, so handling starts while the rest of the inbox is still being
+    read and only one page is held in memory at a time.
+    """
+
+    def __init__(self, sync: InboxSync, max_thread_pages: int = 5, limiter=None, metrics=None):
+        self.sync = sync
+        self.limiter = limiter  # TokenBucket that every page request draws from
+        self.metrics = metrics  # Optional MetricsRegistry for per-page timings
+        self.max_thread_pages = max_thread_pages  # Caps history walks for threads we have never seen
+        self.inbox_pages = 0
+        self.thread_pages = 0
+
+    def iter_messages(self, api) -> Iterator[InboxMessage]:
+        walk = self._walk()
+        reply = None
+        while True:
+            try:
+                kind, request = walk.send(reply)
+            except StopIteration:
+                return
+            if kind == 'message':
+                reply = None
+                yield request
+            else:
+                self._acquire()
+                with self._timed(f"{kind}_fetch"):
+                    reply = self._call(api, kind, request)
+
+    def iter_pages(self, api) -> Iterator[List[InboxMessage]]:
+        """Same walk as iter_messages, but each inbox page's messages come as one list,
+        yielded before the next page is requested; a thread never spans two lists"""
+        page: List[InboxMessage] = []
+        walk = self._walk()
+        reply = None
+        while True:
+            try:
+                kind, request = walk.send(reply)
+            except StopIteration:
+                break
+            if kind == 'message':
+                reply = None
+                page.append(request)
+                continue
+            if kind == 'inbox' and page:
+                yield page
+                page = []
+            self._acquire()
+            with self._timed(f"{kind}_fetch"):
+                reply = self._call(api, kind, request)
+        if page:
+            yield page
+
+    async def iter_messages_async(self, api, run_blocking: Callable[..., Awaitable]) -> AsyncIterator[InboxMessage]:
+        """Same walk as iter_messages; API calls go through run_blocking(fn, *args) and
+        rate limiting awaits instead of sleeping"""
+        walk = self._walk()
+        reply = None
+        while True:
+            try:
+                kind, request = walk.send(reply)
+            except StopIteration:
+                return
+            if kind == 'message':
+                reply = None
+                yield request
+            else:
+                if self.limiter is not None:
+                    with self._timed('inbox_rate_limit_wait'):
+                        await self.limiter.acquire_async()
+                with self._timed(f"{kind}_fetch"):
+                    reply = await run_blocking(self._call, api, kind, request)
+
+    @staticmethod
+    def _call(api, kind: str, request: Tuple[Any, ...]) -> dict:
+        if kind == 'inbox':
+            cursor, = request
+            return api.direct_v2_inbox(cursor=cursor) if cursor else api.direct_v2_inbox()
+        thread_id, cursor = request
+        return api.direct_v2_thread(thread_id, cursor=cursor)
+
+    def _walk(self) -> Generator[Tuple[str, Any], Optional[dict], None]:
+        """Paging logic without I/O: yields ('inbox'|'thread', args) requests, which the
+        driver answers through send(), and ('message', InboxMessage) results"""
+        cursor = None
+        while True:
+            inbox = yield ('inbox', (cursor,))
+            self.inbox_pages += 1
+            box = inbox['inbox']
+
+            for thread in box['threads']:
+                if thread['pending'] and self.sync.thread_changed(thread):
+                    items = yield from self._unseen_items(thread)
+                    for message in self._thread_messages(thread, items):
+                        yield ('message', message)
+
+            cursor = box.get('oldest_cursor')
+            if not box.get('has_older') or not cursor:
+                return
+
+    def _thread_messages(self, thread: dict, items: List[dict]) -> Iterator[InboxMessage]:
+        user = thread['users'][0]
+        for item in self.sync.new_items(dict(thread, items=items)):
+            yield InboxMessage(
+                thread['thread_id'],
+                user['pk'],
+                user['username'],
+                item['text'] if 'text' in item else '',
+                item['timestamp'],
+                item.get('item_id')
+            )
+
+    def _unseen_items(self, thread: dict) -> Generator[Tuple[str, Any], Optional[dict], List[dict]]:
+        """Follow the thread's own cursor until the page reaches already-handled items"""
+        items = list(thread.get('items', []))
+        if not items:
+            return items
+        page = thread
+        floor = self.sync.floor(thread['thread_id'])
+        oldest = min(item_timestamp(item) for item in items)
+        # A known thread is read back to its watermark, or unfetched items would end up
+        # below it once the newer ones are handled; only unknown history is capped
+        limit = self.max_thread_pages if floor == 0 else None
+        pages = 1
+        while (oldest > floor and page.get('has_older') and page.get('oldest_cursor')
+               and (limit is None or pages < limit)):
+            page = (yield ('thread', (thread['thread_id'], page['oldest_cursor'])))['thread']
+            self.thread_pages += 1
+            pages += 1
+            older = page.get('items', [])
+            if not older:
+                break
+            items.extend(older)
+            oldest = min(oldest, min(item_timestamp(item) for item in older))
+        return items
+
+    def _acquire(self):
+        if self.limiter is not None:
+            with self._timed('inbox_rate_limit_wait'):
+                self.limiter.acquire()
+
+    def _timed(self, stage: str):
+        return self.metrics.time(stage) if self.metrics is not None else nullcontext()
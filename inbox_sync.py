@@ -0,0 +1,119 @@
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+def item_timestamp(item: dict) -> int:
+    """Instagram item timestamps are microsecond strings"""
+    try:
+        return int(item.get('timestamp') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+class InboxSync:
+    """Tracks which inbox items were already answered, per thread.
+
+    Watermarks live in the thread_watermarks table. A thread whose
+    last_activity_at matches the stored value is skipped without looking at
+    its items; otherwise only items newer than both the stored watermark and
+    anything already handed out this session are emitted.
+    """
+
+    def __init__(self, db, own_user_id: Any = None):
+        self.db = db
+        self.own_user_id = own_user_id  # Our own replies must never be answered; may be a str or an int
+        self._lock = Lock()
+        self._watermarks: Dict[str, Tuple[Optional[str], int, Optional[int]]] = db.get_thread_watermarks()
+        self._emitted: Dict[str, int] = {}  # Highest timestamp handed out but maybe not handled yet
+        self._snapshot: Dict[str, Tuple[int, Optional[int]]] = {}  # thread -> (newest timestamp, last_activity_at)
+        self.threads_skipped = 0
+        self.items_skipped = 0
+
+    def thread_changed(self, thread: dict) -> bool:
+        """False when the thread has had no activity since it was last fully handled"""
+        activity = thread.get('last_activity_at')
+        with self._lock:
+            stored = self._watermarks.get(thread['thread_id'])
+        if activity is not None and stored is not None and stored[2] == activity:
+            self.threads_skipped += 1
+            return False
+        return True
+
+    def floor(self, thread_id: str) -> int:
+        """Timestamp at or below which a thread's items are already taken care of"""
+        with self._lock:
+            stored = self._watermarks.get(thread_id, (None, 0, None))
+            return max(stored[1], self._emitted.get(thread_id, 0))
+
+    def new_items(self, thread: dict) -> List[dict]:
+        """Items newer than the watermark, oldest first; they count as in flight until marked"""
+        thread_id = thread['thread_id']
+        activity = thread.get('last_activity_at')
+        with self._lock:
+            stored = self._watermarks.get(thread_id, (None, 0, None))
+            floor = max(stored[1], self._emitted.get(thread_id, 0))
+
+            items = []
+            newest = floor
+            for item in thread.get('items', []):
+                timestamp = item_timestamp(item)
+                if timestamp <= floor:
+                    self.items_skipped += 1
+                    continue
+                newest = max(newest, timestamp)
+                # authenticated_user_id comes from a cookie (str) while items carry int ids
+                if self.own_user_id is not None and str(item.get('user_id')) == str(self.own_user_id):
+                    continue
+                items.append(item)
+            items.sort(key=item_timestamp)
+
+            if items:
+                self._emitted[thread_id] = item_timestamp(items[-1])
+                self._snapshot[thread_id] = (item_timestamp(items[-1]), activity)
+                return items
+            in_flight = self._emitted.get(thread_id, 0) > stored[1]
+
+        if not in_flight and (newest > stored[1] or activity != stored[2]):
+            # Nothing to answer (e.g. only our own replies), so remember the activity now
+            self._store(thread_id, stored[0], newest, activity)
+        return []
+
+    def release(self, message: dict):
+        """Hand this message and anything newer in its thread out again on the next poll"""
+        thread_id = message.get('thread_id')
+        # A merged burst is released from its first part
+        timestamp = item_timestamp({'timestamp': message.get('first_timestamp') or message.get('timestamp')})
+        with self._lock:
+            emitted = self._emitted.get(thread_id)
+            if emitted is not None:
+                self._emitted[thread_id] = min(emitted, timestamp - 1)
+            self._snapshot.pop(thread_id, None)
+
+    def mark_handled(self, message: dict):
+        """Advance the watermark once a message has been answered"""
+        thread_id = message.get('thread_id')
+        timestamp = item_timestamp(message)
+        if thread_id is None or not timestamp:
+            return
+        with self._lock:
+            newest, activity = self._snapshot.get(thread_id, (None, None))
+            if newest is None or timestamp < newest:
+                # Later items from this snapshot are still pending
+                activity = None
+            else:
+                self._snapshot.pop(thread_id, None)
+        self._store(thread_id, message.get('item_id'), timestamp, activity)
+
+    def _store(self, thread_id: str, item_id: Optional[str], timestamp: int, activity: Optional[int]):
+        self.db.set_thread_watermark(thread_id, item_id, timestamp, activity)
+        with self._lock:
+            old_item, old_timestamp, old_activity = self._watermarks.get(thread_id, (None, 0, None))
+            if timestamp >= old_timestamp:
+                old_item, old_timestamp = item_id, timestamp
+            self._watermarks[thread_id] = (old_item, old_timestamp, activity if activity is not None else old_activity)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'threads_tracked': len(self._watermarks),
+                'threads_skipped': self.threads_skipped,
+                'items_skipped': self.items_skipped
+            }
@@ -1,164 +1,419 @@
-from instagram_private_api import Client, ClientCompatPatch
-from typing import Dict, Any
+from typing import Dict, Any, List, NamedTuple, Optional, Callable, Iterator, Tuple
 import os
-from dotenv import load_dotenv
 import time
 import json
 from database_handler import DatabaseHandler
+from intent_classifier import MessageClassification
 import random
-from threading import Lock
+from threading import Event, Lock
+from concurrent.futures import Future
 from human_response_generator import HumanResponseGenerator
+from send_scheduler import SendScheduler
+from send_queue import OutboxEntry, PriorityOutbox, SendPolicy
+from worker_pool import ShardedWorkerPool
+from inbox_sync import InboxSync, item_timestamp
+from inbox_reader import InboxMessage, InboxReader
+from poll_scheduler import AdaptivePollScheduler
+from rate_limiter import EndpointRateLimiter
+from instagram_client import ClientFactory
+from metrics import MetricsRegistry, MetricsServer
+from background_learner import BackgroundLearner
+from message_pipeline import PlannedReply, ReplyPlanner
+from burst_coalescer import BurstCoalescer
+from session_store import SessionStore, live_client_checks, open_client
+from startup_profile import profile
 
-class RateLimiter:
-    def __init__(self, calls_per_second=1):
-        self.calls_per_second = calls_per_second
-        self.last_call = 0
-        self.lock = Lock()
+Client = None  # instagram_private_api.Client, imported by the first live connect
 
-    def wait(self):
-        with self.lock:
-            current_time = time.time()
-            time_since_last = current_time - self.last_call
-            if time_since_last < (1.0 / self.calls_per_second):
-                time.sleep((1.0 / self.calls_per_second) - time_since_last)
-            self.last_call = time.time()
+class _Outgoing(NamedTuple):
+    typing_duration: float
+    start: Callable[[OutboxEntry, float], None]  # Schedules typing and the send for the reserved send time
+    result: Future
+
+def _live_client() -> ClientFactory:
+    global Client
+    if Client is None:
+        with profile.phase('import instagram_private_api'):
+            from instagram_private_api import Client
+    return Client
 
 class InstagramMessageAPI:
-    def __init__(self):
-        load_dotenv()
-        self.username = os.getenv('INSTAGRAM_USERNAME')
-        self.password = os.getenv('INSTAGRAM_PASSWORD')
+    def __init__(self, worker_count: int = 4, worker_queue_size: int = 100,
+                 client_factory: Optional[ClientFactory] = None, db_path: str = "instagram_bot.db",
+                 rate_limits: Optional[Dict[str, Tuple[float, int]]] = None,
+                 username: Optional[str] = None, password: Optional[str] = None,
+                 session_path: Optional[str] = None, burst_window: float = 5.0,
+                 send_policies: Optional[Dict[str, SendPolicy]] = None):
+        if username is None or password is None:
+            with profile.phase('load .env'):
+                from dotenv import load_dotenv
+                load_dotenv()
+        # Explicit credentials let one process host a single account of many
+        self.username = username or os.getenv('INSTAGRAM_USERNAME')
+        self.password = password or os.getenv('INSTAGRAM_PASSWORD')
+        self.client_factory = client_factory  # Swap in a fake client for local load tests
         self.api = None
-        self.db = DatabaseHandler()
-        self.last_message_time = 0
-        self.message_lock = Lock()
+        # The live client's session is cached next to its database, so restarts
+        # and reconnects skip the password login while Instagram still accepts it
+        if session_path is None and client_factory is None and db_path != ":memory:":
+            session_path = f"{os.path.splitext(db_path)[0]}.session.json"
+        self.session_store = SessionStore(session_path) if session_path else None
         self.human_generator = HumanResponseGenerator()
-        self.rate_limiter = RateLimiter(calls_per_second=1)
-        self.connect()
+        with profile.phase('database'):
+            self.db = DatabaseHandler(db_path=db_path, human_generator=self.human_generator)
+        with profile.phase('components'):
+            self.inbox_sync = InboxSync(self.db)
+            self.last_message_time = 0
+            self.message_lock = Lock()
+            # Inbox reads, typing indicators and sends each have their own token bucket
+            self.rate_limiter = EndpointRateLimiter(rate_limits)
+            self.metrics = MetricsRegistry()
+            self.metrics_server = None
+            self.planner = ReplyPlanner(self.db, self.human_generator, self.metrics)
+            # Learning runs hourly on its own thread, never on the message path
+            self.learner = BackgroundLearner(self.db, interval=3600.0, metrics=self.metrics)
+            self.inbox_reader = InboxReader(self.inbox_sync, limiter=self.rate_limiter['inbox'], metrics=self.metrics)
+            self.send_scheduler = SendScheduler()
+            # Once sends are rate limited, replies closest to their per-intent SLA go first
+            self.outbox = PriorityOutbox(send_policies)
+            self._dispatch_due: Optional[float] = None
+            self.poll_scheduler = AdaptivePollScheduler(self.rate_limiter['inbox'], min_interval=5.0, max_interval=60.0)
+            # Messages sent within burst_window of each other get one reply; 0 answers each one
+            self.coalescer = BurstCoalescer(quiet_window=burst_window)
+            # Each inbox page is split into one batch per shard of thread_ids: a
+            # conversation stays in order, different conversations run in parallel
+            self.workers = ShardedWorkerPool(
+                lambda batch: self.handle_messages(batch),
+                num_workers=worker_count,
+                queue_size=worker_queue_size,
+                name="message-worker"
+            )
+            self._stop_requested = Event()
+        with profile.phase('connect'):
+            self.connect()
 
     def connect(self):
         """Establish connection to Instagram"""
         try:
-            self.api = Client(self.username, self.password)
-            print("Successfully connected to Instagram")
+            if self.client_factory is None:
+                factory, checks = _live_client(), live_client_checks()
+            else:
+                factory, checks = self.client_factory, {}
+            self.api, reused, seconds = open_client(
+                factory, self.username, self.password, self.session_store, **checks
+            )
+            self.inbox_sync.own_user_id = getattr(self.api, 'authenticated_user_id', None)
+            self.metrics.observe('connect', seconds)
+            self.metrics.inc('session_reuses' if reused else 'logins')
+            print(f"Successfully connected to Instagram in {seconds:.2f}s "
+                  f"({'cached session' if reused else 'full login'})")
         except Exception as e:
             print(f"Failed to connect to Instagram: {str(e)}")
             raise
 
-    def get_pending_messages(self) -> list:
-        """Fetch pending direct messages"""
+    def iter_pending_pages(self) -> Iterator[List[InboxMessage]]:
+        """Stream unanswered pending messages one inbox page at a time"""
         try:
-            inbox = self.api.direct_v2_inbox()
-            threads = inbox['inbox']['threads']
-            pending_messages = []
-            
-            for thread in threads:
-                if thread['pending']:
-                    messages = thread['items']
-                    for message in messages:
-                        pending_messages.append({
-                            'thread_id': thread['thread_id'],
-                            'user_id': thread['users'][0]['pk'],
-                            'username': thread['users'][0]['username'],
-                            'message': message['text'] if 'text' in message else '',
-                            'timestamp': message['timestamp']
-                        })
-            
-            return pending_messages
+            for page in self.inbox_reader.iter_pages(self.api):
+                self.metrics.inc('messages_fetched', len(page))
+                yield page
         except Exception as e:
+            self.metrics.inc('fetch_errors')
             print(f"Error fetching messages: {str(e)}")
-            return []
 
-    def send_message(self, thread_id: str, message: str) -> bool:
-        """Send a message with rate limiting"""
-        try:
-            self.rate_limiter.wait()
-            with self.message_lock:
-                current_time = time.time()
-                time_since_last = current_time - self.last_message_time
-                
-                if time_since_last < 1:
-                    time.sleep(1 - time_since_last)
+    def iter_pending_messages(self) -> Iterator[InboxMessage]:
+        """Stream unanswered pending messages page by page"""
+        for page in self.iter_pending_pages():
+            yield from page
+
+    def get_pending_messages(self) -> list:
+        """Fetch pending direct messages that have not been answered yet"""
+        return list(self.iter_pending_messages())
 
-                # Start typing indicator
+    def queue_message(self, thread_id: str, message: str, delay: float = 0.0,
+                      callback: Optional[Callable[[Optional[bool]], None]] = None,
+                      sla_class: str = 'unknown', message_age: float = 0.0) -> Future:
+        """Schedule typing on, send and typing off without blocking the caller.
+
+        After the thinking delay the reply waits in the outbox, which gives
+        each send token to the reply closest to its SLA deadline. Returns a
+        Future that resolves to True once the message is sent, False if the
+        send failed, or None if the outbox dropped it as stale. A failed typing
+        indicator is counted but does not stop the send.
+        The API calls run on the send scheduler's executor, so a slow request
+        only holds up its own conversation.
+        """
+        result = Future()
+        if callback:
+            result.add_done_callback(lambda done: callback(done.result()))
+
+        typing_duration = len(message) / random.uniform(30, 80)
+        queued_at = time.monotonic()
+        typing = False  # Whether the indicator went on and has to be turned off
+        self.metrics.observe('typing', delay + typing_duration)
+
+        def start(entry: OutboxEntry, send_at: float):
+            self.metrics.observe('send_rate_limit_wait', max(0.0, send_at - entry.queued_at - typing_duration))
+            self.send_scheduler.call_at(send_at - typing_duration, lambda: start_typing(entry, send_at))
+
+        def start_typing(entry: OutboxEntry, send_at: float):
+            if not self._activity_allowed(lambda: start_typing(entry, send_at)):
+                return
+            self.send_scheduler.run_blocking(lambda: typing_on(entry, send_at))
+
+        def typing_on(entry: OutboxEntry, send_at: float):
+            nonlocal typing
+            try:
                 self.api.direct_v2_indicate_activity(
                     thread_id=thread_id,
                     activity_indicator_id=1
                 )
+                typing = True
+            except Exception as e:
+                # The send token is already reserved; send without the indicator rather than waste it
+                print(f"Error starting typing indicator: {str(e)}")
+                self.metrics.inc('typing_failed')
+            self.send_scheduler.call_at(send_at, lambda: send(entry), blocking=True)
 
-                # Simulate typing
-                char_count = len(message)
-                typing_duration = char_count / random.uniform(30, 80)
-                time.sleep(typing_duration)
+        def send(entry: OutboxEntry):
+            try:
+                with self.metrics.time('send'):
+                    self.api.direct_v2_send(
+                        text=message,
+                        thread_ids=[thread_id]
+                    )
+                with self.message_lock:
+                    self.last_message_time = time.time()
+            except Exception as e:
+                print(f"Error sending message: {str(e)}")
+                self.metrics.inc('sends_failed')
+                self.outbox.record_failed(entry)
+                self.metrics.inc('sla_missed')
+                result.set_result(False)
+                return
+            finally:
+                # Stop typing indicator after a short delay, whether or not the send worked
+                if typing:
+                    self.send_scheduler.call_later(random.uniform(0.5, 1.5), stop_typing)
+            print(f"Message sent: {message[:30]}...")
+            self.metrics.inc('sends')
+            self.metrics.inc('sla_missed' if self.outbox.record_sent(entry) else 'sla_met')
+            self.metrics.observe('reply', time.monotonic() - queued_at)
+            result.set_result(True)
 
-                # Send message
-                self.api.direct_v2_send(
-                    text=message,
-                    thread_ids=[thread_id]
-                )
+        def stop_typing():
+            if not self._activity_allowed(stop_typing):
+                return
+            self.send_scheduler.run_blocking(lambda: self.api.direct_v2_indicate_activity(
+                thread_id=thread_id,
+                activity_indicator_id=0
+            ))
 
-                self.last_message_time = time.time()
+        def enqueue():
+            # The message has aged by the thinking delay too
+            self.outbox.push(_Outgoing(typing_duration, start, result), sla_class, message_age + delay)
+            self._dispatch()
 
-                # Stop typing indicator after a short delay
-                time.sleep(random.uniform(0.5, 1.5))
-                self.api.direct_v2_indicate_activity(
-                    thread_id=thread_id,
-                    activity_indicator_id=0
-                )
+        self.send_scheduler.call_at(queued_at + delay, enqueue)
+        return result
+
+    def _dispatch(self):
+        """Hand send tokens to the outbox's most urgent replies; runs on the send scheduler.
+
+        A reply is taken out of the outbox only when its typing has to start
+        for the next free token, so a more urgent reply arriving meanwhile
+        still goes first.
+        """
+        bucket = self.rate_limiter['send']
+        while True:
+            now = time.monotonic()
+            dropped, downgraded = self.outbox.expire(now)
+            for entry in dropped:
+                entry.item.result.set_result(None)
+            if dropped:
+                self.metrics.inc('replies_dropped_stale', len(dropped))
+            if downgraded:
+                self.metrics.inc('replies_downgraded', len(downgraded))
+
+            entry = self.outbox.peek()
+            if entry is None:
+                return
+            free_at = bucket.next_available()
+            typing_at = free_at - entry.item.typing_duration
+            if typing_at > now:
+                self._wake_dispatcher(typing_at)
+                return
+            self.outbox.pop()
+            self.metrics.observe('send_queue_delay', now - entry.queued_at)
+            # A reply that should have started typing already types for less and takes
+            # the next free token; sending it after a full typing time would waste tokens
+            entry.item.start(entry, bucket.reserve(free_at if free_at > now else now + entry.item.typing_duration))
+
+    def _wake_dispatcher(self, due: float):
+        if self._dispatch_due is not None and self._dispatch_due <= due:
+            return  # An earlier wake-up re-checks anyway
+
+        def wake():
+            if self._dispatch_due == due:
+                self._dispatch_due = None
+            self._dispatch()
 
-                print(f"Message sent: {message[:30]}...")
-                return True
+        self._dispatch_due = due
+        self.send_scheduler.call_at(due, wake)
 
+    def _activity_allowed(self, step: Callable[[], None]) -> bool:
+        """Take an activity token, or put the step back on the scheduler until one is free"""
+        bucket = self.rate_limiter['activity']
+        if bucket.try_acquire():
+            return True
+        self.send_scheduler.call_at(bucket.next_available(), step)
+        return False
+
+    def send_message(self, thread_id: str, message: str) -> bool:
+        """Send a message with rate limiting and wait for the result"""
+        try:
+            return bool(self.queue_message(thread_id, message).result())
         except Exception as e:
             print(f"Error sending message: {str(e)}")
             return False
 
+    def coalesce(self, messages: List[InboxMessage]) -> List[InboxMessage]:
+        """Merge bursts; messages of a burst still in progress are fetched again next poll"""
+        ready, deferred = self.coalescer.coalesce(messages)
+        released = set()
+        for message in deferred:
+            if message['thread_id'] not in released:  # Oldest deferred item of the thread
+                self.inbox_sync.release(message)
+                released.add(message['thread_id'])
+        merged = len(messages) - len(deferred) - len(ready)
+        if merged:
+            self.metrics.inc('messages_coalesced', merged)
+        return ready
+
+    def submit_batches(self, messages: List[InboxMessage]):
+        """Queue messages on the workers as one batch per shard, each planned by handle_messages.
+
+        A full worker queue blocks the caller, which is the backpressure on polling.
+        """
+        batches: Dict[int, List[InboxMessage]] = {}
+        for message in messages:
+            batches.setdefault(self.workers.shard(message['thread_id']), []).append(message)
+        for batch in batches.values():
+            self.workers.submit(batch[0]['thread_id'], batch)
+
+    def handle_messages(self, messages: List[InboxMessage]) -> None:
+        """Plan replies for a batch of messages in one database batch, then schedule the sends.
+
+        Replies are planned in inbox order, so a conversation's messages are
+        answered in order; sending is asynchronous, as in handle_message.
+        The message loop calls this on the workers with one batch per shard.
+        """
+        try:
+            with self.metrics.time('handle_batch'):
+                replies = self.planner.plan_batch(messages)
+        except Exception:
+            for message_data in messages:
+                self.inbox_sync.release(message_data)
+                self.poll_scheduler.reply_abandoned(message_data['thread_id'])
+            raise
+        for message_data, reply in zip(messages, replies):
+            self._queue_reply(message_data, reply, self.db.queue_response_stats)
+        self.metrics.inc('messages_handled', len(messages))
+
+    def _queue_reply(self, message_data: Dict[str, Any], reply: PlannedReply,
+                     record: Callable[[int, bool], None]) -> Future:
+        timestamp = item_timestamp(message_data)
+        age = max(0.0, time.time() - timestamp / 1e6) if timestamp else 0.0
+        return self.queue_message(reply.thread_id, reply.text, delay=reply.think_delay,
+                                  callback=self._record_outcome(message_data, reply, record),
+                                  sla_class=reply.sla_class, message_age=age)
+
+    def _record_outcome(self, message_data: Dict[str, Any], reply: PlannedReply,
+                        record: Callable[[int, bool], None]) -> Callable[[Optional[bool]], None]:
+        """The watermark only moves past a message once its reply is sent; a failed send
+        hands the message out again on the next poll"""
+        def on_sent(success: Optional[bool]):
+            if success is False:
+                self.inbox_sync.release(message_data)
+            else:
+                self.inbox_sync.mark_handled(message_data)
+            if success is None:
+                self.poll_scheduler.reply_abandoned(reply.thread_id)
+                return  # Dropped as stale; says nothing about the response itself
+            record(reply.response_id, success)
+            if success:
+                self.poll_scheduler.reply_sent(reply.thread_id)
+            else:
+                self.poll_scheduler.reply_abandoned(reply.thread_id)
+        return on_sent
+
     def handle_message(self, message_data: Dict[str, Any]) -> None:
         """Handle incoming messages"""
-        message_text = message_data['message'].lower()
-        thread_id = message_data['thread_id']
-        user_id = message_data['user_id']
-        
-        user_context = self.db.get_user_context(user_id)
-        self._update_context(user_id, message_text, user_context)
-        
-        response, response_id = self.db.find_best_response(message_text, user_id)
-        self.db.log_conversation(user_id, message_text, response)
-        
-        success = self.send_message(thread_id, response)
-        self.db.update_response_stats(response_id, success)
-        
-        if time.time() % 3600 < 60:  # Learn every hour
-            self.db.learn_from_conversations()
+        with self.metrics.time('handle_message'):
+            try:
+                reply = self.planner.plan(message_data)
+            except Exception:
+                self.inbox_sync.release(message_data)
+                self.poll_scheduler.reply_abandoned(message_data['thread_id'])
+                raise
 
-    def _update_context(self, user_id: str, message: str, current_context: dict):
+            self._queue_reply(message_data, reply, self.db.update_response_stats)
+            self.metrics.inc('messages_handled')
+
+    def _update_context(self, user_id: str, message: str, current_context: dict,
+                        classification: Optional[MessageClassification] = None):
         """Update user context"""
-        context = current_context['context']
-        state = 'initial'
-        
-        if 'price' in message.lower():
-            context['topic'] = 'pricing'
-            state = 'awaiting_details'
-        elif 'help' in message.lower():
-            context['topic'] = 'support'
-            state = 'follow_up'
-        elif any(word in message.lower() for word in ['thanks', 'thank you', 'bye']):
-            state = 'closing'
-        
-        self.db.update_user_context(user_id, context, state, message)
+        self.planner.update_context(user_id, message, current_context, classification)
 
-    def start_message_loop(self, check_interval: int = 60):
-        """Start the message monitoring loop"""
+    def serve_metrics(self, port: int = 9108, summary_interval: Optional[float] = 300.0) -> Optional[MetricsServer]:
+        """Expose stage histograms at http://127.0.0.1:<port>/metrics and log a periodic summary.
+
+        Returns None, and the bot runs without metrics, if the port cannot be bound.
+        """
+        if self.metrics_server is None:
+            try:
+                self.metrics_server = MetricsServer(self.metrics, port=port, summary_interval=summary_interval)
+            except OSError as e:
+                print(f"Metrics disabled, cannot listen on port {port}: {str(e)}")
+        return self.metrics_server
+
+    def stop(self):
+        """Ask start_message_loop to return after the current poll"""
+        self._stop_requested.set()
+
+    def shutdown(self):
+        """Drain workers, finish scheduled sends, flush pending writes, release the database and cache the session"""
+        self.workers.shutdown()
+        self.send_scheduler.close()
+        self.learner.close()
+        self.db.close()
+        if self.session_store is not None and self.api is not None:
+            self.session_store.save_client(self.api)
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+
+    def start_message_loop(self, check_interval: Optional[float] = None):
+        """Start the message monitoring loop; check_interval caps the idle poll interval"""
         print("Starting message monitoring...")
+        if check_interval is not None:
+            self.poll_scheduler.max_interval = max(check_interval, self.poll_scheduler.min_interval)
         consecutive_errors = 0
         
-        while True:
+        while not self._stop_requested.is_set():
             try:
-                messages = self.get_pending_messages()
-                for message in messages:
-                    self.handle_message(message)
+                # Workers plan each page in one database batch per shard while
+                # later pages are fetched, so only about a page is held at a time;
+                # a thread never spans two pages, so its bursts are merged whole
+                found = 0
+                for page in self.iter_pending_pages():
+                    for message in page:
+                        self.poll_scheduler.message_seen(message['thread_id'], message['timestamp'])
+                    self.submit_batches(self.coalesce(page))
+                    found += len(page)
+                self.workers.join()  # Finish this poll before fetching the inbox again
                 consecutive_errors = 0  # Reset error count on success
-                time.sleep(check_interval)
+                # A stop request (SIGTERM under the supervisor) ends the wait at once
+                self.poll_scheduler.wait_for_poll(self.poll_scheduler.record_poll(found), self._stop_requested)
                 
             except Exception as e:
                 consecutive_errors += 1
@@ -173,4 +428,4 @@ class InstagramMessageAPI:
                     except Exception as conn_error:
                         print(f"Reconnection failed: {str(conn_error)}")
                         
-                time.sleep(min(check_interval * consecutive_errors, 300))  # Exponential backoff up to 5 minutes
\ No newline at end of file
+                self._stop_requested.wait(min(self.poll_scheduler.max_interval * consecutive_errors, 300))  # Exponential backoff up to 5 minutes
\ No newline at end of file
@@ -0,0 +1,21 @@
+from typing import Any, Callable, Optional, Protocol
+
+class InstagramClient(Protocol):
+    """The part of instagram_private_api.Client the bot talks to.
+
+    InstagramMessageAPI accepts any object with these methods, so a local
+    fake can stand in for a live account.
+    """
+
+    authenticated_user_id: Any
+
+    def direct_v2_inbox(self, cursor: Optional[str] = None) -> dict: ...
+
+    def direct_v2_thread(self, thread_id: str, cursor: Optional[str] = None) -> dict: ...
+
+    def direct_v2_send(self, text: str, thread_ids: list) -> dict: ...
+
+    def direct_v2_indicate_activity(self, thread_id: str, activity_indicator_id: int) -> dict: ...
+
+# Builds a logged-in client from (username, password)
+ClientFactory = Callable[[Optional[str], Optional[str]], InstagramClient]
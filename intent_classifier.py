@@ -0,0 +1,108 @@
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Keywords are whole words or phrases; a trailing '*' also matches longer words
+# starting with that stem ('price*' matches 'prices'). Matching on word
+# boundaries keeps 'hi' from firing inside 'this' or 'which'.
+#
+# Each table is checked in order and the first matching row wins, except for
+# CONTEXT_PATTERNS where every matching row contributes.
+INTENTS = (
+    ('greeting', ('hi', 'hello', 'hey', 'good morning', 'good evening')),
+    ('pricing', ('price*', 'pricing', 'cost*', 'how much')),
+    ('help', ('help*', 'support*', 'assist*', 'how do i')),
+)
+
+# (keywords, topic, conversation state)
+TOPICS = (
+    (('price*', 'pricing'), 'pricing', 'awaiting_details'),
+    (('help*',), 'support', 'follow_up'),
+    (('thanks', 'thank you', 'bye'), None, 'closing'),
+)
+
+CONTEXT_PATTERNS = (
+    ('pricing_context', ('price*', 'pricing')),
+    ('help_context', ('help*',)),
+)
+
+QUESTION_TYPES = (
+    ('schedule', ('when', 'what time', 'schedule*')),
+    ('explain', ('how', 'explain*')),
+    ('location', ('where', 'location*')),
+)
+
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+class MessageClassification(NamedTuple):
+    text: str  # Lowercased message
+    intent: str
+    topic: Optional[str]
+    state: str
+    context_patterns: Tuple[str, ...]
+    question_type: Optional[str]  # 'schedule', 'explain', 'location', 'question' or None
+
+class IntentClassifier:
+    """Classifies a message against every keyword table in a single token pass"""
+
+    def __init__(self):
+        self._rules: List[Tuple[str, int]] = []  # rule id -> (table, row index)
+        self._phrases: Dict[Tuple[str, ...], List[int]] = {}
+        self._stems: Dict[str, List[int]] = {}
+        tables = {
+            'intent': [keywords for _, keywords in INTENTS],
+            'topic': [keywords for keywords, _, _ in TOPICS],
+            'context': [keywords for _, keywords in CONTEXT_PATTERNS],
+            'question': [keywords for _, keywords in QUESTION_TYPES],
+        }
+        for table, rows in tables.items():
+            for row, keywords in enumerate(rows):
+                rule_id = len(self._rules)
+                self._rules.append((table, row))
+                for keyword in keywords:
+                    if keyword.endswith('*'):
+                        self._stems.setdefault(keyword[:-1], []).append(rule_id)
+                    else:
+                        self._phrases.setdefault(tuple(keyword.split()), []).append(rule_id)
+        self._stem_lengths = sorted({len(stem) for stem in self._stems})
+        self._max_phrase = max(len(phrase) for phrase in self._phrases)
+
+    def _matched_rules(self, tokens: List[str]) -> set:
+        matched = set()
+        phrases, stems = self._phrases, self._stems
+        for i, token in enumerate(tokens):
+            for length in range(1, self._max_phrase + 1):
+                if i + length > len(tokens):
+                    break
+                rule_ids = phrases.get(tuple(tokens[i:i + length]))
+                if rule_ids:
+                    matched.update(rule_ids)
+            for length in self._stem_lengths:
+                if length > len(token):
+                    break
+                rule_ids = stems.get(token[:length])
+                if rule_ids:
+                    matched.update(rule_ids)
+        return matched
+
+    def classify(self, message: str) -> MessageClassification:
+        """Classify the message once for every stage of the pipeline"""
+        text = message.lower()
+        matched = self._matched_rules(TOKEN_RE.findall(text))
+        rows: Dict[str, List[int]] = {'intent': [], 'topic': [], 'context': [], 'question': []}
+        for rule_id in matched:
+            table, row = self._rules[rule_id]
+            rows[table].append(row)
+
+        intent = INTENTS[min(rows['intent'])][0] if rows['intent'] else 'unknown'
+        topic, state = None, 'initial'
+        if rows['topic']:
+            _, topic, state = TOPICS[min(rows['topic'])]
+        context_patterns = tuple(CONTEXT_PATTERNS[row][0] for row in sorted(rows['context']))
+        if rows['question']:
+            question_type = QUESTION_TYPES[min(rows['question'])][0]
+        elif '?' in text:
+            question_type = 'question'
+        else:
+            question_type = None
+
+        return MessageClassification(text, intent, topic, state, context_patterns, question_type)
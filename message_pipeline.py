@@ -0,0 +1,70 @@
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+from intent_classifier import MessageClassification
+from send_queue import sla_class
+
+class PlannedReply(NamedTuple):
+    thread_id: str
+    user_id: Any
+    text: str
+    response_id: int
+    think_delay: float  # Pause before typing starts, on top of the typing time
+    sla_class: str = 'unknown'  # Picks the outbox's SendPolicy
+
+class ReplyPlanner:
+    """The blocking part of handling a message: classify, update the context,
+    pick a response and log the exchange.
+
+    Shared by the threaded InstagramMessageAPI and the asyncio engine, which
+    runs plan() on its executor in a single hop.
+    """
+
+    def __init__(self, db, human_generator, metrics):
+        self.db = db
+        self.human_generator = human_generator
+        self.metrics = metrics
+
+    def plan(self, message_data: Dict[str, Any]) -> PlannedReply:
+        with self.metrics.time('classify'):
+            classification = self.db.classifier.classify(message_data['message'])
+        message_text = classification.text
+        user_id = message_data['user_id']
+
+        with self.metrics.time('context_lookup'):
+            user_context = self.db.get_user_context(user_id)
+            self.update_context(user_id, message_text, user_context, classification)
+
+        with self.metrics.time('response_match'):
+            response, response_id = self.db.find_best_response(
+                message_text, user_id, classification, simulate_typing=False
+            )
+        with self.metrics.time('conversation_log'):
+            self.db.log_conversation(user_id, message_text, response)
+
+        # Known intents get a human-style reply, which comes with a thinking pause
+        think_delay = self.human_generator.typing_delay(response) if classification.intent != 'unknown' else 0.0
+        return PlannedReply(message_data['thread_id'], user_id, response, response_id, think_delay,
+                            sla_class(classification))
+
+    def plan_batch(self, messages: Sequence[Dict[str, Any]]) -> List[PlannedReply]:
+        """plan() for a batch of messages through DatabaseHandler.find_best_responses"""
+        with self.metrics.time('plan_batch'):
+            results = self.db.find_best_responses([(m['user_id'], m['message']) for m in messages],
+                                                  observe=self.metrics.observe)
+        replies = []
+        for message_data, (response, response_id, classification) in zip(messages, results):
+            think_delay = self.human_generator.typing_delay(response) if classification.intent != 'unknown' else 0.0
+            replies.append(PlannedReply(message_data['thread_id'], message_data['user_id'], response, response_id,
+                                        think_delay, sla_class(classification)))
+        return replies
+
+    def update_context(self, user_id: str, message: str, current_context: dict,
+                       classification: Optional[MessageClassification] = None):
+        """Store the message's topic and state in the user's context"""
+        if classification is None:
+            classification = self.db.classifier.classify(message)
+        context = current_context['context']
+
+        if classification.topic:
+            context['topic'] = classification.topic
+
+        self.db.update_user_context(user_id, context, classification.state, message)
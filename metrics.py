@@ -0,0 +1,164 @@
+import bisect
+import time
+from contextlib import contextmanager
+from threading import Event, Lock, Thread
+from typing import Dict, Optional, Tuple
+
+# Upper bounds in seconds, from cache hits up to typing delays and slow API calls
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and three adds under a lock"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self) -> Tuple[list, int, float]:
+        with self._lock:
+            return list(self.counts), self.count, self.sum
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation"""
+        counts, count, _ = self.snapshot()
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+class MetricsRegistry:
+    """Per-stage latency histograms and named counters for the message pipeline.
+
+    Stages share one metric, bot_stage_seconds, labelled by stage, so the
+    time of a slow reply can be split into inbox fetch, context lookup,
+    matching, logging, rate limiter wait, typing and the send itself.
+    """
+
+    def __init__(self, namespace: str = "bot"):
+        self.namespace = namespace
+        self._stages: Dict[str, Histogram] = {}
+        self._counters: Dict[str, int] = {}
+        self._lock = Lock()
+
+    def stage(self, name: str) -> Histogram:
+        histogram = self._stages.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(name, Histogram())
+        return histogram
+
+    def observe(self, stage: str, seconds: float):
+        self.stage(stage).observe(seconds)
+
+    @contextmanager
+    def time(self, stage: str):
+        """Record how long the block takes, even when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage(stage).observe(time.perf_counter() - started)
+
+    def inc(self, counter: str, amount: int = 1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def counter(self, counter: str) -> int:
+        with self._lock:
+            return self._counters.get(counter, 0)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            stages = sorted(self._stages.items())
+            counters = sorted(self._counters.items())
+
+        name = f"{self.namespace}_stage_seconds"
+        lines = [f"# HELP {name} Time spent in each stage of the message pipeline", f"# TYPE {name} histogram"]
+        for stage, histogram in stages:
+            counts, count, total = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+
+        for counter, value in counters:
+            counter_name = f"{self.namespace}_{counter}_total"
+            lines.append(f"# TYPE {counter_name} counter")
+            lines.append(f"{counter_name} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        """One line with count, mean and p95 for every stage"""
+        with self._lock:
+            stages = sorted(self._stages.items())
+        parts = []
+        for stage, histogram in stages:
+            _, count, total = histogram.snapshot()
+            if count:
+                parts.append(f"{stage} n={count} mean={total / count * 1000:.1f}ms p95<={histogram.quantile(0.95) * 1000:g}ms")
+        return "Metrics: " + ("; ".join(parts) if parts else "no samples yet")
+
+class MetricsServer:
+    """Serves /metrics on a local port and prints the summary line periodically"""
+
+    def __init__(self, registry: MetricsRegistry, port: int = 9108, host: str = "127.0.0.1",
+                 summary_interval: Optional[float] = 300.0):
+        self.registry = registry
+        self.summary_interval = summary_interval
+        self._stopped = Event()
+        # Imported here so processes that never serve metrics do not load http.server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split('?')[0] != '/metrics':
+                    handler.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                pass  # Scrapes would flood the console
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._threads = [Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)]
+        if summary_interval:
+            self._threads.append(Thread(target=self._log_summaries, name="metrics-summary", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def _log_summaries(self):
+        while not self._stopped.wait(self.summary_interval):
+            print(self.registry.summary())
+
+    def close(self):
+        self._stopped.set()
+        self._server.shutdown()
+        self._server.server_close()
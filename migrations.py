@@ -0,0 +1,204 @@
+import json
+import sqlite3
+from typing import Callable, List, Tuple
+from conversation_journal import is_unhandled, message_hash
+
+HISTORY_WINDOW = 5  # Messages kept per user in message_history
+
+def _columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def _initial_schema(conn: sqlite3.Connection):
+    """Tables as setup_database created them before migrations existed"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            message TEXT NOT NULL,
+            response TEXT NOT NULL,
+            context TEXT,
+            was_helpful BOOLEAN DEFAULT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_contexts (
+            user_id TEXT PRIMARY KEY,
+            context TEXT,
+            last_interaction TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            conversation_state TEXT,
+            previous_messages TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS responses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pattern TEXT NOT NULL,
+            response TEXT NOT NULL,
+            context TEXT,
+            usage_count INTEGER DEFAULT 0,
+            success_rate FLOAT DEFAULT 0.0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Per-thread high-watermarks for incremental inbox sync
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS thread_watermarks (
+            thread_id TEXT PRIMARY KEY,
+            last_item_id TEXT,
+            last_timestamp INTEGER NOT NULL DEFAULT 0,
+            last_activity_at INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def _unhandled_flag_and_indexes(conn: sqlite3.Connection, batch_size: int = 10000):
+    """Flag unhandled conversations at insert time and index the real access paths"""
+    columns = _columns(conn, 'conversations')
+    if 'unhandled' not in columns:
+        conn.execute("ALTER TABLE conversations ADD COLUMN unhandled BOOLEAN")
+    if 'message_hash' not in columns:
+        conn.execute("ALTER TABLE conversations ADD COLUMN message_hash INTEGER")
+
+    # Backfill existing rows in batches so large files do not build one huge update list
+    last_id = 0
+    while True:
+        rows = conn.execute("""
+            SELECT id, message, response FROM conversations
+            WHERE id > ? AND (unhandled IS NULL OR message_hash IS NULL)
+            ORDER BY id LIMIT ?
+        """, (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        conn.executemany(
+            "UPDATE conversations SET unhandled = ?, message_hash = ? WHERE id = ?",
+            [(is_unhandled(response), message_hash(message), row_id) for row_id, message, response in rows]
+        )
+        last_id = rows[-1][0]
+
+    # Rows written without the flag (older code, manual inserts) still get it
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS conversations_flag_unhandled
+        AFTER INSERT ON conversations
+        WHEN NEW.unhandled IS NULL
+        BEGIN
+            UPDATE conversations
+            SET unhandled = (NEW.response LIKE '%still learning%')
+            WHERE id = NEW.id;
+        END
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_user_time ON conversations (user_id, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_time ON conversations (timestamp)")
+    # Learning only ever looks at unhandled rows, grouped by message
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_conversations_unhandled
+        ON conversations (message_hash) WHERE unhandled = 1
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_contexts_last_interaction ON user_contexts (last_interaction)")
+
+def _learning_state(conn: sqlite3.Connection):
+    """Watermark and running counts for the incremental learner, and one row per pattern"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS learning_state (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS unhandled_counts (
+            message_hash INTEGER PRIMARY KEY,
+            message TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            learned BOOLEAN NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_unhandled_counts_pending ON unhandled_counts (count) WHERE learned = 0")
+    # The old learner could insert the same pattern many times; keep the first copy
+    conn.execute("""
+        DELETE FROM responses
+        WHERE id NOT IN (SELECT MIN(id) FROM responses GROUP BY pattern)
+    """)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_responses_pattern ON responses (pattern)")
+
+def _archive_tables(conn: sqlite3.Connection):
+    """Registry of archived partitions and per-day totals that outlive the archived rows"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archive_partitions (
+            partition TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            row_count INTEGER NOT NULL DEFAULT 0,
+            first_timestamp TIMESTAMP,
+            last_timestamp TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_summary (
+            day TEXT PRIMARY KEY,
+            conversations INTEGER NOT NULL DEFAULT 0,
+            unhandled INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+def _message_history(conn: sqlite3.Connection):
+    """Append-only per-user message window, replacing the JSON list in user_contexts"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS message_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            message TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_message_history_user ON message_history (user_id, id)")
+
+    rows = conn.execute("""
+        SELECT user_id, previous_messages FROM user_contexts
+        WHERE previous_messages IS NOT NULL AND previous_messages != '[]'
+    """).fetchall()
+    conn.executemany(
+        "INSERT INTO message_history (user_id, message) VALUES (?, ?)",
+        [(user_id, message) for user_id, messages in rows for message in json.loads(messages)[-HISTORY_WINDOW:]]
+    )
+    # The column stays for older readers but is no longer written
+    conn.execute("UPDATE user_contexts SET previous_messages = NULL")
+
+    # Each insert drops that user's rows beyond the window
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS message_history_window
+        AFTER INSERT ON message_history
+        BEGIN
+            DELETE FROM message_history
+            WHERE user_id = NEW.user_id AND id < (
+                SELECT id FROM message_history WHERE user_id = NEW.user_id
+                ORDER BY id DESC LIMIT 1 OFFSET {HISTORY_WINDOW - 1}
+            );
+        END
+    """)
+
+# (version, description, step); a database at user_version N has run every step up to N
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "initial schema", _initial_schema),
+    (2, "unhandled flag, message hash and indexes", _unhandled_flag_and_indexes),
+    (3, "incremental learning state and unique patterns", _learning_state),
+    (4, "conversation archive registry and daily summary", _archive_tables),
+    (5, "append-only message history", _message_history),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn: sqlite3.Connection) -> List[int]:
+    """Run every pending migration, each in its own transaction; returns the versions applied"""
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        with conn:
+            conn.execute("BEGIN")  # Python would not open a transaction before DDL by itself
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+        applied.append(version)
+    return applied
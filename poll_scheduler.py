@@ -0,0 +1,109 @@
+import time
+from threading import Event, Lock
+from typing import Any, Dict, Optional
+from inbox_sync import item_timestamp
+
+class AdaptivePollScheduler:
+    """Picks the delay before the next inbox poll.
+
+    A poll that finds messages drops the interval to min_interval, and it
+    stays there while a conversation was active within active_window seconds.
+    After that every empty poll multiplies the interval by decay, up to
+    max_interval. The delay is never shorter than the inbox bucket's token
+    spacing; the page requests themselves take tokens from that bucket.
+
+    It also tracks how long each thread waited for its first reply, so the
+    poll interval can be compared with the latency users actually see.
+    """
+
+    def __init__(self, inbox_bucket=None, min_interval: float = 5.0, max_interval: float = 60.0,
+                 decay: float = 1.5, active_window: float = 120.0):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError("Need 0 < min_interval <= max_interval")
+        if decay < 1.0:
+            raise ValueError("decay must be at least 1.0")
+        self.inbox_bucket = inbox_bucket
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.decay = decay
+        self.active_window = active_window
+        self.interval = min_interval
+        self._lock = Lock()
+        self._last_active = float('-inf')
+        self._awaiting_reply: Dict[str, float] = {}  # thread -> oldest unanswered message time (epoch seconds)
+        self.polls = 0
+        self.empty_polls = 0
+        self._interval_total = 0.0
+        self.replies = 0
+        self._reply_latency_total = 0.0
+        self.max_reply_latency = 0.0
+
+    def record_poll(self, message_count: int, now: Optional[float] = None) -> float:
+        """Adjust the interval after a poll and return the delay before the next one"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.polls += 1
+            if message_count:
+                self._last_active = now
+                self.interval = self.min_interval
+            else:
+                self.empty_polls += 1
+                if now - self._last_active >= self.active_window:
+                    self.interval = min(self.max_interval, self.interval * self.decay)
+            self._interval_total += self.interval
+            return self.next_delay()
+
+    def next_delay(self) -> float:
+        """Current interval, but never faster than the inbox budget refills"""
+        if self.inbox_bucket is None:
+            return self.interval
+        return max(self.interval, self.inbox_bucket.interval)
+
+    def wait_for_poll(self, delay: float, stop: Optional[Event] = None) -> bool:
+        """Sleep until the next poll is due; True if stop was set first"""
+        if stop is None:
+            time.sleep(delay)
+            return False
+        return stop.wait(delay)
+
+    def message_seen(self, thread_id: str, timestamp: Any):
+        """Note an inbound message; only the oldest unanswered one per thread counts"""
+        sent_at = item_timestamp({'timestamp': timestamp}) / 1e6  # Instagram uses microseconds
+        if not sent_at:
+            return
+        with self._lock:
+            if thread_id not in self._awaiting_reply:
+                self._awaiting_reply[thread_id] = sent_at
+
+    def reply_sent(self, thread_id: str, now: Optional[float] = None):
+        """Record time to first reply for the thread's oldest unanswered message"""
+        now = time.time() if now is None else now
+        with self._lock:
+            sent_at = self._awaiting_reply.pop(thread_id, None)
+            if sent_at is None:
+                return
+            latency = max(0.0, now - sent_at)
+            self.replies += 1
+            self._reply_latency_total += latency
+            self.max_reply_latency = max(self.max_reply_latency, latency)
+
+    def reply_abandoned(self, thread_id: str):
+        """Forget the thread's unanswered message; its reply was dropped or it will be fetched again"""
+        with self._lock:
+            self._awaiting_reply.pop(thread_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            avg_interval = self._interval_total / self.polls if self.polls else 0.0
+            avg_latency = self._reply_latency_total / self.replies if self.replies else 0.0
+            return {
+                'interval_seconds': self.interval,
+                'polls': self.polls,
+                'empty_polls': self.empty_polls,
+                'avg_poll_interval_seconds': avg_interval,
+                'replies': self.replies,
+                'avg_first_reply_seconds': avg_latency,
+                'max_first_reply_seconds': self.max_reply_latency,
+                # Share of the first-reply latency that the poll interval can explain
+                'interval_to_reply_ratio': avg_interval / avg_latency if avg_latency else 0.0
+            }
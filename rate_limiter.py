@@ -0,0 +1,139 @@
+import time
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second, holding up to `capacity`.
+
+    The bucket is kept as the time at which it would next be empty-and-owed
+    (the GCRA form of a token bucket), so a caller can also reserve a token
+    that only becomes available in the future. Nothing sleeps while holding
+    the lock: acquire() reserves a slot, releases the lock and then sleeps.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1, name: str = "bucket"):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.interval = 1.0 / rate
+        self._tolerance = (capacity - 1) * self.interval  # How far ahead a burst may run
+        self._tat = float('-inf')  # Theoretical arrival time of the next token
+        self._lock = Lock()
+        self.acquired = 0
+        self.rejected = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _slot(self, not_before: float) -> float:
+        return max(not_before, self._tat - self._tolerance)
+
+    def _take(self, slot: float, now: float):
+        self._tat = max(self._tat, slot) + self.interval
+        wait = max(0.0, slot - now)
+        self.acquired += 1
+        if wait > 0:
+            self.waited += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available right now; never waits"""
+        now = time.monotonic()
+        with self._lock:
+            if self._slot(now) > now:
+                self.rejected += 1
+                return False
+            self._take(now, now)
+            return True
+
+    def next_available(self) -> float:
+        """time.monotonic() value at which try_acquire would next succeed"""
+        with self._lock:
+            return self._slot(time.monotonic())
+
+    def reserve(self, not_before: float) -> float:
+        """Claim the first token at or after not_before (time.monotonic) without sleeping"""
+        with self._lock:
+            slot = self._slot(not_before)
+            self._take(slot, time.monotonic())
+            return slot
+
+    def _claim(self, timeout: Optional[float]) -> Optional[float]:
+        """Reserve a token unless it is further away than timeout; returns seconds to wait"""
+        now = time.monotonic()
+        with self._lock:
+            slot = self._slot(now)
+            if timeout is not None and slot - now > timeout:
+                self.rejected += 1
+                return None
+            self._take(slot, now)
+            return slot - now
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Block until a token is available; False if that would take longer than timeout"""
+        delay = self._claim(timeout)
+        if delay is None:
+            return False
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        """Like acquire, but yields to the event loop instead of sleeping the thread"""
+        delay = self._claim(timeout)
+        if delay is None:
+            return False
+        if delay > 0:
+            import asyncio  # Only async callers pay for the import
+            await asyncio.sleep(delay)
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'capacity': self.capacity,
+                'acquired': self.acquired,
+                'rejected': self.rejected,
+                'waited': self.waited,
+                'avg_wait_seconds': self.total_wait / self.waited if self.waited else 0.0,
+                'max_wait_seconds': self.max_wait
+            }
+
+# (calls per second, burst capacity) for each endpoint class
+DEFAULT_BUDGETS: Dict[str, Tuple[float, int]] = {
+    'inbox': (0.5, 5),     # direct_v2_inbox and direct_v2_thread pages
+    'activity': (2.0, 4),  # direct_v2_indicate_activity
+    'send': (1.0, 1)       # direct_v2_send
+}
+
+class EndpointRateLimiter:
+    """One TokenBucket per endpoint class, so reads, typing indicators and sends
+    each spend their own budget"""
+
+    def __init__(self, budgets: Optional[Dict[str, Tuple[float, int]]] = None):
+        budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        self.buckets = {
+            endpoint: TokenBucket(rate, capacity, name=endpoint)
+            for endpoint, (rate, capacity) in budgets.items()
+        }
+
+    def __getitem__(self, endpoint: str) -> TokenBucket:
+        return self.buckets[endpoint]
+
+    def try_acquire(self, endpoint: str) -> bool:
+        return self.buckets[endpoint].try_acquire()
+
+    def acquire(self, endpoint: str, timeout: Optional[float] = None) -> bool:
+        return self.buckets[endpoint].acquire(timeout)
+
+    async def acquire_async(self, endpoint: str, timeout: Optional[float] = None) -> bool:
+        return await self.buckets[endpoint].acquire_async(timeout)
+
+    def stats(self) -> dict:
+        return {endpoint: bucket.stats() for endpoint, bucket in self.buckets.items()}
@@ -0,0 +1,141 @@
+from collections import deque
+from threading import RLock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+class ResponseMatcher:
+    """Aho-Corasick index over response patterns.
+
+    Mirrors ``? LIKE '%' || pattern || '%'`` from the responses table: every
+    pattern contained in the message is a candidate, and candidates are ranked
+    by usage_count, then success_rate, then id, keeping only rows whose
+    context is NULL or equal to the user's context.
+    """
+
+    def __init__(self, rows: Iterable[tuple] = ()):
+        self._lock = RLock()
+        self._responses: Dict[int, list] = {}  # id -> [pattern, response, context, usage_count, success_rate]
+        self._match_all: List[int] = []  # Empty patterns match every message
+        self._reset_trie()
+        self.load(rows)
+
+    def _reset_trie(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._dict_link: List[int] = [0]  # Nearest suffix node that ends a pattern
+        self._outputs: List[List[int]] = [[]]
+        self._dirty = False
+
+    def load(self, rows: Iterable[tuple]):
+        """Rebuild the index from (id, pattern, response, context, usage_count, success_rate) rows"""
+        with self._lock:
+            self._responses.clear()
+            self._match_all = []
+            self._reset_trie()
+            for row in rows:
+                self._insert(*row)
+            self._build_links()
+
+    def add(self, response_id: int, pattern: str, response: str, context: Optional[str] = None,
+            usage_count: int = 0, success_rate: float = 0.0):
+        """Index a newly learned pattern; failure links are rebuilt on the next match"""
+        with self._lock:
+            self._insert(response_id, pattern, response, context, usage_count, success_rate)
+
+    def record_usage(self, response_id: int, was_helpful: bool):
+        """Apply the same stats update as DatabaseHandler.update_response_stats"""
+        with self._lock:
+            entry = self._responses.get(response_id)
+            if entry is None:
+                return
+            usage_count, success_rate = entry[3], entry[4]
+            entry[4] = (success_rate * usage_count + (1 if was_helpful else 0)) / (usage_count + 1)
+            entry[3] = usage_count + 1
+
+    def match(self, message: str, context: Optional[str] = None) -> Optional[Tuple[str, int]]:
+        """Return (response, id) for the best pattern contained in the message"""
+        with self._lock:
+            if self._dirty:
+                self._build_links()
+
+            best = None
+            best_key = None
+            for response_id in self._candidates(message.lower()):
+                pattern, response, response_context, usage_count, success_rate = self._responses[response_id]
+                if response_context is not None and response_context != context:
+                    continue
+                key = (-usage_count, -success_rate, response_id)
+                if best_key is None or key < best_key:
+                    best_key = key
+                    best = (response, response_id)
+            return best
+
+    def __len__(self) -> int:
+        return len(self._responses)
+
+    def _insert(self, response_id: int, pattern: str, response: str, context: Optional[str],
+                usage_count: int, success_rate: float):
+        pattern = (pattern or '').lower()
+        self._responses[response_id] = [pattern, response, context, usage_count or 0, success_rate or 0.0]
+        if not pattern:
+            self._match_all.append(response_id)
+            return
+
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._dict_link.append(0)
+                self._outputs.append([])
+                self._goto[node][char] = next_node
+                self._dirty = True
+            node = next_node
+        if not self._outputs[node]:
+            # A node that starts ending a pattern changes the dictionary links below it
+            self._dirty = True
+        self._outputs[node].append(response_id)
+
+    def _build_links(self):
+        """Breadth-first computation of failure and dictionary suffix links"""
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            self._dict_link[child] = 0
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                fail = self._fail[child]
+                self._dict_link[child] = fail if self._outputs[fail] else self._dict_link[fail]
+                queue.append(child)
+        self._dirty = False
+
+    def _candidates(self, text: str):
+        """Yield the id of every pattern occurring in the text"""
+        yield from self._match_all
+
+        seen = set()  # Output nodes already reported
+        goto, fail, dict_link, outputs = self._goto, self._fail, self._dict_link, self._outputs
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            hit = node if outputs[node] else dict_link[node]
+            while hit:
+                if hit in seen:
+                    # Everything further along this suffix chain was reported already
+                    break
+                seen.add(hit)
+                for response_id in outputs[hit]:
+                    yield response_id
+                hit = dict_link[hit]
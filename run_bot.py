@@ -1,19 +1,33 @@
-from instagram_api import InstagramMessageAPI
-import keyboard
 import threading
 import sys
-import time
+import os
+from startup_profile import profile
 
 def check_for_exit():
     """Monitor for '9' key press"""
+    import keyboard  # Needs a terminal (and root on Linux), so only the exit watcher loads it
     keyboard.wait('9')
     print("\nTermination key (9) pressed. Shutting down bot...")
     sys.exit(0)
 
 def main():
+    # --profile-startup: build the bot, print where startup time went and exit
+    profile_startup = '--profile-startup' in sys.argv[1:]
+    if profile_startup:
+        profile.enable()
+    with profile.phase('import instagram_api'):
+        from instagram_api import InstagramMessageAPI
     bot = None
     try:
-        bot = InstagramMessageAPI()
+        with profile.phase('InstagramMessageAPI()'):
+            bot = InstagramMessageAPI()
+        if profile_startup:
+            with profile.phase('deferred to first message'):
+                bot.db.matcher
+            return
+        metrics = bot.serve_metrics(int(os.getenv('METRICS_PORT', '9108')))
+        if metrics is not None:
+            print(f"Metrics at http://127.0.0.1:{metrics.port}/metrics")
         print("Bot is running. Press '9' to terminate the bot.")
         
         exit_thread = threading.Thread(target=check_for_exit, daemon=True)
@@ -27,10 +41,12 @@ def main():
     except Exception as e:
         print(f"Bot stopped due to error: {str(e)}")
     finally:
+        if profile_startup:
+            print(profile.report())
         if bot:
             print("Cleaning up and saving data...")
-            time.sleep(1)
+            bot.shutdown()
             print("Bot terminated successfully")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
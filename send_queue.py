@@ -0,0 +1,164 @@
+import heapq
+import itertools
+import time
+from threading import Lock
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+class SendPolicy(NamedTuple):
+    sla: float  # Seconds from the message arriving to its reply being sent
+    stale_after: float  # Message age at which the reply is hopelessly late
+    drop_when_stale: bool  # Drop it then; otherwise send it after every reply that is still fresh
+
+# Policy for each SLA class: the classifier's intents plus 'closing'
+DEFAULT_POLICIES: Dict[str, SendPolicy] = {
+    'greeting': SendPolicy(30.0, 1800.0, False),
+    'pricing': SendPolicy(60.0, 3600.0, False),
+    'help': SendPolicy(120.0, 3600.0, False),
+    'unknown': SendPolicy(300.0, 3600.0, False),
+    'closing': SendPolicy(600.0, 1800.0, True)  # A "you're welcome" half an hour later is noise
+}
+
+def sla_class(classification) -> str:
+    """Closings ("thanks", "bye") have their own policy whatever the intent"""
+    return 'closing' if classification.state == 'closing' else classification.intent
+
+class OutboxEntry(NamedTuple):
+    item: Any
+    sla_class: str
+    received: float  # time.monotonic() value at which the message arrived
+    deadline: float  # received plus the class's SLA
+    queued_at: float
+    stale: bool
+
+class PriorityOutbox:
+    """Replies waiting for a send token, earliest deadline first.
+
+    A reply's deadline is the arrival of the message it answers plus the SLA
+    of its class, so an old message outranks a new one and a greeting
+    outranks a closing of the same age. Once a message is older than its
+    class's stale_after, expire() drops the reply or downgrades it behind
+    every fresh one, so a backlog of replies that are late anyway cannot make
+    the replies that can still be on time late too.
+
+    Times are time.monotonic() values; the caller passes now so the order
+    can be tested without sleeping.
+    """
+
+    def __init__(self, policies: Optional[Dict[str, SendPolicy]] = None):
+        self.policies = dict(DEFAULT_POLICIES, **(policies or {}))
+        self._lock = Lock()
+        self._seq = itertools.count()  # FIFO among equal deadlines
+        self._fresh: List[Tuple[float, int]] = []  # (deadline, seq); entries popped or downgraded are skipped
+        self._expiry: List[Tuple[float, int]] = []  # (stale at, seq)
+        self._stale: List[Tuple[float, int, OutboxEntry]] = []
+        self._entries: Dict[int, OutboxEntry] = {}  # Fresh entries still queued
+        self.pushed = 0
+        self.released = 0
+        self.dropped = 0
+        self.downgraded = 0
+        self.sla_met = 0
+        self.sla_missed = 0
+
+    def policy(self, sla_class: str) -> SendPolicy:
+        return self.policies.get(sla_class, self.policies['unknown'])
+
+    def push(self, item: Any, sla_class: str = 'unknown', age: float = 0.0,
+             now: Optional[float] = None) -> OutboxEntry:
+        """Queue a reply to a message that arrived age seconds ago"""
+        now = time.monotonic() if now is None else now
+        policy = self.policy(sla_class)
+        received = now - max(0.0, age)
+        entry = OutboxEntry(item, sla_class, received, received + policy.sla, now, False)
+        with self._lock:
+            seq = next(self._seq)
+            self._entries[seq] = entry
+            heapq.heappush(self._fresh, (entry.deadline, seq))
+            heapq.heappush(self._expiry, (received + policy.stale_after, seq))
+            self.pushed += 1
+        return entry
+
+    def expire(self, now: Optional[float] = None) -> Tuple[List[OutboxEntry], List[OutboxEntry]]:
+        """Drop or downgrade the replies that went stale; returns (dropped, downgraded)"""
+        now = time.monotonic() if now is None else now
+        dropped, downgraded = [], []
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                _, seq = heapq.heappop(self._expiry)
+                entry = self._entries.pop(seq, None)
+                if entry is None:
+                    continue  # Already sent
+                if self.policy(entry.sla_class).drop_when_stale:
+                    dropped.append(entry)
+                else:
+                    entry = entry._replace(stale=True)
+                    heapq.heappush(self._stale, (entry.deadline, seq, entry))
+                    downgraded.append(entry)
+            self.dropped += len(dropped)
+            self.downgraded += len(downgraded)
+        return dropped, downgraded
+
+    def _head(self) -> Optional[Tuple[int, OutboxEntry]]:
+        while self._fresh:
+            seq = self._fresh[0][1]
+            entry = self._entries.get(seq)
+            if entry is not None:
+                return seq, entry
+            heapq.heappop(self._fresh)
+        if self._stale:
+            return self._stale[0][1], self._stale[0][2]
+        return None
+
+    def peek(self) -> Optional[OutboxEntry]:
+        """The reply pop() would return, left in place"""
+        with self._lock:
+            head = self._head()
+        return head[1] if head else None
+
+    def pop(self) -> Optional[OutboxEntry]:
+        """Remove and return the most urgent reply; call expire() first to apply stale_after"""
+        with self._lock:
+            head = self._head()
+            if head is None:
+                return None
+            seq, entry = head
+            if entry.stale:
+                heapq.heappop(self._stale)
+            else:
+                heapq.heappop(self._fresh)
+                del self._entries[seq]
+            self.released += 1
+        return entry
+
+    def record_sent(self, entry: OutboxEntry, sent_at: Optional[float] = None) -> bool:
+        """Count the reply against its SLA; True if it missed the deadline"""
+        sent_at = time.monotonic() if sent_at is None else sent_at
+        missed = sent_at > entry.deadline
+        with self._lock:
+            if missed:
+                self.sla_missed += 1
+            else:
+                self.sla_met += 1
+        return missed
+
+    def record_failed(self, entry: OutboxEntry):
+        """A reply whose send failed never made its deadline"""
+        with self._lock:
+            self.sla_missed += 1
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries) + len(self._stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            settled = self.sla_met + self.sla_missed
+            return {
+                'queued': len(self._entries) + len(self._stale),
+                'pushed': self.pushed,
+                'released': self.released,
+                'dropped': self.dropped,
+                'downgraded': self.downgraded,
+                'sla_met': self.sla_met,
+                'sla_missed': self.sla_missed,
+                'sla_miss_rate': self.sla_missed / settled if settled else 0.0
+            }
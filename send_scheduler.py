@@ -0,0 +1,138 @@
+import heapq
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Thread
+from typing import Callable, List, Tuple
+
+class SendScheduler:
+    """Heap-based timer that runs deferred send steps on a single dispatcher thread.
+
+    Typing indicators and sends become events due at a monotonic time instead
+    of sleeps on the caller's thread, so any number of replies can be waiting
+    for their typing delay at once. Events marked blocking (the Instagram API
+    calls) are handed to a small executor when due, so a slow request only
+    holds up its own conversation; the dispatcher thread does the timing.
+    """
+
+    def __init__(self, workers: int = 4):
+        self._heap: List[Tuple[float, int, Callable[[], None], bool]] = []
+        self._seq = itertools.count()  # Keeps events due at the same time in FIFO order
+        self._cond = Condition()
+        self._stopped = False
+        self._running = False
+        self._in_executor = 0
+        self.scheduled = 0
+        self.executed = 0
+        self.failed = 0
+        self.max_lateness = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="send-api")
+        self._thread = Thread(target=self._run, name="send-scheduler", daemon=True)
+        self._thread.start()
+
+    def call_at(self, due: float, callback: Callable[[], None], blocking: bool = False):
+        """Run callback at the given time.monotonic() value; blocking callbacks run on the executor"""
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Send scheduler is closed")
+            heapq.heappush(self._heap, (due, next(self._seq), callback, blocking))
+            self.scheduled += 1
+            self._cond.notify_all()
+
+    def call_later(self, delay: float, callback: Callable[[], None], blocking: bool = False):
+        """Run callback after delay seconds"""
+        self.call_at(time.monotonic() + delay, callback, blocking)
+
+    def run_blocking(self, callback: Callable[[], None]):
+        """Run callback on the executor now"""
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Send scheduler is closed")
+            self.scheduled += 1
+            self._submit(callback)
+
+    def _submit(self, callback: Callable[[], None]):
+        # Called with _cond held; counted until it finishes so wait_idle covers it
+        self._in_executor += 1
+        self._executor.submit(self._execute, callback)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._heap) + self._in_executor
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap:
+                        if self._stopped:
+                            return
+                        self._cond.wait()
+                        continue
+                    due = self._heap[0][0]
+                    now = time.monotonic()
+                    if due <= now:
+                        _, _, callback, blocking = heapq.heappop(self._heap)
+                        self.max_lateness = max(self.max_lateness, now - due)
+                        if blocking:
+                            self._submit(callback)
+                            continue
+                        self._running = True
+                        break
+                    self._cond.wait(due - now)
+
+            try:
+                callback()
+            except Exception as e:
+                self.failed += 1
+                print(f"Error in scheduled send step: {str(e)}")
+            finally:
+                with self._cond:
+                    self.executed += 1
+                    self._running = False
+                    self._cond.notify_all()
+
+    def _execute(self, callback: Callable[[], None]):
+        try:
+            callback()
+        except Exception as e:
+            with self._cond:
+                self.failed += 1
+            print(f"Error in scheduled send step: {str(e)}")
+        finally:
+            with self._cond:
+                self.executed += 1
+                self._in_executor -= 1
+                self._cond.notify_all()
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """Block until every scheduled event, including chained ones, has run"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._heap or self._running or self._in_executor:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def close(self, timeout: float = None):
+        """Let pending events finish, then stop the dispatcher thread and the executor"""
+        self.wait_idle(timeout)
+        with self._cond:
+            self._stopped = True
+            self._heap.clear()
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'pending': len(self._heap),
+                'in_executor': self._in_executor,
+                'scheduled': self.scheduled,
+                'executed': self.executed,
+                'failed': self.failed,
+                'max_lateness_seconds': self.max_lateness
+            }
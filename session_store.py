@@ -0,0 +1,91 @@
+import base64
+import json
+import os
+import time
+from typing import Callable, Optional, Tuple, Type
+
+class SessionStore:
+    """Client settings (cookies, device ids) cached in a JSON file between runs.
+
+    instagram_private_api keeps its cookie jar as bytes, so bytes values are
+    stored base64 encoded. The file is written atomically and readable by
+    the owner only, since it is as good as a password.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Optional[dict]:
+        try:
+            with open(self.path) as f:
+                return json.load(f, object_hook=_from_json)
+        except FileNotFoundError:
+            return None
+        except (ValueError, OSError) as e:
+            print(f"Ignoring unreadable session cache {self.path}: {str(e)}")
+            return None
+
+    def save(self, settings: dict):
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(settings, f, default=_to_json)
+        os.replace(tmp_path, self.path)
+
+    def save_client(self, client):
+        """Cache the client's current settings; cookies are refreshed while it runs"""
+        settings = getattr(client, 'settings', None)
+        if isinstance(settings, dict):
+            self.save(settings)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+def _to_json(value):
+    if isinstance(value, bytes):
+        return {'__class__': 'bytes', '__value__': base64.b64encode(value).decode('ascii')}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def _from_json(obj: dict):
+    if obj.get('__class__') == 'bytes':
+        return base64.b64decode(obj['__value__'])
+    return obj
+
+def open_client(factory: Callable, username: Optional[str], password: Optional[str],
+                store: Optional[SessionStore] = None, validate: Optional[Callable] = None,
+                rejected: Tuple[Type[BaseException], ...] = (Exception,)) -> Tuple[object, bool, float]:
+    """Build a client, reusing the cached session when it is still accepted.
+
+    Returns (client, reused, seconds). A cached session the factory or
+    validate() rejects with one of `rejected` is dropped and followed by a
+    full login, whose settings are cached for next time.
+    """
+    started = time.perf_counter()
+    settings = store.load() if store is not None else None
+    if settings is not None:
+        try:
+            client = factory(username, password, settings=settings)
+            if validate is not None:
+                validate(client)
+            return client, True, time.perf_counter() - started
+        except rejected as e:
+            print(f"Cached session rejected, logging in again: {str(e)}")
+            store.clear()
+
+    client = factory(username, password)
+    if store is not None:
+        store.save_client(client)
+    return client, False, time.perf_counter() - started
+
+def live_client_checks() -> dict:
+    """open_client's validate and rejected arguments for instagram_private_api.Client"""
+    from instagram_private_api import ClientCookieExpiredError, ClientLoginRequiredError
+    return {
+        'validate': lambda api: api.current_user(),  # One light request instead of a login
+        'rejected': (ClientCookieExpiredError, ClientLoginRequiredError)
+    }
@@ -0,0 +1,244 @@
+"""Run several Instagram accounts, each in its own worker process.
+
+Usage:
+    python supervisor.py [accounts.json]
+
+The config lists one entry per account:
+
+    {
+        "accounts": [
+            {"name": "shop", "username": "shop_account", "password_env": "SHOP_PASSWORD",
+             "rate_limits": {"send": [0.5, 1]}, "metrics_port": 9108},
+            {"name": "studio", "username": "studio_account", "password_env": "STUDIO_PASSWORD"}
+        ],
+        "restart_backoff": {"initial": 5, "max": 300},
+        "summary_interval": 60
+    }
+
+Every account gets its own database shard (instagram_bot-<name>.db unless
+"db_path" is given), its own rate limiter budgets and its own Instagram
+session. Crashed workers are restarted with exponential backoff, and the
+supervisor prints one line with health and throughput for all of them.
+"""
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+HEARTBEAT_INTERVAL = 10.0
+
+def load_config(path: str) -> dict:
+    with open(path) as f:
+        config = json.load(f)
+    names = [account['name'] for account in config.get('accounts', [])]
+    if not names:
+        raise ValueError(f"No accounts in {path}")
+    if len(set(names)) != len(names):
+        raise ValueError("Account names must be unique")
+    return config
+
+def run_account(account: dict, status: multiprocessing.Queue):
+    """Worker process body: one InstagramMessageAPI for one account"""
+    from instagram_api import InstagramMessageAPI
+
+    password = os.getenv(account['password_env']) if account.get('password_env') else account.get('password')
+    rate_limits = {endpoint: tuple(budget) for endpoint, budget in account.get('rate_limits', {}).items()}
+    bot = InstagramMessageAPI(
+        worker_count=account.get('workers', 4),
+        db_path=account.get('db_path', f"instagram_bot-{account['name']}.db"),
+        rate_limits=rate_limits or None,
+        username=account.get('username'),
+        password=password
+    )
+    if account.get('metrics_port'):
+        bot.serve_metrics(account['metrics_port'])
+    signal.signal(signal.SIGTERM, lambda signum, frame: bot.stop())
+
+    stopped = threading.Event()
+
+    def heartbeat():
+        while not stopped.wait(HEARTBEAT_INTERVAL):
+            status.put({
+                'name': account['name'],
+                'pid': os.getpid(),
+                'time': time.time(),
+                'handled': bot.metrics.counter('messages_handled'),
+                'sends': bot.metrics.counter('sends'),
+                'send_failures': bot.metrics.counter('sends_failed'),
+                'fetch_errors': bot.metrics.counter('fetch_errors')
+            })
+
+    threading.Thread(target=heartbeat, name="supervisor-heartbeat", daemon=True).start()
+    try:
+        bot.start_message_loop()
+    finally:
+        stopped.set()
+        bot.shutdown()
+
+class WorkerState:
+    """What the supervisor knows about one account's worker"""
+
+    def __init__(self, account: dict):
+        self.account = account
+        self.process: Optional[multiprocessing.Process] = None
+        self.started_at = 0.0
+        self.restart_at = 0.0
+        self.restarts = 0
+        self.failures = 0  # Consecutive crashes, reset once a worker stays up
+        self.last_exit: Optional[int] = None
+        self.heartbeat: Optional[dict] = None
+        self.handled_before = 0  # Totals from earlier incarnations of this worker
+        self.sends_before = 0
+
+    @property
+    def name(self) -> str:
+        return self.account['name']
+
+    def handled(self) -> int:
+        return self.handled_before + (self.heartbeat or {}).get('handled', 0)
+
+    def sends(self) -> int:
+        return self.sends_before + (self.heartbeat or {}).get('sends', 0)
+
+class Supervisor:
+    """Starts one process per account, restarts crashed ones and aggregates their heartbeats"""
+
+    def __init__(self, accounts: List[dict], target: Callable = run_account, initial_backoff: float = 5.0,
+                 max_backoff: float = 300.0, stable_after: float = 60.0, heartbeat_timeout: float = 3 * HEARTBEAT_INTERVAL):
+        self.target = target
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after  # A worker up this long is no longer crash looping
+        self.heartbeat_timeout = heartbeat_timeout
+        self.status: multiprocessing.Queue = multiprocessing.Queue()
+        self.workers: Dict[str, WorkerState] = {account['name']: WorkerState(account) for account in accounts}
+        self._stopping = False
+        self._started = time.monotonic()
+
+    def _start(self, worker: WorkerState):
+        worker.process = multiprocessing.Process(
+            target=self.target, args=(worker.account, self.status), name=f"bot-{worker.name}", daemon=False
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        print(f"Started worker {worker.name} (pid {worker.process.pid})")
+
+    def backoff(self, failures: int) -> float:
+        return min(self.max_backoff, self.initial_backoff * 2 ** max(0, failures - 1))
+
+    def poll(self, now: Optional[float] = None):
+        """Collect heartbeats, notice exits and start workers whose restart is due"""
+        now = time.monotonic() if now is None else now
+        self._drain_status()
+        for worker in self.workers.values():
+            process = worker.process
+            if process is not None and not process.is_alive():
+                process.join()
+                worker.last_exit = process.exitcode
+                worker.process = None
+                worker.handled_before, worker.sends_before = worker.handled(), worker.sends()
+                worker.heartbeat = None
+                if now - worker.started_at >= self.stable_after:
+                    worker.failures = 0
+                worker.failures += 1
+                worker.restart_at = now + self.backoff(worker.failures)
+                print(f"Worker {worker.name} exited with code {process.exitcode}; "
+                      f"restarting in {worker.restart_at - now:.0f}s")
+            if worker.process is None and not self._stopping and now >= worker.restart_at:
+                if worker.last_exit is not None:
+                    worker.restarts += 1
+                self._start(worker)
+
+    def _drain_status(self):
+        while True:
+            try:
+                beat = self.status.get_nowait()
+            except queue.Empty:
+                return
+            worker = self.workers.get(beat['name'])
+            if worker is not None and worker.process is not None and beat['pid'] == worker.process.pid:
+                worker.heartbeat = beat
+
+    def health(self) -> dict:
+        """Per-account state and totals across every worker"""
+        accounts = {}
+        for worker in self.workers.values():
+            beat_age = time.time() - worker.heartbeat['time'] if worker.heartbeat else None
+            alive = worker.process is not None and worker.process.is_alive()
+            accounts[worker.name] = {
+                'alive': alive,
+                'healthy': alive and beat_age is not None and beat_age <= self.heartbeat_timeout,
+                'restarts': worker.restarts,
+                'last_exit': worker.last_exit,
+                'handled': worker.handled(),
+                'sends': worker.sends(),
+                'heartbeat_age_seconds': beat_age
+            }
+        handled = sum(account['handled'] for account in accounts.values())
+        uptime = time.monotonic() - self._started
+        return {
+            'accounts': accounts,
+            'workers_alive': sum(1 for account in accounts.values() if account['alive']),
+            'handled': handled,
+            'sends': sum(account['sends'] for account in accounts.values()),
+            'messages_per_second': handled / uptime if uptime > 0 else 0.0
+        }
+
+    def summary(self) -> str:
+        health = self.health()
+        parts = [
+            f"{name}={'ok' if account['healthy'] else 'up' if account['alive'] else 'down'}"
+            f"/{account['handled']}msg/{account['restarts']}restarts"
+            for name, account in health['accounts'].items()
+        ]
+        return (f"Supervisor: {health['workers_alive']}/{len(self.workers)} alive, "
+                f"{health['handled']} handled ({health['messages_per_second']:.2f} msg/s); " + ' '.join(parts))
+
+    def run(self, poll_interval: float = 1.0, summary_interval: float = 60.0):
+        """Supervise until interrupted, then stop every worker"""
+        next_summary = time.monotonic() + summary_interval
+        try:
+            while True:
+                self.poll()
+                if time.monotonic() >= next_summary:
+                    print(self.summary())
+                    next_summary += summary_interval
+                time.sleep(poll_interval)
+        finally:
+            self.stop()
+
+    def stop(self, timeout: float = 30.0):
+        """SIGTERM every worker, wait for a clean shutdown and kill stragglers"""
+        self._stopping = True
+        processes = [worker.process for worker in self.workers.values() if worker.process is not None]
+        for process in processes:
+            process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+def main():
+    config = load_config(sys.argv[1] if len(sys.argv) > 1 else "accounts.json")
+    backoff = config.get('restart_backoff', {})
+    supervisor = Supervisor(
+        config['accounts'],
+        initial_backoff=backoff.get('initial', 5.0),
+        max_backoff=backoff.get('max', 300.0)
+    )
+    # Ctrl+C reaches the workers too; let the supervisor stop them in order
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        supervisor.run(summary_interval=config.get('summary_interval', 60.0))
+    except (KeyboardInterrupt, SystemExit):
+        print("Supervisor stopped")
+
+if __name__ == "__main__":
+    main()
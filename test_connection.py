@@ -1,13 +1,21 @@
-from instagram_api import InstagramMessageAPI
+import sys
+from startup_profile import profile
 
 def test_connection():
     try:
-        bot = InstagramMessageAPI()
+        from instagram_api import InstagramMessageAPI
+        with profile.phase('InstagramMessageAPI()'):
+            bot = InstagramMessageAPI()
         print("✅ Connection successful!")
+        bot.shutdown()
         return True
     except Exception as e:
         print(f"❌ Connection failed: {str(e)}")
         return False
 
 if __name__ == "__main__":
-    test_connection() 
\ No newline at end of file
+    if '--profile-startup' in sys.argv[1:]:
+        profile.enable()
+    test_connection()
+    if profile.enabled:
+        print(profile.report())
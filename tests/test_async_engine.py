@@ -0,0 +1,147 @@
+import asyncio
+import time
+import pytest
+from async_engine import AsyncInstagramEngine
+from fake_instagram import FakeInstagramClient
+
+FAST = {'inbox': (1000.0, 1000), 'activity': (1000.0, 1000), 'send': (1000.0, 1000)}
+
+def make_engine(client, **kwargs):
+    engine = AsyncInstagramEngine(client_factory=lambda username, password: client, db_path=":memory:",
+                                  rate_limits=FAST, username='bot', password='secret', **kwargs)
+    engine.human_generator.typing_delay = lambda message: 0.0
+    return engine
+
+async def run_until(engine, condition, timeout=15.0):
+    runner = asyncio.ensure_future(engine.run())
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    engine.stop()
+    await runner
+    await engine.shutdown()
+
+def test_conversations_overlap_instead_of_queueing():
+    """Test that typing pauses of different threads run concurrently on a small executor"""
+    client = FakeInstagramClient(threads=20, message_rate=1e6, total_messages=20)
+    client.start()
+    time.sleep(0.01)
+    engine = make_engine(client, blocking_workers=2)
+
+    started = time.monotonic()
+    asyncio.run(run_until(engine, lambda: client.answered() == 20))
+    elapsed = time.monotonic() - started
+
+    assert client.answered() == 20
+    assert engine.metrics.counter('messages_handled') == 20
+    assert engine.metrics.counter('sends') == client.replies
+    # Each reply types for a second or two; one conversation after another would take far longer
+    assert elapsed < 10.0
+
+def test_messages_in_one_thread_are_answered_in_order():
+    client = FakeInstagramClient(threads=1, message_rate=1e6, total_messages=3)
+    client.start()
+    time.sleep(0.01)
+    engine = make_engine(client)
+    events = []
+    plan, send = engine.planner.plan, client.direct_v2_send
+
+    def record_plan(message_data):
+        events.append(('plan', message_data['timestamp']))
+        return plan(message_data)
+
+    def record_send(text, thread_ids):
+        events.append(('send', None))
+        return send(text=text, thread_ids=thread_ids)
+
+    engine.planner.plan = record_plan
+    client.direct_v2_send = record_send
+    asyncio.run(run_until(engine, lambda: len(events) == 6))
+    # The next message is only planned once the previous reply went out
+    assert [kind for kind, _ in events] == ['plan', 'send'] * 3
+    timestamps = [timestamp for kind, timestamp in events if kind == 'plan']
+    assert timestamps == sorted(timestamps, key=int)
+    assert engine.metrics.counter('messages_handled') == 3
+    assert not engine._thread_tails
+
+def test_send_failure_is_counted():
+    client = FakeInstagramClient(threads=1, message_rate=1e6, total_messages=1)
+    client.start()
+    time.sleep(0.01)
+    engine = make_engine(client)
+
+    def broken(text, thread_ids):
+        raise RuntimeError("send failed")
+
+    client.direct_v2_send = broken
+    asyncio.run(run_until(engine, lambda: engine.metrics.counter('sends_failed') == 1))
+    assert engine.metrics.counter('sends_failed') == 1
+    assert engine.metrics.counter('sends') == 0
+
+def test_failed_reply_is_retried_on_the_next_poll():
+    client = FakeInstagramClient(threads=1, message_rate=1e6, total_messages=1)
+    client.start()
+    time.sleep(0.01)
+    engine = make_engine(client)
+    send, failures = client.direct_v2_send, []
+
+    def flaky(text, thread_ids):
+        if not failures:
+            failures.append(text)
+            raise RuntimeError("send failed")
+        return send(text=text, thread_ids=thread_ids)
+
+    client.direct_v2_send = flaky
+    asyncio.run(run_until(engine, lambda: client.answered() == 1))
+    assert client.answered() == 1
+    assert engine.metrics.counter('sends_failed') == 1
+
+def test_typing_failure_does_not_stop_the_send():
+    client = FakeInstagramClient(threads=1, message_rate=1e6, total_messages=1)
+    client.start()
+    time.sleep(0.01)
+    engine = make_engine(client)
+
+    def broken(thread_id, activity_indicator_id):
+        raise RuntimeError("typing failed")
+
+    client.direct_v2_indicate_activity = broken
+    asyncio.run(run_until(engine, lambda: client.answered() == 1))
+    assert client.answered() == 1
+    assert engine.metrics.counter('typing_failed') == 1
+    assert engine.metrics.counter('sends_failed') == 0
+
+def test_repeated_failures_reconnect():
+    client = FakeInstagramClient(threads=1, message_rate=1e6, total_messages=1)
+    client.start()
+    time.sleep(0.01)
+    connects = []
+
+    def factory(username, password):
+        connects.append(username)
+        return client
+
+    engine = AsyncInstagramEngine(client_factory=factory, db_path=":memory:", rate_limits=FAST, reconnect_after=2)
+    engine.human_generator.typing_delay = lambda message: 0.0
+    engine.poll_scheduler.min_interval = engine.poll_scheduler.max_interval = 0.01
+    send = client.direct_v2_send
+
+    def flaky(text, thread_ids):
+        if len(connects) < 2:
+            raise RuntimeError("session expired")
+        return send(text=text, thread_ids=thread_ids)
+
+    client.direct_v2_send = flaky
+    asyncio.run(run_until(engine, lambda: client.answered() == 1))
+    assert len(connects) == 2
+    assert engine.metrics.counter('reconnects') == 1
+    assert engine.failed_sends == 0
+
+def test_connect_failure_propagates():
+    def factory(username, password):
+        raise RuntimeError("bad credentials")
+
+    engine = AsyncInstagramEngine(client_factory=factory, db_path=":memory:", username='bot', password='secret')
+    with pytest.raises(RuntimeError):
+        asyncio.run(engine.run())
+    asyncio.run(engine.shutdown())
@@ -0,0 +1,33 @@
+import time
+from background_learner import BackgroundLearner
+from database_handler import DatabaseHandler
+
+def test_learner_runs_off_the_message_path():
+    """Test that a triggered run learns on the learner's thread"""
+    db = DatabaseHandler(db_path=":memory:")
+    size = len(db.matcher)
+    for _ in range(3):
+        db.log_conversation("u1", "where is the shop", "I'm still learning how to respond to that.")
+
+    learner = BackgroundLearner(db, interval=3600)
+    learner.trigger()
+    deadline = time.monotonic() + 5
+    while learner.runs == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    learner.close()
+
+    assert learner.stats()['patterns_learned'] == 1
+    assert len(db.matcher) == size + 1
+    db.close()
+
+def test_failed_run_is_counted():
+    class Broken:
+        def learn_from_conversations(self):
+            raise RuntimeError("locked")
+
+    learner = BackgroundLearner(Broken(), start=False)
+    try:
+        learner.run_once()
+    except RuntimeError:
+        pass
+    assert learner.failed_runs == 1
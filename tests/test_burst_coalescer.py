@@ -0,0 +1,74 @@
+from burst_coalescer import BurstCoalescer
+from database_handler import DatabaseHandler
+from inbox_reader import InboxMessage, InboxReader
+from inbox_sync import InboxSync
+
+NOW = 1_700_000_000.0
+
+def message(thread_id, text, seconds_ago, item_id=None):
+    timestamp = str(int((NOW - seconds_ago) * 1e6))
+    return InboxMessage(thread_id, f"user-{thread_id}", f"name-{thread_id}", text, timestamp, item_id or text)
+
+def test_burst_becomes_one_message():
+    coalescer = BurstCoalescer(quiet_window=5.0)
+    burst = [message('t1', "hi", 30), message('t1', "quick question", 28), message('t1', "how much is it?", 27)]
+    ready, deferred = coalescer.coalesce(burst + [message('t2', "hello", 20)], now=NOW)
+
+    assert deferred == []
+    assert [m['thread_id'] for m in ready] == ['t1', 't2']
+    merged = ready[0]
+    assert merged['message'] == "hi\nquick question\nhow much is it?"
+    assert merged['timestamp'] == burst[-1]['timestamp']
+    assert merged['item_id'] == "how much is it?"
+    assert coalescer.stats() == {'messages_answered': 4, 'replies': 2, 'sends_saved': 2, 'deferred': 0}
+
+def test_gap_longer_than_window_starts_a_new_burst():
+    coalescer = BurstCoalescer(quiet_window=5.0)
+    ready, _ = coalescer.coalesce([
+        message('t1', "hi", 60), message('t1', "you there?", 58), message('t1', "never mind, found it", 30)
+    ], now=NOW)
+    assert [m['message'] for m in ready] == ["hi\nyou there?", "never mind, found it"]
+
+def test_burst_in_progress_waits_until_quiet_or_max_wait():
+    coalescer = BurstCoalescer(quiet_window=5.0, max_wait=30.0)
+    older = message('t1', "first question", 40)
+    typing = [message('t1', "also", 3), message('t1', "one more thing", 1)]
+    ready, deferred = coalescer.coalesce([older] + typing, now=NOW)
+    assert [m['message'] for m in ready] == ["first question"]
+    assert deferred == typing
+
+    # Someone who never pauses is still answered once the burst is max_wait old
+    chatty = [message('t2', str(i), 40 - i * 4) for i in range(11)]
+    ready, deferred = coalescer.coalesce(chatty, now=NOW)
+    assert deferred == []
+    assert len(ready) == 1
+
+def test_zero_window_answers_every_message():
+    coalescer = BurstCoalescer(quiet_window=0.0)
+    messages = [message('t1', "a", 2), message('t1', "b", 1)]
+    ready, deferred = coalescer.coalesce(messages, now=NOW)
+    assert ready == messages
+    assert deferred == []
+
+def test_released_messages_are_read_again():
+    handler = DatabaseHandler(db_path=":memory:")
+    sync = InboxSync(handler, own_user_id='bot')
+    thread = {
+        'thread_id': 't1', 'pending': True, 'last_activity_at': 3,
+        'users': [{'pk': 'u1', 'username': 'one'}],
+        'items': [{'item_id': str(i), 'user_id': 'u1', 'text': f"m{i}", 'timestamp': str(i)} for i in (3, 2, 1)]
+    }
+
+    class Api:
+        def direct_v2_inbox(self):
+            return {'inbox': {'threads': [thread], 'has_older': False}}
+
+    reader = InboxReader(sync)
+    first = list(reader.iter_messages(Api()))
+    assert [m['item_id'] for m in first] == ['1', '2', '3']
+    assert list(reader.iter_messages(Api())) == []  # In flight
+
+    sync.mark_handled(first[0])
+    sync.release(first[1])
+    assert [m['item_id'] for m in reader.iter_messages(Api())] == ['2', '3']
+    handler.close()
@@ -0,0 +1,49 @@
+from unittest.mock import patch
+from context_cache import UserContextCache
+
+def make_context(state='initial'):
+    return {'context': {}, 'state': state, 'previous_messages': []}
+
+def test_cache_hit_and_miss():
+    """Test basic hit/miss accounting"""
+    cache = UserContextCache(max_size=10)
+    assert cache.get("user") is None
+
+    cache.put("user", make_context('follow_up'))
+    assert cache.get("user")['state'] == 'follow_up'
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+def test_cache_returns_copies():
+    """Test that mutating a returned context does not change the cache"""
+    cache = UserContextCache()
+    cache.put("user", make_context())
+
+    cached = cache.get("user")
+    cached['context']['topic'] = 'pricing'
+    cached['previous_messages'].append("hello")
+
+    assert cache.get("user") == make_context()
+
+def test_lru_eviction():
+    """Test that the least recently used context is evicted first"""
+    cache = UserContextCache(max_size=2)
+    cache.put("a", make_context())
+    cache.put("b", make_context())
+    cache.get("a")
+    cache.put("c", make_context())
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()['evictions'] == 1
+
+def test_ttl_expiry():
+    """Test that expired contexts are treated as misses"""
+    cache = UserContextCache(ttl=10)
+    with patch('context_cache.time.monotonic', return_value=100.0):
+        cache.put("user", make_context())
+    with patch('context_cache.time.monotonic', return_value=111.0):
+        assert cache.get("user") is None
+    assert cache.stats()['expirations'] == 1
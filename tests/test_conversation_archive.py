@@ -0,0 +1,96 @@
+import os
+import threading
+from datetime import datetime, timezone
+from unittest.mock import patch
+import pytest
+from database_handler import DatabaseHandler
+
+@pytest.fixture
+def db(tmp_path):
+    handler = DatabaseHandler(db_path=str(tmp_path / "bot.db"), retention_days=30)
+    yield handler
+    handler.close()
+
+def insert(db, user_id, message, timestamp, response="ok"):
+    with db.connections.transaction() as conn:
+        conn.execute("""
+            INSERT INTO conversations (user_id, message, response, timestamp)
+            VALUES (?, ?, ?, ?)
+        """, (user_id, message, response, timestamp))
+
+NOW = datetime(2026, 6, 15, tzinfo=timezone.utc)
+
+def test_only_learned_rows_past_retention_are_archived(db):
+    """Test that old rows move to monthly partitions once the learner has counted them"""
+    insert(db, "u1", "january", "2026-01-10 10:00:00", "I'm still learning how to respond to that.")
+    insert(db, "u1", "february", "2026-02-03 10:00:00")
+    assert db.archive.archive(now=NOW) == 0  # Not counted by the learner yet
+
+    db.learn_from_conversations()
+    insert(db, "u2", "recent", "2026-06-10 10:00:00")
+    assert db.archive.archive(now=NOW) == 2
+
+    conn = db.connections.connection()
+    assert conn.execute("SELECT message FROM conversations").fetchall() == [("recent",)]
+    assert sorted(row[0] for row in conn.execute("SELECT partition FROM archive_partitions")) == ['2026-01', '2026-02']
+    assert conn.execute("SELECT conversations, unhandled FROM conversation_summary WHERE day = '2026-01-10'").fetchone() == (1, 1)
+    # The learner's counts survive archival
+    assert conn.execute("SELECT count FROM unhandled_counts").fetchone()[0] == 1
+
+def test_partition_files_are_written_outside_the_write_lock(db):
+    """Test that another writer can commit while the archive syncs a partition file"""
+    insert(db, "u1", "january", "2026-01-10 10:00:00")
+    db.learn_from_conversations()
+    writes = []
+    real_fsync = os.fsync
+
+    def write_from_another_thread():
+        insert(db, "u2", "during fsync", "2026-06-10 10:00:00")
+        writes.append(True)
+
+    def fsync(fd):
+        writer = threading.Thread(target=write_from_another_thread)
+        writer.start()
+        writer.join(timeout=2)
+        assert writes == [True]  # The write did not wait for the archive
+        real_fsync(fd)
+
+    with patch('conversation_archive.os.fsync', side_effect=fsync):
+        assert db.archive.archive(now=NOW) == 1
+
+def test_history_spans_archive_and_hot_table(db):
+    """Test that history reads archived and live rows as one ordered stream"""
+    insert(db, "u1", "old", "2026-01-10 10:00:00")
+    insert(db, "u2", "other user", "2026-01-11 10:00:00")
+    db.learn_from_conversations()
+    db.archive.archive(now=NOW)
+    insert(db, "u1", "new", "2026-06-10 10:00:00")
+
+    assert [row['message'] for row in db.conversation_history(user_id="u1")] == ["old", "new"]
+    assert [row['message'] for row in db.conversation_history(since="2026-01-11 00:00:00")] == ["other user", "new"]
+    assert [row['message'] for row in db.conversation_history(until="2026-02-01 00:00:00")] == ["old", "other user"]
+
+def test_in_memory_database_keeps_everything():
+    handler = DatabaseHandler(db_path=":memory:")
+    insert(handler, "u1", "old", "2020-01-01 00:00:00")
+    handler.learn_from_conversations()
+    assert handler.archive_conversations() == 0
+    assert [row['message'] for row in handler.conversation_history()] == ["old"]
+    handler.close()
+
+def test_history_yields_a_row_archived_twice_once(db):
+    """Test that a row left in the hot table after archiving, or archived again, appears once"""
+    insert(db, "u1", "old", "2026-01-10 10:00:00")
+    db.learn_from_conversations()
+    conn = db.connections.connection()
+    row = conn.execute("SELECT id, user_id, message, response, timestamp FROM conversations").fetchone()
+    db.archive.archive(now=NOW)
+
+    # As if the delete after the first archive run had failed
+    with db.connections.transaction() as conn:
+        conn.execute("INSERT INTO conversations (id, user_id, message, response, timestamp) VALUES (?, ?, ?, ?, ?)", row)
+    db.archive.archive(now=NOW)
+    with db.connections.transaction() as conn:
+        conn.execute("INSERT INTO conversations (id, user_id, message, response, timestamp) VALUES (?, ?, ?, ?, ?)", row)
+
+    assert [row['message'] for row in db.conversation_history()] == ["old"]
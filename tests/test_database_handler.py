@@ -1,7 +1,10 @@
 import pytest
 import sqlite3
 import json
+import time
+from collections import defaultdict
 from database_handler import DatabaseHandler
+from migrations import SCHEMA_VERSION
 from datetime import datetime
 
 @pytest.fixture
@@ -12,7 +15,7 @@ def db_handler():
 
 def test_database_initialization(db_handler):
     """Test if database tables are created correctly"""
-    with sqlite3.connect(db_handler.db_path) as conn:
+    with db_handler.connections.connection() as conn:
         cursor = conn.cursor()
         
         # Check if tables exist
@@ -52,8 +55,9 @@ def test_conversation_logging(db_handler):
     test_response = "Hi! How can I help you?"
     
     db_handler.log_conversation(user_id, test_message, test_response)
+    db_handler.flush()
     
-    with sqlite3.connect(db_handler.db_path) as conn:
+    with db_handler.connections.connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM conversations WHERE user_id = ?", (user_id,))
         conversation = cursor.fetchone()
@@ -100,7 +104,7 @@ def test_conversation_flow(db_handler):
 def test_learning_mechanism(db_handler):
     """Test the learning mechanism"""
     # Insert some test conversations with unhandled responses
-    with sqlite3.connect(db_handler.db_path) as conn:
+    with db_handler.connections.connection() as conn:
         cursor = conn.cursor()
         for _ in range(3):
             cursor.execute("""
@@ -113,4 +117,351 @@ def test_learning_mechanism(db_handler):
     
     # Check if a new response pattern was generated
     response, _ = db_handler.find_best_response("when do you open", "test_user")
-    assert "still learning" not in response.lower() 
\ No newline at end of file
+    assert "still learning" not in response.lower() 
+
+def test_in_memory_database_is_shared_across_threads(db_handler):
+    """Test that every thread sees the same in-memory database"""
+    import threading
+
+    db_handler.update_user_context("thread_user", {'topic': 'support'}, 'follow_up', "help")
+    seen = {}
+
+    def read_context():
+        seen['context'] = db_handler.get_user_context("thread_user")
+        seen['conn'] = db_handler.connections.connection()
+
+    worker = threading.Thread(target=read_context)
+    worker.start()
+    worker.join()
+
+    assert seen['context']['state'] == 'follow_up'
+    assert seen['conn'] is not db_handler.connections.connection()
+
+
+def test_connection_is_reused(db_handler):
+    """Test that a thread keeps its connection between calls"""
+    conn = db_handler.connections.connection()
+    db_handler.get_user_context("reuse_user")
+    assert db_handler.connections.connection() is conn
+
+
+def test_file_database_uses_wal(tmp_path):
+    """Test that file-backed databases run in WAL mode"""
+    handler = DatabaseHandler(db_path=str(tmp_path / "bot.db"))
+    mode = handler.connections.connection().execute("PRAGMA journal_mode").fetchone()[0]
+    handler.close()
+    assert mode.lower() == 'wal'
+
+def test_nested_transaction_commits_with_the_outer_block(db_handler):
+    connections = db_handler.connections
+    with pytest.raises(RuntimeError):
+        with connections.transaction() as conn:
+            conn.execute("INSERT INTO responses (pattern, response) VALUES ('outer', 'x')")
+            with connections.transaction() as inner:
+                inner.execute("INSERT INTO responses (pattern, response) VALUES ('inner', 'y')")
+            raise RuntimeError("abort the outer transaction")
+
+    rows = connections.connection().execute(
+        "SELECT COUNT(*) FROM responses WHERE pattern IN ('outer', 'inner')"
+    ).fetchone()
+    assert rows[0] == 0
+
+def test_thread_connection_is_closed_when_the_thread_exits(db_handler):
+    import gc
+    import threading
+    connections = db_handler.connections
+    before = len(connections._connections)
+
+    thread = threading.Thread(target=lambda: connections.connection().execute("SELECT 1"))
+    thread.start()
+    thread.join()
+    gc.collect()
+    assert len(connections._connections) == before
+
+def test_conversation_journal_batches_writes():
+    """Test that logged conversations are queued and flushed together"""
+    db_handler = DatabaseHandler(db_path=":memory:", journal_flush_interval=60)
+    for i in range(5):
+        db_handler.log_conversation("journal_user", f"message {i}", "reply")
+
+    assert db_handler.journal.stats()['queue_depth'] == 5
+    assert db_handler.flush() == 5
+
+    stats = db_handler.journal.stats()
+    assert stats['queue_depth'] == 0
+    assert stats['flush_count'] == 1
+    with db_handler.connections.connection() as conn:
+        count = conn.execute(
+            "SELECT COUNT(*) FROM conversations WHERE user_id = ?", ("journal_user",)
+        ).fetchone()[0]
+    assert count == 5
+
+
+def test_close_flushes_journal(tmp_path):
+    """Test that closing the handler writes out queued conversations"""
+    db_path = str(tmp_path / "bot.db")
+    handler = DatabaseHandler(db_path=db_path, journal_flush_interval=60)
+    handler.log_conversation("closing_user", "bye", "Take care!")
+    handler.close()
+
+    with sqlite3.connect(db_path) as conn:
+        count = conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+    assert count == 1
+
+
+def test_context_read_once_per_message(db_handler):
+    """Test that one message's pipeline only reads the context from SQLite once"""
+    user_id = "cached_user"
+    db_handler.get_user_context(user_id)
+    db_handler.update_user_context(user_id, {}, 'initial', "hello")
+    db_handler.find_best_response("hello", user_id)
+    db_handler.log_conversation(user_id, "hello", "Hi!")
+
+    stats = db_handler.context_cache.stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] == 2  # update_user_context writes without reading
+
+
+def test_learned_pattern_reaches_matcher(db_handler):
+    """Test that learning patches the in-memory matcher"""
+    size = len(db_handler.matcher)
+    with db_handler.connections.connection() as conn:
+        conn.executemany("""
+            INSERT INTO conversations (user_id, message, response)
+            VALUES (?, ?, ?)
+        """, [("test_user", "where is the shop", "I'm still learning how to respond to that.")] * 3)
+
+    db_handler.learn_from_conversations()
+    assert len(db_handler.matcher) == size + 1
+
+def test_legacy_database_is_upgraded_in_place(tmp_path):
+    """Test that a database from before migrations gets the new columns, indexes and flags"""
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, message TEXT NOT NULL,
+            response TEXT NOT NULL, context TEXT, was_helpful BOOLEAN DEFAULT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO conversations (user_id, message, response) VALUES (?, ?, ?)",
+        [("u1", "Where is the SHOP", "I'm still learning how to respond to that.")] * 2
+        + [("u1", "hello", "Hi!")]
+    )
+    conn.commit()
+    conn.close()
+
+    handler = DatabaseHandler(db_path=path)
+    conn = handler.connections.connection()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'idx_conversations_user_time', 'idx_conversations_unhandled'} <= indexes
+    assert conn.execute("SELECT SUM(unhandled) FROM conversations").fetchone()[0] == 2
+
+    # A third variant of the same message groups with the backfilled ones
+    handler.log_conversation("u2", "where is  the shop", "I'm still learning how to respond to that.")
+    size = len(handler.matcher)
+    handler.learn_from_conversations()
+    assert len(handler.matcher) == size + 1
+
+    plan = ' '.join(row[3] for row in conn.execute("""
+        EXPLAIN QUERY PLAN SELECT MIN(message) FROM conversations
+        WHERE unhandled = 1 GROUP BY message_hash HAVING COUNT(*) >= 3
+    """))
+    assert 'idx_conversations_unhandled' in plan
+    handler.close()
+
+    # Reopening runs no migrations again
+    DatabaseHandler(db_path=path).close()
+
+def test_learning_is_incremental_and_idempotent(db_handler):
+    """Test that counts carry over between runs and a pattern is only learned once"""
+    unhandled = "I'm still learning how to respond to that."
+    for _ in range(2):
+        db_handler.log_conversation("u1", "where is the shop", unhandled)
+    assert db_handler.learn_from_conversations() == 0
+
+    # The third occurrence arrives after the first run
+    db_handler.log_conversation("u2", "Where is the shop", unhandled)
+    assert db_handler.learn_from_conversations() == 1
+
+    for _ in range(3):
+        db_handler.log_conversation("u3", "where is the shop", unhandled)
+    assert db_handler.learn_from_conversations() == 0
+
+    conn = db_handler.connections.connection()
+    assert conn.execute("SELECT COUNT(*) FROM responses WHERE pattern = 'where is the shop'").fetchone()[0] == 1
+    assert conn.execute("SELECT count FROM unhandled_counts").fetchone()[0] == 6
+
+def test_message_history_is_an_append_only_window(db_handler):
+    """Test that the trigger keeps only the last messages and updates never rewrite history"""
+    for i in range(8):
+        db_handler.update_user_context("u1", {'topic': 'pricing'}, 'follow_up', f"message {i}")
+
+    conn = db_handler.connections.connection()
+    rows = conn.execute("SELECT message FROM message_history WHERE user_id = 'u1' ORDER BY id").fetchall()
+    assert [row[0] for row in rows] == [f"message {i}" for i in range(3, 8)]
+    assert conn.execute("SELECT previous_messages FROM user_contexts WHERE user_id = 'u1'").fetchone()[0] is None
+
+    db_handler.context_cache.invalidate()
+    context = db_handler.get_user_context("u1")
+    assert context['previous_messages'] == [f"message {i}" for i in range(3, 8)]
+    assert context['state'] == 'follow_up'
+
+def test_json_history_is_moved_by_migration(tmp_path):
+    """Test that previous_messages JSON from an older database lands in message_history"""
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE user_contexts (
+            user_id TEXT PRIMARY KEY, context TEXT, last_interaction TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            conversation_state TEXT, previous_messages TEXT
+        )
+    """)
+    conn.execute("INSERT INTO user_contexts VALUES ('u1', '{}', CURRENT_TIMESTAMP, 'initial', ?)",
+                 (json.dumps(["a", "b"]),))
+    conn.commit()
+    conn.close()
+
+    handler = DatabaseHandler(db_path=path)
+    assert handler.get_user_context("u1")['previous_messages'] == ["a", "b"]
+    handler.close()
+
+def test_reopening_a_current_database_runs_no_migrations(tmp_path, monkeypatch):
+    path = str(tmp_path / "bot.db")
+    DatabaseHandler(db_path=path).close()
+
+    def fail(conn):
+        raise AssertionError("migrate() ran on a current schema")
+
+    monkeypatch.setattr('database_handler.migrate', fail)
+    handler = DatabaseHandler(db_path=path)
+    assert handler._matcher is None  # Built on the first lookup
+    response, _ = handler.find_best_response("hello", "u1", simulate_typing=False)
+    assert response
+    assert len(handler.matcher) == 10
+    handler.close()
+
+def test_empty_responses_are_reseeded_on_a_current_schema(tmp_path):
+    path = str(tmp_path / "bot.db")
+    handler = DatabaseHandler(db_path=path)
+    with handler.connections.transaction() as conn:
+        conn.execute("DELETE FROM responses")
+    handler.close()
+
+    handler = DatabaseHandler(db_path=path)
+    assert len(handler.matcher) == 10
+    handler.close()
+
+BATCH = [
+    ("u1", "hi there"),
+    ("u2", "what are your prices?"),
+    ("u1", "how much is it"),
+    ("u3", "where are you located"),
+    ("u2", "thanks, bye"),
+    ("u4", "I need help with my order"),
+    ("u1", "ok"),
+]
+
+def test_batch_matches_the_per_message_path():
+    """Test that find_best_responses gives the replies and rows of one call per message"""
+    import random
+
+    def per_message(handler):
+        replies = []
+        for user_id, message in BATCH:
+            classification = handler.classifier.classify(message)
+            context = handler.get_user_context(user_id)
+            if classification.topic:
+                context['context']['topic'] = classification.topic
+            handler.update_user_context(user_id, context['context'], classification.state, classification.text)
+            response, response_id = handler.find_best_response(message, user_id, classification, simulate_typing=False)
+            handler.log_conversation(user_id, classification.text, response)
+            replies.append((response, response_id))
+        return replies
+
+    def snapshot(handler):
+        handler.flush()
+        conn = handler.connections.connection()
+        return (
+            conn.execute("SELECT user_id, message, response, context, unhandled FROM conversations ORDER BY id").fetchall(),
+            conn.execute("SELECT user_id, context, conversation_state FROM user_contexts ORDER BY user_id").fetchall(),
+            conn.execute("SELECT user_id, message FROM message_history ORDER BY id").fetchall()
+        )
+
+    single = DatabaseHandler(db_path=":memory:")
+    random.seed(7)
+    expected = per_message(single)
+    expected_rows = snapshot(single)
+    single.close()
+
+    batch = DatabaseHandler(db_path=":memory:")
+    random.seed(7)
+    results = batch.find_best_responses(BATCH)
+    assert [(response, response_id) for response, response_id, _ in results] == expected
+    assert snapshot(batch) == expected_rows
+    # The cache holds the same contexts a fresh read would
+    cached = batch.get_user_contexts(["u1", "u2"])
+    batch.context_cache.invalidate()
+    assert batch.get_user_contexts(["u1", "u2"]) == cached
+    batch.close()
+
+def test_batch_reads_contexts_once_and_writes_once(monkeypatch):
+    handler = DatabaseHandler(db_path=":memory:")
+    handler.find_best_responses([("u1", "hello")])
+    handler.context_cache.invalidate()
+
+    transactions = []
+    original = handler.connections.transaction
+
+    def counting():
+        transactions.append(1)
+        return original()
+
+    monkeypatch.setattr(handler.connections, 'transaction', counting)
+    misses = handler.context_cache.stats()['misses']
+    handler.find_best_responses(BATCH)
+    assert len(transactions) == 1
+    assert handler.context_cache.stats()['misses'] - misses == 4  # One per distinct user, nothing per message
+    handler.close()
+
+def test_batch_observes_each_stage_per_message():
+    """Test that a batch records the same stages as handle_message, once per message"""
+    handler = DatabaseHandler(db_path=":memory:")
+    observed = defaultdict(list)
+    handler.find_best_responses(BATCH, observe=lambda stage, seconds: observed[stage].append(seconds))
+    assert sorted(observed) == ['classify', 'context_lookup', 'conversation_log', 'response_match']
+    assert all(len(samples) == len(BATCH) for samples in observed.values())
+    assert all(seconds >= 0 for samples in observed.values() for seconds in samples)
+    handler.close()
+
+def test_queued_stats_equal_single_updates():
+    single = DatabaseHandler(db_path=":memory:")
+    queued = DatabaseHandler(db_path=":memory:")
+    outcomes = [(2, True), (2, False), (3, True), (2, True), (-1, True)]
+    for response_id, helpful in outcomes:
+        single.update_response_stats(response_id, helpful)
+        queued.queue_response_stats(response_id, helpful)
+
+    stats = "SELECT id, usage_count, success_rate FROM responses ORDER BY id"
+    assert queued.connections.connection().execute(stats).fetchall() != \
+        single.connections.connection().execute(stats).fetchall()
+    queued.find_best_responses([("u1", "hello")])  # Written with the next batch
+    expected = single.connections.connection().execute(stats).fetchall()
+    actual = queued.connections.connection().execute(stats).fetchall()
+    assert [row[:2] for row in actual] == [row[:2] for row in expected]
+    assert [row[2] for row in actual] == pytest.approx([row[2] for row in expected])
+    single.close()
+    queued.close()
+
+def test_queued_stats_written_by_journal_timer():
+    handler = DatabaseHandler(db_path=":memory:", journal_flush_interval=0.05)
+    handler.queue_response_stats(2, True)
+    usage = "SELECT usage_count FROM responses WHERE id = 2"
+    deadline = time.monotonic() + 2.0
+    while handler.connections.connection().execute(usage).fetchone()[0] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert handler.connections.connection().execute(usage).fetchone()[0] == 1  # No batch or flush() needed
+    handler.close()
@@ -0,0 +1,50 @@
+import time
+import pytest
+from database_handler import DatabaseHandler
+from fake_instagram import FakeInstagramClient, FakeInstagramError
+from inbox_reader import InboxReader
+from inbox_sync import InboxSync
+
+@pytest.fixture
+def sync():
+    handler = DatabaseHandler(db_path=":memory:")
+    yield InboxSync(handler, own_user_id='bot')
+    handler.close()
+
+def test_reader_sees_every_generated_message(sync):
+    """Test that the fake inbox paginates and the reader walks all of it"""
+    client = FakeInstagramClient(threads=30, message_rate=1e6, total_messages=200,
+                                 inbox_page_size=7, thread_page_size=3)
+    client.start()
+    time.sleep(0.01)
+    reader = InboxReader(sync, max_thread_pages=100)
+
+    messages = list(reader.iter_messages(client))
+    assert client.generated == 200
+    assert len(messages) == 200
+    assert len({m['item_id'] for m in messages}) == 200
+    assert client.calls['direct_v2_inbox'] > 1
+    assert client.calls['direct_v2_thread'] > 0
+
+def test_replies_are_timed_and_not_read_back(sync):
+    """Test that a reply answers its thread and the bot's own item is ignored"""
+    client = FakeInstagramClient(threads=1, message_rate=1e6, total_messages=2)
+    client.start()
+    time.sleep(0.01)
+    reader = InboxReader(sync)
+    messages = list(reader.iter_messages(client))
+    assert len(messages) == 2
+
+    client.direct_v2_send(text="hello", thread_ids=[messages[0]['thread_id']])
+    assert client.answered() == 2
+    for message in messages:
+        sync.mark_handled(message)
+    assert list(reader.iter_messages(client)) == []
+
+def test_injected_errors_and_latency():
+    client = FakeInstagramClient(threads=1, latency=0.05, error_rate=1.0)
+    started = time.monotonic()
+    with pytest.raises(FakeInstagramError):
+        client.direct_v2_inbox()
+    assert time.monotonic() - started >= 0.05
+    assert client.errors == 1
@@ -0,0 +1,115 @@
+import pytest
+from database_handler import DatabaseHandler
+from inbox_sync import InboxSync
+from inbox_reader import InboxMessage, InboxReader
+
+def item(item_id, timestamp):
+    return {'item_id': item_id, 'timestamp': str(timestamp), 'text': item_id, 'user_id': 'u1'}
+
+def thread(thread_id, items, has_older=False, cursor=None):
+    return {
+        'thread_id': thread_id,
+        'pending': True,
+        'last_activity_at': max(int(i['timestamp']) for i in items),
+        'users': [{'pk': 'u1', 'username': 'someone'}],
+        'items': items,
+        'has_older': has_older,
+        'oldest_cursor': cursor
+    }
+
+class FakeInboxAPI:
+    """Serves pre-built inbox and thread pages and records every request"""
+
+    def __init__(self, inbox_pages, thread_pages=None):
+        self.inbox_pages = inbox_pages
+        self.thread_pages = thread_pages or {}
+        self.calls = []
+
+    def direct_v2_inbox(self, cursor=None):
+        self.calls.append(('inbox', cursor))
+        return {'inbox': self.inbox_pages[cursor]}
+
+    def direct_v2_thread(self, thread_id, cursor=None):
+        self.calls.append(('thread', thread_id, cursor))
+        return {'thread': self.thread_pages[(thread_id, cursor)]}
+
+@pytest.fixture
+def sync():
+    handler = DatabaseHandler(db_path=":memory:")
+    yield InboxSync(handler)
+    handler.close()
+
+def test_first_page_is_yielded_before_the_next_is_fetched(sync):
+    """Test that inbox pages are requested lazily"""
+    api = FakeInboxAPI({
+        None: {'threads': [thread('t1', [item('a', 10)])], 'has_older': True, 'oldest_cursor': 'p2'},
+        'p2': {'threads': [thread('t2', [item('b', 20)])], 'has_older': False}
+    })
+    messages = InboxReader(sync).iter_messages(api)
+
+    first = next(messages)
+    assert isinstance(first, InboxMessage)
+    assert (first['thread_id'], first['message']) == ('t1', 'a')
+    assert api.calls == [('inbox', None)]
+
+    assert [m['thread_id'] for m in messages] == ['t2']
+    assert api.calls == [('inbox', None), ('inbox', 'p2')]
+
+def test_pages_are_yielded_whole_before_the_next_is_fetched(sync):
+    """Test that iter_pages hands out one inbox page at a time"""
+    api = FakeInboxAPI({
+        None: {'threads': [thread('t1', [item('a', 10), item('b', 11)]), thread('t2', [item('c', 12)])],
+               'has_older': True, 'oldest_cursor': 'p2'},
+        'p2': {'threads': [thread('t3', [item('d', 20)])], 'has_older': False}
+    })
+    pages = InboxReader(sync).iter_pages(api)
+
+    assert [m['item_id'] for m in next(pages)] == ['a', 'b', 'c']
+    assert api.calls == [('inbox', None)]
+    assert [[m['item_id'] for m in page] for page in pages] == [['d']]
+
+def test_thread_pages_followed_until_handled_items(sync):
+    """Test that older thread pages are read only while they may hold unhandled items"""
+    sync.mark_handled({'thread_id': 't1', 'item_id': 'a', 'timestamp': '10'})
+    api = FakeInboxAPI(
+        {None: {'threads': [thread('t1', [item('d', 40)], has_older=True, cursor='c1')]}},
+        {
+            ('t1', 'c1'): {'items': [item('c', 30), item('b', 20)], 'has_older': True, 'oldest_cursor': 'c2'},
+            ('t1', 'c2'): {'items': [item('a', 10)], 'has_older': False}
+        }
+    )
+    reader = InboxReader(sync)
+
+    assert [m['item_id'] for m in reader.iter_messages(api)] == ['b', 'c', 'd']
+    assert reader.thread_pages == 2
+
+    # Once everything up to 'd' is in flight, the thread cursor is not followed again
+    api.calls.clear()
+    assert list(reader.iter_messages(api)) == []
+    assert api.calls == [('inbox', None)]
+
+def test_page_cap_applies_only_to_unknown_threads(sync):
+    """Test that a known thread is read back to its watermark however many pages that takes"""
+    pages = {
+        ('t1', 'c1'): {'items': [item('d', 40)], 'has_older': True, 'oldest_cursor': 'c2'},
+        ('t1', 'c2'): {'items': [item('c', 30)], 'has_older': True, 'oldest_cursor': 'c3'},
+        ('t1', 'c3'): {'items': [item('b', 20)], 'has_older': True, 'oldest_cursor': 'c4'},
+        ('t1', 'c4'): {'items': [item('a', 10)], 'has_older': False}
+    }
+    inbox = {None: {'threads': [thread('t1', [item('e', 50)], has_older=True, cursor='c1')]}}
+
+    assert [m['item_id'] for m in InboxReader(sync, max_thread_pages=2).iter_messages(FakeInboxAPI(inbox, pages))] == ['d', 'e']
+
+    handler = sync.db
+    known = InboxSync(handler)
+    known.mark_handled({'thread_id': 't1', 'item_id': 'a', 'timestamp': '10'})
+    reader = InboxReader(known, max_thread_pages=2)
+    assert [m['item_id'] for m in reader.iter_messages(FakeInboxAPI(inbox, pages))] == ['b', 'c', 'd', 'e']
+
+def test_message_record_is_compact():
+    """Test that message records have no per-instance dict"""
+    message = InboxMessage('t1', 'u1', 'someone', 'hi', '10', 'a')
+    assert not hasattr(message, '__dict__')
+    assert message.get('item_id') == 'a'
+    with pytest.raises(KeyError):
+        message['missing']
@@ -0,0 +1,64 @@
+import pytest
+from database_handler import DatabaseHandler
+from inbox_sync import InboxSync
+
+def make_thread(items, activity):
+    return {
+        'thread_id': 't1',
+        'pending': True,
+        'last_activity_at': activity,
+        'users': [{'pk': 'u1', 'username': 'someone'}],
+        'items': items
+    }
+
+def item(item_id, timestamp, user_id='u1'):
+    return {'item_id': item_id, 'timestamp': str(timestamp), 'text': item_id, 'user_id': user_id}
+
+@pytest.fixture
+def db():
+    handler = DatabaseHandler(db_path=":memory:")
+    yield handler
+    handler.close()
+
+def test_only_new_items_are_emitted(db):
+    """Test that handled items are not emitted again, even after a restart"""
+    sync = InboxSync(db, own_user_id='me')
+    thread = make_thread([item('b', 20), item('a', 10)], activity=20)
+
+    emitted = sync.new_items(thread)
+    assert [i['item_id'] for i in emitted] == ['a', 'b']
+    # In flight items are not emitted twice
+    assert sync.new_items(thread) == []
+
+    for i in emitted:
+        sync.mark_handled({'thread_id': 't1', 'item_id': i['item_id'], 'timestamp': i['timestamp']})
+
+    restarted = InboxSync(db, own_user_id='me')
+    assert not restarted.thread_changed(thread)
+
+    thread = make_thread([item('c', 30), item('b', 20), item('a', 10)], activity=30)
+    assert restarted.thread_changed(thread)
+    assert [i['item_id'] for i in restarted.new_items(thread)] == ['c']
+
+def test_own_replies_are_ignored(db):
+    """Test that the bot's own messages never come back as work"""
+    sync = InboxSync(db, own_user_id='me')
+    sync.mark_handled({'thread_id': 't1', 'item_id': 'a', 'timestamp': '10'})
+
+    thread = make_thread([item('reply', 15, user_id='me'), item('a', 10)], activity=15)
+    assert sync.new_items(thread) == []
+    assert not sync.thread_changed(thread)
+
+def test_own_replies_with_int_ids_are_ignored(db):
+    """Test that a cookie's str user id still matches the int ids of thread items"""
+    sync = InboxSync(db, own_user_id='12345')
+    thread = make_thread([item('mine', 10, user_id=12345), item('theirs', 20, user_id=678)], activity=20)
+    assert [i['item_id'] for i in sync.new_items(thread)] == ['theirs']
+
+def test_watermark_never_moves_back(db):
+    """Test that out-of-order marks keep the newest watermark"""
+    sync = InboxSync(db)
+    sync.mark_handled({'thread_id': 't1', 'item_id': 'b', 'timestamp': '20'})
+    sync.mark_handled({'thread_id': 't1', 'item_id': 'a', 'timestamp': '10'})
+
+    assert db.get_thread_watermarks()['t1'][:2] == ('b', 20)
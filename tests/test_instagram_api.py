@@ -1,4 +1,5 @@
 import pytest
+import time
 from unittest.mock import Mock, patch
 from instagram_api import InstagramMessageAPI
 
@@ -25,14 +26,14 @@ def test_message_handling(mock_api):
         'timestamp': '1234567890'
     }
     
-    # Mock send_message method
-    mock_api.send_message = Mock(return_value=True)
+    # Mock queue_message method
+    mock_api.queue_message = Mock()
     
     # Handle the message
     mock_api.handle_message(test_message)
     
-    # Verify that send_message was called
-    mock_api.send_message.assert_called_once()
+    # Verify that the reply was scheduled
+    mock_api.queue_message.assert_called_once()
 
 def test_context_update(mock_api):
     """Test context updating"""
@@ -46,17 +47,17 @@ def test_context_update(mock_api):
     assert updated_context['state'] == 'awaiting_details'
     assert updated_context['context'].get('topic') == 'pricing'
 
-@patch('time.sleep', return_value=None)
-def test_message_loop(mock_sleep, mock_api):
+def test_message_loop(mock_api):
     """Test message monitoring loop"""
-    # Mock get_pending_messages to return one message then raise KeyboardInterrupt
-    mock_api.get_pending_messages = Mock(side_effect=[
-        [{'thread_id': '1', 'user_id': '1', 'message': 'test', 'username': 'test', 'timestamp': '123'}],
+    mock_api.poll_scheduler.wait_for_poll = Mock(return_value=False)
+    # Mock iter_pending_pages to stream one page then raise KeyboardInterrupt
+    mock_api.iter_pending_pages = Mock(side_effect=[
+        [[{'thread_id': '1', 'user_id': '1', 'message': 'test', 'username': 'test', 'timestamp': '123'}]],
         KeyboardInterrupt
     ])
     
-    # Mock handle_message
-    mock_api.handle_message = Mock()
+    # Mock handle_messages
+    mock_api.handle_messages = Mock()
     
     # Run the message loop
     try:
@@ -64,8 +65,9 @@ def test_message_loop(mock_sleep, mock_api):
     except KeyboardInterrupt:
         pass
     
-    # Verify that handle_message was called
-    mock_api.handle_message.assert_called_once()
+    # Verify that the page was handled as one batch
+    mock_api.handle_messages.assert_called_once()
+    assert len(mock_api.handle_messages.call_args.args[0]) == 1
 
 def test_pending_messages_fetch(mock_api):
     """Test fetching pending messages"""
@@ -96,4 +98,155 @@ def test_error_handling(mock_api):
     mock_api.api.direct_v2_send.side_effect = Exception("Test error")
     
     result = mock_api.send_message("test_thread", "test message")
-    assert result is False 
\ No newline at end of file
+    assert result is False 
+
+def test_queue_message_does_not_block(mock_api):
+    """Test that scheduling a reply returns before the typing delay elapses"""
+    results = []
+    start = time.monotonic()
+    future = mock_api.queue_message("test_thread", "hello there", delay=0.2, callback=results.append)
+    assert time.monotonic() - start < 0.1
+    assert not future.done()
+
+    assert future.result(timeout=5) is True
+    mock_api.send_scheduler.wait_idle(timeout=5)
+    assert results == [True]
+    activity = [call.kwargs['activity_indicator_id'] for call in mock_api.api.direct_v2_indicate_activity.call_args_list]
+    assert activity == [1, 0]
+
+def test_watermark_moves_only_after_the_send(mock_api):
+    """Test that a message whose reply failed is handed out again instead of being marked handled"""
+    mock_api.inbox_sync.mark_handled = Mock()
+    mock_api.inbox_sync.release = Mock()
+    message = {'thread_id': 't1', 'user_id': 'u1', 'username': 'one', 'message': "zzz",
+               'timestamp': str(int(time.time() * 1e6)), 'item_id': 'i1'}
+
+    mock_api.api.direct_v2_send.side_effect = Exception("Test error")
+    mock_api.handle_message(message)
+    mock_api.send_scheduler.wait_idle(timeout=5)
+    mock_api.inbox_sync.release.assert_called_once_with(message)
+    mock_api.inbox_sync.mark_handled.assert_not_called()
+
+    mock_api.api.direct_v2_send.side_effect = None
+    mock_api.handle_message(message)
+    mock_api.send_scheduler.wait_idle(timeout=5)
+    mock_api.inbox_sync.mark_handled.assert_called_once_with(message)
+
+def test_busy_metrics_port_does_not_stop_the_bot(mock_api):
+    """Test that the bot keeps running without metrics when the port is taken"""
+    import socket
+    with socket.socket() as taken:
+        taken.bind(('127.0.0.1', 0))
+        taken.listen()
+        assert mock_api.serve_metrics(taken.getsockname()[1], summary_interval=None) is None
+    assert mock_api.metrics_server is None
+
+def test_stop_interrupts_the_poll_wait(mock_api):
+    """Test that stop() ends a long wait between polls right away"""
+    import threading
+    mock_api.iter_pending_pages = Mock(return_value=[])
+    mock_api.poll_scheduler.min_interval = mock_api.poll_scheduler.interval = 60.0
+    loop = threading.Thread(target=mock_api.start_message_loop)
+    loop.start()
+    time.sleep(0.2)
+    started = time.monotonic()
+    mock_api.stop()
+    loop.join(timeout=5)
+    assert not loop.is_alive()
+    assert time.monotonic() - started < 1.0
+
+def test_poll_cycle_is_batched_per_shard(mock_api):
+    """Each worker shard gets one batch, and a thread's messages stay in one of them"""
+    messages = [{'thread_id': f't{i % 6}', 'user_id': f'u{i % 6}', 'username': 'user',
+                 'message': f'hello {i}', 'timestamp': str(i)} for i in range(12)]
+    batches = []
+    mock_api.handle_messages = lambda batch: batches.append(batch)
+    mock_api.submit_batches(messages)
+    mock_api.workers.join()
+    assert sorted(len(batch) for batch in batches) == sorted(
+        sum(1 for m in messages if mock_api.workers.shard(m['thread_id']) == shard)
+        for shard in {mock_api.workers.shard(m['thread_id']) for m in messages})
+    for batch in batches:
+        assert len({mock_api.workers.shard(m['thread_id']) for m in batch}) == 1
+    assert sorted(m['timestamp'] for batch in batches for m in batch) == sorted(m['timestamp'] for m in messages)
+
+def test_burst_gets_one_reply(mock_api):
+    """Test that a thread's back-to-back messages are answered once"""
+    now = int(time.time() * 1e6)
+    burst = [
+        {'thread_id': 't1', 'user_id': 'u1', 'username': 'one', 'message': text, 'timestamp': str(now - offset),
+         'item_id': text}
+        for text, offset in (("hi", 60_000_000), ("what are your prices?", 59_000_000))
+    ]
+    typing = {'thread_id': 't2', 'user_id': 'u2', 'username': 'two', 'message': "hey", 'timestamp': str(now),
+              'item_id': 'hey'}
+    mock_api.inbox_sync.release = Mock()
+
+    ready = mock_api.coalesce(burst + [typing])
+    assert len(ready) == 1
+    assert ready[0]['message'] == "hi\nwhat are your prices?"
+    mock_api.inbox_sync.release.assert_called_once_with(typing)
+    assert mock_api.metrics.counter('messages_coalesced') == 1
+
+def test_failed_burst_send_hands_out_every_part(mock_api):
+    """Test that all parts of a merged burst are read again when its reply fails"""
+    now = int(time.time() * 1e6)
+    mock_api.inbox_sync.own_user_id = 'bot'
+    mock_api.api.direct_v2_inbox.return_value = {'inbox': {'has_older': False, 'threads': [{
+        'thread_id': 't1', 'pending': True, 'last_activity_at': now,
+        'users': [{'pk': 'u1', 'username': 'one'}],
+        'items': [{'item_id': text, 'user_id': 'u1', 'text': text, 'timestamp': str(now - offset)}
+                  for text, offset in (("zzz", 58_000_000), ("qqq", 59_000_000), ("xxx", 60_000_000))]
+    }]}}
+
+    ready = mock_api.coalesce(list(mock_api.iter_pending_messages()))
+    assert len(ready) == 1
+    mock_api.api.direct_v2_send.side_effect = Exception("Test error")
+    mock_api.handle_messages(ready)
+    mock_api.send_scheduler.wait_idle(timeout=5)
+
+    assert [m['item_id'] for m in mock_api.iter_pending_messages()] == ["xxx", "qqq", "zzz"]
+
+def test_rate_limited_sends_go_to_the_oldest_message_first(mock_api):
+    """Test that a waiting reply to an old message overtakes newer ones"""
+    mock_api.queue_message("t1", "first")  # Takes the only send token
+    newer = mock_api.queue_message("t2", "newer", sla_class='pricing')
+    older = mock_api.queue_message("t3", "older", sla_class='pricing', message_age=300.0)
+    assert older.result(timeout=5) is True
+    assert newer.result(timeout=5) is True
+
+    sent = [call.kwargs['text'] for call in mock_api.api.direct_v2_send.call_args_list]
+    assert sent == ["first", "older", "newer"]
+    assert mock_api.metrics.counter('sla_missed') == 1
+    assert mock_api.metrics.stage('send_queue_delay').snapshot()[1] == 3
+
+def test_stale_closing_is_dropped(mock_api):
+    """Test that a reply to a long-gone goodbye is never sent"""
+    results = []
+    future = mock_api.queue_message("t1", "you're welcome", callback=results.append,
+                                    sla_class='closing', message_age=7200.0)
+    assert future.result(timeout=5) is None
+    assert results == [None]
+    mock_api.api.direct_v2_send.assert_not_called()
+    assert mock_api.metrics.counter('replies_dropped_stale') == 1
+
+def test_failed_typing_indicator_still_sends(mock_api):
+    """Test that the reserved send token is used even when the typing indicator fails"""
+    mock_api.api.direct_v2_indicate_activity.side_effect = Exception("Test error")
+    assert mock_api.queue_message("t1", "hello").result(timeout=5) is True
+    mock_api.send_scheduler.wait_idle(timeout=5)
+    mock_api.api.direct_v2_send.assert_called_once()
+    assert mock_api.metrics.counter('typing_failed') == 1
+    assert mock_api.metrics.counter('sla_met') == 1
+
+def test_failed_send_counts_as_sla_miss(mock_api):
+    """Test that a reply that could not be sent is reported against its SLA"""
+    mock_api.api.direct_v2_send.side_effect = Exception("Test error")
+    assert mock_api.queue_message("t1", "hello").result(timeout=5) is False
+    assert mock_api.metrics.counter('sends_failed') == 1
+    assert mock_api.metrics.counter('sla_missed') == 1
+    assert mock_api.outbox.stats()['sla_miss_rate'] == 1.0
+    # The typing indicator still goes off
+    mock_api.send_scheduler.wait_idle(timeout=5)
+    activity = [call.kwargs['activity_indicator_id'] for call in mock_api.api.direct_v2_indicate_activity.call_args_list]
+    assert activity == [1, 0]
@@ -0,0 +1,45 @@
+import pytest
+from intent_classifier import IntentClassifier
+
+@pytest.fixture
+def classifier():
+    return IntentClassifier()
+
+@pytest.mark.parametrize("message,intent", [
+    ("Hello there", 'greeting'),
+    ("Good morning!", 'greeting'),
+    ("How much does it cost?", 'pricing'),
+    ("What are your prices", 'pricing'),
+    ("How do I reset my password", 'help'),
+    ("I need some support", 'help'),
+    ("What time do you open?", 'unknown'),
+])
+def test_intents(classifier, message, intent):
+    """Test intent detection from the declarative table"""
+    assert classifier.classify(message).intent == intent
+
+def test_no_substring_false_positives(classifier):
+    """Test that 'hi' no longer matches inside other words"""
+    assert classifier.classify("Is this the shop which sells shoes?").intent == 'unknown'
+    assert classifier.classify("Which one is this").intent == 'unknown'
+
+def test_single_pass_result(classifier):
+    """Test that one call yields every field the pipeline needs"""
+    result = classifier.classify("Hi, what are your prices? I need help")
+    assert result.text == "hi, what are your prices? i need help"
+    assert result.intent == 'greeting'
+    assert result.topic == 'pricing'
+    assert result.state == 'awaiting_details'
+    assert result.context_patterns == ('pricing_context', 'help_context')
+    assert result.question_type == 'question'
+
+def test_closing_and_question_types(classifier):
+    """Test conversation state and generic question classification"""
+    closing = classifier.classify("Thank you, bye")
+    assert closing.state == 'closing'
+    assert closing.topic is None
+
+    assert classifier.classify("when do you open").question_type == 'schedule'
+    assert classifier.classify("explain it").question_type == 'explain'
+    assert classifier.classify("where are you").question_type == 'location'
+    assert classifier.classify("ok").question_type is None
@@ -0,0 +1,39 @@
+import urllib.request
+import pytest
+from metrics import Histogram, MetricsRegistry, MetricsServer
+
+def test_histogram_buckets_and_quantile():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.05, 0.5, 5.0):
+        histogram.observe(value)
+    counts, count, total = histogram.snapshot()
+    assert counts == [2, 1, 1]
+    assert count == 4
+    assert total == pytest.approx(5.6)
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(1.0) == float('inf')
+
+def test_stage_timer_records_even_on_error():
+    """Test that a failing stage still gets its time recorded"""
+    metrics = MetricsRegistry()
+    with pytest.raises(ValueError):
+        with metrics.time('send'):
+            raise ValueError("boom")
+    assert metrics.stage('send').count == 1
+    assert 'send n=1' in metrics.summary()
+
+def test_prometheus_endpoint():
+    """Test that /metrics serves stage histograms and counters in text format"""
+    metrics = MetricsRegistry()
+    metrics.observe('inbox_fetch', 0.02)
+    metrics.inc('messages_handled', 3)
+    server = MetricsServer(metrics, port=0, summary_interval=None)
+    try:
+        body = urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=5).read().decode()
+    finally:
+        server.close()
+
+    assert '# TYPE bot_stage_seconds histogram' in body
+    assert 'bot_stage_seconds_bucket{stage="inbox_fetch",le="0.025"} 1' in body
+    assert 'bot_stage_seconds_count{stage="inbox_fetch"} 1' in body
+    assert 'bot_messages_handled_total 3' in body
@@ -0,0 +1,49 @@
+import pytest
+from poll_scheduler import AdaptivePollScheduler
+from rate_limiter import TokenBucket
+
+def test_interval_shrinks_on_activity_and_backs_off_when_idle():
+    """Test that the interval resets on messages and decays up to the max once idle"""
+    scheduler = AdaptivePollScheduler(min_interval=2, max_interval=10, decay=2, active_window=30)
+    scheduler.interval = 10
+
+    assert scheduler.record_poll(3, now=0) == 2
+    # Still inside the active window, so stay fast
+    assert scheduler.record_poll(0, now=20) == 2
+    assert scheduler.record_poll(0, now=30) == 4
+    assert scheduler.record_poll(0, now=40) == 8
+    assert scheduler.record_poll(0, now=50) == 10
+    assert scheduler.stats()['empty_polls'] == 4
+
+def test_delay_respects_rate_limiter():
+    """Test that the poll delay is never below the inbox token spacing"""
+    scheduler = AdaptivePollScheduler(TokenBucket(rate=0.25, capacity=3), min_interval=1, max_interval=10)
+    assert scheduler.record_poll(1, now=0) == 4
+
+def test_first_reply_latency_is_tracked_per_thread():
+    """Test that only the oldest unanswered message of a thread counts towards reply latency"""
+    scheduler = AdaptivePollScheduler(min_interval=5, max_interval=5)
+    scheduler.record_poll(2, now=0)
+    scheduler.message_seen('t1', '100000000')  # 100s, in microseconds
+    scheduler.message_seen('t1', '105000000')
+    scheduler.reply_sent('t1', now=110)
+    scheduler.reply_sent('t1', now=120)  # No inbound message waiting
+
+    stats = scheduler.stats()
+    assert stats['replies'] == 1
+    assert stats['avg_first_reply_seconds'] == pytest.approx(10)
+    assert stats['interval_to_reply_ratio'] == pytest.approx(0.5)
+
+def test_abandoned_reply_is_not_tracked():
+    """Test that a thread whose reply failed stops waiting and does not count as replied"""
+    scheduler = AdaptivePollScheduler(min_interval=5, max_interval=5)
+    scheduler.message_seen('t1', '100000000')
+    scheduler.reply_abandoned('t1')
+    scheduler.reply_sent('t1', now=110)
+
+    assert scheduler.stats()['replies'] == 0
+    assert scheduler._awaiting_reply == {}
+
+def test_invalid_bounds_are_rejected():
+    with pytest.raises(ValueError):
+        AdaptivePollScheduler(min_interval=10, max_interval=5)
@@ -0,0 +1,50 @@
+import asyncio
+import time
+import pytest
+from rate_limiter import EndpointRateLimiter, TokenBucket
+
+def test_burst_then_refill():
+    """Test that a full bucket allows a burst and then refuses without waiting"""
+    bucket = TokenBucket(rate=10, capacity=3)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    assert bucket.stats()['rejected'] == 1
+
+    time.sleep(0.15)
+    assert bucket.try_acquire()
+
+def test_reserve_spaces_future_slots():
+    """Test that reservations past the burst are spaced by the refill interval"""
+    bucket = TokenBucket(rate=2, capacity=2)
+    slots = [bucket.reserve(100.0) for _ in range(4)]
+    assert slots == pytest.approx([100.0, 100.0, 100.5, 101.0])
+
+def test_acquire_waits_and_records_stats():
+    """Test that blocking acquire sleeps for the next token and honours timeouts"""
+    bucket = TokenBucket(rate=20, capacity=1)
+    assert bucket.acquire()
+    start = time.monotonic()
+    assert bucket.acquire()
+    assert time.monotonic() - start >= 0.04
+
+    assert not bucket.acquire(timeout=0.0)
+    stats = bucket.stats()
+    assert stats['acquired'] == 2
+    assert stats['waited'] == 1
+    assert stats['max_wait_seconds'] > 0
+
+def test_async_acquire():
+    bucket = TokenBucket(rate=50, capacity=1)
+
+    async def take_two():
+        return [await bucket.acquire_async(), await bucket.acquire_async()]
+
+    assert asyncio.run(take_two()) == [True, True]
+
+def test_endpoints_have_separate_budgets():
+    """Test that draining one endpoint leaves the others untouched"""
+    limiter = EndpointRateLimiter({'send': (1.0, 1), 'inbox': (1.0, 2)})
+    assert limiter.try_acquire('send')
+    assert not limiter.try_acquire('send')
+    assert limiter.try_acquire('inbox')
+    assert limiter.try_acquire('activity')
+    assert set(limiter.stats()) == {'inbox', 'activity', 'send'}
@@ -0,0 +1,62 @@
+import json
+import random
+import sqlite3
+from response_matcher import ResponseMatcher
+
+ROWS = [
+    (1, "hello", "Hey there!", None, 0, 0.0),
+    (2, "hi", "Hi!", None, 5, 0.5),
+    (3, "price", "Pricing info", None, 2, 1.0),
+    (4, "price list", "Here is the list", None, 2, 0.0),
+    (5, "help", "Support reply", json.dumps({'topic': 'support'}), 9, 1.0),
+]
+
+def test_ranks_like_sql_order_by():
+    """Test that the most used matching pattern wins"""
+    matcher = ResponseMatcher(ROWS)
+    assert matcher.match("hi, what's the price list?") == ("Hi!", 2)
+    assert matcher.match("price list please") == ("Pricing info", 3)
+    assert matcher.match("good evening") is None
+
+def test_context_filter():
+    """Test that context-bound patterns only match for that context"""
+    matcher = ResponseMatcher(ROWS)
+    assert matcher.match("help me", json.dumps({})) is None
+    assert matcher.match("help me", json.dumps({'topic': 'support'})) == ("Support reply", 5)
+
+def test_incremental_add_and_usage():
+    """Test learned patterns and stats updates without a rebuild"""
+    matcher = ResponseMatcher(ROWS)
+    matcher.add(6, "when do you open", "Let me check the hours")
+    assert matcher.match("so when do you open?") == ("Let me check the hours", 6)
+
+    matcher.record_usage(6, True)
+    matcher.add(7, "open", "We open at nine")
+    assert matcher.match("when do you open") == ("Let me check the hours", 6)
+
+def test_matches_sqlite_like_on_random_patterns():
+    """Test that results agree with the SQL LIKE query they replace"""
+    rng = random.Random(7)
+    alphabet = "abc "
+    rows = []
+    for response_id in range(1, 200):
+        pattern = ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 4)))
+        rows.append((response_id, pattern, f"r{response_id}", None, rng.randint(0, 3), rng.choice([0.0, 0.5, 1.0])))
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""
+        CREATE TABLE responses (id INTEGER PRIMARY KEY, pattern TEXT, response TEXT,
+                                context TEXT, usage_count INTEGER, success_rate FLOAT)
+    """)
+    conn.executemany("INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?)", rows)
+    matcher = ResponseMatcher(rows)
+
+    for _ in range(200):
+        message = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+        expected = conn.execute("""
+            SELECT response, id FROM responses
+            WHERE ? LIKE '%' || pattern || '%'
+            ORDER BY usage_count DESC, success_rate DESC, id
+            LIMIT 1
+        """, (message,)).fetchone()
+        assert matcher.match(message) == expected
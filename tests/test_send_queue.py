@@ -0,0 +1,57 @@
+from intent_classifier import IntentClassifier
+from send_queue import PriorityOutbox, SendPolicy, sla_class
+
+POLICIES = {
+    'greeting': SendPolicy(30.0, 600.0, False),
+    'closing': SendPolicy(600.0, 900.0, True)
+}
+
+def test_older_message_goes_first():
+    outbox = PriorityOutbox()
+    outbox.push('new', 'pricing', age=0.0, now=100.0)
+    outbox.push('old', 'pricing', age=50.0, now=100.0)
+    assert [outbox.pop().item for _ in range(2)] == ['old', 'new']
+    assert outbox.pop() is None
+
+def test_greeting_outranks_closing_of_the_same_age():
+    outbox = PriorityOutbox(POLICIES)
+    outbox.push('bye', 'closing', now=0.0)
+    outbox.push('hello', 'greeting', now=0.0)
+    outbox.push('other', 'unknown', now=0.0)
+    assert [outbox.pop().item for _ in range(3)] == ['hello', 'other', 'bye']
+
+def test_stale_replies_are_dropped_or_downgraded():
+    outbox = PriorityOutbox(POLICIES)
+    outbox.push('late bye', 'closing', age=1000.0, now=0.0)
+    outbox.push('late hello', 'greeting', age=700.0, now=0.0)
+    outbox.push('fresh', 'unknown', age=0.0, now=0.0)
+
+    dropped, downgraded = outbox.expire(now=0.0)
+    assert [entry.item for entry in dropped] == ['late bye']
+    assert [entry.item for entry in downgraded] == ['late hello']
+    assert len(outbox) == 2
+    # The downgraded reply has the earlier deadline but waits behind the fresh one
+    assert outbox.peek().item == 'fresh'
+    assert [outbox.pop().item for _ in range(2)] == ['fresh', 'late hello']
+
+    stats = outbox.stats()
+    assert (stats['dropped'], stats['downgraded'], stats['released']) == (1, 1, 2)
+
+def test_sla_misses_are_counted():
+    outbox = PriorityOutbox(POLICIES)
+    on_time = outbox.push('a', 'greeting', now=0.0)
+    late = outbox.push('b', 'greeting', age=20.0, now=0.0)
+    assert not outbox.record_sent(on_time, sent_at=15.0)
+    assert outbox.record_sent(late, sent_at=15.0)
+    assert outbox.stats()['sla_miss_rate'] == 0.5
+
+def test_unknown_class_uses_the_default_policy():
+    outbox = PriorityOutbox()
+    entry = outbox.push('x', 'no-such-class', now=0.0)
+    assert entry.deadline == outbox.policies['unknown'].sla
+
+def test_closing_messages_get_the_closing_class():
+    classifier = IntentClassifier()
+    assert sla_class(classifier.classify("thanks, bye")) == 'closing'
+    assert sla_class(classifier.classify("how much does it cost?")) == 'pricing'
+    assert sla_class(classifier.classify("hello")) == 'greeting'
@@ -0,0 +1,67 @@
+import time
+import pytest
+from send_scheduler import SendScheduler
+
+@pytest.fixture
+def scheduler():
+    scheduler = SendScheduler()
+    yield scheduler
+    scheduler.close(timeout=5)
+
+def test_events_run_in_due_order(scheduler):
+    """Test that events fire by due time, not by scheduling order"""
+    order = []
+    now = time.monotonic()
+    scheduler.call_at(now + 0.15, lambda: order.append('send'))
+    scheduler.call_at(now + 0.05, lambda: order.append('typing_on'))
+    scheduler.call_at(now + 0.25, lambda: order.append('typing_off'))
+
+    assert scheduler.wait_idle(timeout=5)
+    assert order == ['typing_on', 'send', 'typing_off']
+
+def test_chained_events_and_failures(scheduler):
+    """Test that callbacks can schedule follow-ups and errors do not stop the dispatcher"""
+    order = []
+
+    def first():
+        order.append('first')
+        scheduler.call_later(0.01, lambda: order.append('second'))
+
+    def broken():
+        raise ValueError("boom")
+
+    scheduler.call_later(0.0, broken)
+    scheduler.call_later(0.01, first)
+
+    assert scheduler.wait_idle(timeout=5)
+    assert order == ['first', 'second']
+    assert scheduler.stats()['failed'] == 1
+
+def test_many_delays_in_flight(scheduler):
+    """Test that overlapping delays do not add up"""
+    fired = []
+    start = time.monotonic()
+    for _ in range(50):
+        scheduler.call_later(0.2, lambda: fired.append(time.monotonic()))
+
+    assert scheduler.wait_idle(timeout=5)
+    assert len(fired) == 50
+    assert max(fired) - start < 1.0
+
+def test_slow_blocking_step_does_not_hold_up_others(scheduler):
+    """Test that a hung API call on the executor leaves the timer and other calls running"""
+    import threading
+    release = threading.Event()
+    fired = []
+    start = time.monotonic()
+    scheduler.call_later(0.0, release.wait, blocking=True)
+    scheduler.call_later(0.05, lambda: fired.append(time.monotonic() - start), blocking=True)
+    scheduler.call_later(0.05, lambda: fired.append(time.monotonic() - start))
+
+    time.sleep(0.3)
+    assert len(fired) == 2
+    assert max(fired) < 0.25
+    assert not scheduler.wait_idle(timeout=0.05)  # The hung call still counts as pending
+    release.set()
+    assert scheduler.wait_idle(timeout=5)
+    assert scheduler.stats()['in_executor'] == 0
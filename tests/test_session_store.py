@@ -0,0 +1,97 @@
+import os
+import stat
+import pytest
+from session_store import SessionStore, open_client
+
+class SessionExpired(Exception):
+    pass
+
+class RecordingFactory:
+    """Client factory that counts logins and restores sessions it issued"""
+
+    def __init__(self):
+        self.logins = 0
+        self.restores = 0
+        self.valid_sessions = set()
+
+    def __call__(self, username, password, settings=None):
+        class Client:
+            pass
+
+        client = Client()
+        if settings is not None:
+            if settings['session_id'] not in self.valid_sessions:
+                raise SessionExpired("cookie expired")
+            self.restores += 1
+            client.settings = settings
+        else:
+            self.logins += 1
+            session_id = f"session-{self.logins}"
+            self.valid_sessions.add(session_id)
+            client.settings = {'session_id': session_id, 'cookie': b'\x00\x01binary'}
+        return client
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(str(tmp_path / "bot.session.json"))
+
+def test_second_start_reuses_the_session(store):
+    factory = RecordingFactory()
+    _, reused, _ = open_client(factory, 'user', 'pw', store, rejected=(SessionExpired,))
+    assert not reused
+    client, reused, seconds = open_client(factory, 'user', 'pw', store, rejected=(SessionExpired,))
+    assert reused
+    assert seconds >= 0
+    assert factory.logins == 1
+    assert factory.restores == 1
+    assert client.settings['cookie'] == b'\x00\x01binary'
+
+def test_rejected_session_falls_back_to_login(store):
+    factory = RecordingFactory()
+    open_client(factory, 'user', 'pw', store, rejected=(SessionExpired,))
+    factory.valid_sessions.clear()
+
+    client, reused, _ = open_client(factory, 'user', 'pw', store, rejected=(SessionExpired,))
+    assert not reused
+    assert factory.logins == 2
+    assert store.load()['session_id'] == client.settings['session_id'] == "session-2"
+
+def test_failed_validation_counts_as_rejection(store):
+    factory = RecordingFactory()
+    open_client(factory, 'user', 'pw', store, rejected=(SessionExpired,))
+
+    def validate(client):
+        raise SessionExpired("login required")
+
+    _, reused, _ = open_client(factory, 'user', 'pw', store, validate=validate, rejected=(SessionExpired,))
+    assert not reused
+    assert factory.logins == 2
+
+def test_other_errors_are_not_treated_as_rejection(store):
+    factory = RecordingFactory()
+    open_client(factory, 'user', 'pw', store, rejected=(SessionExpired,))
+
+    def validate(client):
+        raise ConnectionError("network down")
+
+    with pytest.raises(ConnectionError):
+        open_client(factory, 'user', 'pw', store, validate=validate, rejected=(SessionExpired,))
+    assert store.load() is not None  # Still valid once the network is back
+
+def test_cache_file_is_private_and_survives_corruption(store):
+    store.save({'cookie': b'secret'})
+    assert stat.S_IMODE(os.stat(store.path).st_mode) == 0o600
+    assert store.load() == {'cookie': b'secret'}
+
+    with open(store.path, 'w') as f:
+        f.write("{not json")
+    assert store.load() is None
+    store.clear()
+    store.clear()
+    assert not os.path.exists(store.path)
+
+def test_without_store_every_start_logs_in():
+    factory = RecordingFactory()
+    open_client(factory, 'user', 'pw')
+    open_client(factory, 'user', 'pw')
+    assert factory.logins == 2
@@ -0,0 +1,31 @@
+from database_handler import DatabaseHandler
+from human_response_generator import HumanResponseGenerator
+from startup_profile import StartupProfile, profile
+
+def test_phases_nest_and_report():
+    startup = StartupProfile()
+    with startup.phase('ignored'):
+        pass
+    assert startup.phases == []
+
+    startup.enable()
+    with startup.phase('outer'):
+        with startup.phase('inner'):
+            pass
+    assert [(depth, name) for depth, name, _ in startup.phases] == [(0, 'outer'), (1, 'inner')]
+    assert startup.phases[0][2] >= startup.phases[1][2]
+    report = startup.report()
+    assert '  outer' in report and '    inner' in report and 'total' in report
+
+def test_database_startup_is_profiled_and_shares_the_generator():
+    generator = HumanResponseGenerator()
+    profile.enable()
+    try:
+        handler = DatabaseHandler(db_path=":memory:", human_generator=generator)
+        handler.matcher
+    finally:
+        profile.enabled = False
+    names = [name for _, name, _ in profile.phases]
+    assert {'open connection', 'schema', 'response index'} <= set(names)
+    assert handler.human_generator is generator
+    handler.close()
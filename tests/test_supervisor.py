@@ -0,0 +1,49 @@
+import json
+import os
+import time
+import pytest
+from supervisor import Supervisor, load_config
+
+def crash(account, status):
+    os._exit(3)
+
+def beat_and_wait(account, status):
+    status.put({'name': account['name'], 'pid': os.getpid(), 'time': time.time(), 'handled': 7, 'sends': 7})
+    time.sleep(30)
+
+def wait_until(condition, supervisor, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        supervisor.poll()
+        time.sleep(0.05)
+
+def test_crashed_worker_restarts_with_backoff():
+    """Test that a crash loop backs off exponentially"""
+    supervisor = Supervisor([{'name': 'a'}], target=crash, initial_backoff=0.1, max_backoff=0.4)
+    try:
+        worker = supervisor.workers['a']
+        wait_until(lambda: worker.restarts >= 3, supervisor)
+        assert worker.last_exit == 3
+        assert worker.restarts >= 3
+        assert [supervisor.backoff(n) for n in (1, 2, 3, 4)] == [0.1, 0.2, 0.4, 0.4]
+    finally:
+        supervisor.stop(timeout=5)
+
+def test_health_aggregates_heartbeats():
+    """Test that heartbeats from every worker add up"""
+    supervisor = Supervisor([{'name': 'a'}, {'name': 'b'}], target=beat_and_wait)
+    try:
+        wait_until(lambda: supervisor.health()['handled'] == 14, supervisor)
+        health = supervisor.health()
+        assert health['workers_alive'] == 2
+        assert all(account['healthy'] for account in health['accounts'].values())
+        assert '2/2 alive' in supervisor.summary()
+    finally:
+        supervisor.stop(timeout=5)
+    assert supervisor.health()['workers_alive'] == 0
+
+def test_config_needs_unique_names(tmp_path):
+    path = tmp_path / "accounts.json"
+    path.write_text(json.dumps({'accounts': [{'name': 'a'}, {'name': 'a'}]}))
+    with pytest.raises(ValueError):
+        load_config(str(path))
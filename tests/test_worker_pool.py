@@ -0,0 +1,62 @@
+import threading
+import time
+from worker_pool import ShardedWorkerPool
+
+def test_same_key_keeps_order():
+    """Test that items for one thread are handled in submission order"""
+    handled = []
+    pool = ShardedWorkerPool(lambda item: handled.append(item), num_workers=4)
+    for i in range(20):
+        pool.submit('thread_a', ('thread_a', i))
+    pool.join()
+    pool.shutdown()
+
+    assert [i for _, i in handled] == list(range(20))
+
+def test_different_keys_run_in_parallel():
+    """Test that a slow conversation does not hold up the others"""
+    started = threading.Event()
+    release = threading.Event()
+    handled = []
+
+    def handler(item):
+        if item == 'slow':
+            started.set()
+            release.wait(5)
+        handled.append(item)
+
+    pool = ShardedWorkerPool(handler, num_workers=2)
+    slow_key = 'a'
+    fast_key = next(k for k in 'bcdefgh' if pool.shard(k) != pool.shard(slow_key))
+    pool.submit(slow_key, 'slow')
+    started.wait(5)
+    pool.submit(fast_key, 'fast')
+
+    deadline = time.monotonic() + 5
+    while 'fast' not in handled and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert handled == ['fast']
+
+    release.set()
+    pool.shutdown()
+    assert handled == ['fast', 'slow']
+
+def test_backpressure_and_errors():
+    """Test bounded queues and that handler errors are counted"""
+    release = threading.Event()
+
+    def handler(item):
+        release.wait(5)
+        if item == 'bad':
+            raise ValueError(item)
+
+    pool = ShardedWorkerPool(handler, num_workers=1, queue_size=1)
+    pool.submit('t', 'bad')
+    pool.submit('t', 'queued', timeout=1)
+    assert pool.submit('t', 'overflow', timeout=0.05) is False
+
+    release.set()
+    pool.shutdown()
+    stats = pool.stats()
+    assert stats['processed'] == 1
+    assert stats['failed'] == 1
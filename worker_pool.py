@@ -0,0 +1,83 @@
+import queue
+from threading import Lock, Thread
+from typing import Any, Callable, Hashable, List, Optional
+
+_STOP = object()
+
+class ShardedWorkerPool:
+    """Fixed set of workers, each draining its own bounded queue.
+
+    Items submitted with the same key always land on the same worker, so they
+    are handled in submission order, while different keys run in parallel.
+    A full queue blocks the submitter, which is the pool's backpressure.
+    """
+
+    def __init__(self, handler: Callable[[Any], None], num_workers: int = 4, queue_size: int = 100,
+                 name: str = "worker"):
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+        self.handler = handler
+        self.num_workers = num_workers
+        self._queues: List[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in range(num_workers)]
+        self._lock = Lock()
+        self._closed = False
+        self.processed = 0
+        self.failed = 0
+        self._threads = [
+            Thread(target=self._work, args=(q,), name=f"{name}-{i}", daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def shard(self, key: Hashable) -> int:
+        return hash(key) % self.num_workers
+
+    def submit(self, key: Hashable, item: Any, timeout: Optional[float] = None) -> bool:
+        """Queue an item on its key's worker; returns False if the queue stayed full past timeout"""
+        if self._closed:
+            raise RuntimeError("Worker pool is shut down")
+        try:
+            self._queues[self.shard(key)].put(item, timeout=timeout)
+            return True
+        except queue.Full:
+            return False
+
+    def join(self):
+        """Block until every submitted item has been handled"""
+        for q in self._queues:
+            q.join()
+
+    def _work(self, q: queue.Queue):
+        while True:
+            item = q.get()
+            try:
+                if item is _STOP:
+                    return
+                self.handler(item)
+                with self._lock:
+                    self.processed += 1
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                print(f"Error handling message: {str(e)}")
+            finally:
+                q.task_done()
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting work; with wait=True drain the queues before returning"""
+        self._closed = True
+        for q in self._queues:
+            q.put(_STOP)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'workers': self.num_workers,
+                'queue_depths': [q.qsize() for q in self._queues],
+                'processed': self.processed,
+                'failed': self.failed
+            }